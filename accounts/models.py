@@ -1,5 +1,9 @@
+import secrets
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Upper
+from core.indexes import PrefixIndex
 
 
 class User(AbstractUser):
@@ -9,6 +13,9 @@ class User(AbstractUser):
     bio = models.TextField(max_length=500, blank=True, help_text="Tell us about yourself")
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
     
+    # Secret part of the user's iCalendar feed URL; reset to revoke old links
+    calendar_token = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -17,6 +24,13 @@ class User(AbstractUser):
         verbose_name = 'User'
         verbose_name_plural = 'Users'
         ordering = ['-created_at']
+        # Serve member autocomplete (istartswith) lookups
+        indexes = [
+            PrefixIndex(Upper('username'), name='user_username_prefix_idx'),
+            PrefixIndex(Upper('first_name'), name='user_first_name_prefix_idx'),
+            PrefixIndex(Upper('last_name'), name='user_last_name_prefix_idx'),
+            PrefixIndex(Upper('email'), name='user_email_prefix_idx'),
+        ]
     
     def __str__(self):
         return self.username
@@ -25,4 +39,10 @@ class User(AbstractUser):
         """Return user's full name or username as fallback"""
         if self.first_name and self.last_name:
             return f"{self.first_name} {self.last_name}"
-        return self.username
\ No newline at end of file
+        return self.username
+    
+    def reset_calendar_token(self):
+        """Give the user a new calendar feed URL, invalidating the old one"""
+        self.calendar_token = secrets.token_urlsafe(32)
+        self.save(update_fields=['calendar_token'])
+        return self.calendar_token
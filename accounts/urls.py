@@ -6,4 +6,5 @@ app_name = 'accounts'
 urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
+    path('profile/calendar-feed/', views.reset_calendar_feed, name='reset_calendar_feed'),
 ]
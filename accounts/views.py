@@ -1,29 +1,44 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.views.decorators.http import require_POST
 from .forms import UserProfileForm
 from .models import User
+from core.concurrency import gather_queries
+from core.sharding import fan_out
 
 
 @login_required
-def profile(request):
+async def profile(request):
     """View user profile"""
-    user = request.user
+    user = await request.auser()
     
     # Get user statistics
     from workspaces.models import Workspace
     from tasks.models import Task
     from django.db.models import Q
     
-    owned_workspaces = Workspace.objects.filter(owner=user).count()
-    member_workspaces = Workspace.objects.filter(members=user).count()
+    def count_on_all_shards(queryset):
+        return lambda: sum(fan_out(queryset.count))
     
-    created_tasks = Task.objects.filter(created_by=user).count()
-    assigned_tasks = Task.objects.filter(assigned_to=user).count()
-    completed_tasks = Task.objects.filter(
-        Q(created_by=user) | Q(assigned_to=user),
-        status=Task.STATUS_DONE
-    ).distinct().count()
+    # Each statistic is an independent COUNT, so run them concurrently
+    (
+        owned_workspaces,
+        member_workspaces,
+        created_tasks,
+        assigned_tasks,
+        completed_tasks,
+    ) = await gather_queries(
+        count_on_all_shards(Workspace.objects.filter(owner=user)),
+        count_on_all_shards(Workspace.objects.filter(members=user).exclude(owner=user)),
+        count_on_all_shards(Task.objects.filter(created_by=user)),
+        count_on_all_shards(Task.objects.filter(assigned_to=user)),
+        count_on_all_shards(Task.objects.filter(
+            Q(created_by=user) | Q(assigned_to=user),
+            status=Task.STATUS_DONE
+        )),
+    )
     
     context = {
         'profile_user': user,
@@ -34,7 +49,7 @@ def profile(request):
         'completed_tasks': completed_tasks,
     }
     
-    return render(request, 'account/profile.html', context)
+    return await sync_to_async(render)(request, 'account/profile.html', context)
 
 
 @login_required
@@ -49,4 +64,17 @@ def edit_profile(request):
     else:
         form = UserProfileForm(instance=request.user)
     
-    return render(request, 'account/edit_profile.html', {'form': form})
\ No newline at end of file
+    return render(request, 'account/edit_profile.html', {'form': form})
+
+
+@login_required
+@require_POST
+def reset_calendar_feed(request):
+    """Create the user's calendar feed link, or replace it so the old one stops working"""
+    had_feed = bool(request.user.calendar_token)
+    request.user.reset_calendar_token()
+    if had_feed:
+        messages.success(request, 'Your calendar feed has a new link. Update it in your calendar apps.')
+    else:
+        messages.success(request, 'Your calendar feed is ready. Add the link to your calendar app.')
+    return redirect('core:my_calendar')
@@ -29,9 +29,9 @@ environ.Env.read_env( env_file=BASE_DIR / '.env' )
 SECRET_KEY = env("SECRET_KEY")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = env.bool("DEBUG", default=True)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = env.list("ALLOWED_HOSTS", default=[])
 
 
 # Application definition
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django.contrib.sites',
+    'django.contrib.postgres',
     'allauth',
     'allauth.account',
     'allauth.socialaccount',
@@ -57,7 +58,10 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.StaticFilesMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -65,6 +69,9 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
+    'core.middleware.RateLimitMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
+    'core.middleware.ShardRoutingMiddleware',
 ]
 
 AUTHENTICATION_BACKENDS = [
@@ -89,6 +96,19 @@ TEMPLATES = [
     },
 ]
 
+# Production profile: keep compiled templates in memory for the worker's lifetime
+if not DEBUG:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
+# Precompile templates and populate URL patterns before a worker takes traffic
+WARMUP_ON_STARTUP = env.bool("WARMUP_ON_STARTUP", default=not DEBUG)
+
 SOCIALACCOUNT_PROVIDERS = {
     'google': {
         'SCOPE': ['profile', 'email'],
@@ -116,6 +136,124 @@ DATABASES = {
     }
 }
 
+# DATABASE_URL overrides the settings above, e.g. sqlite:////tmp/primary.sqlite3
+if env("DATABASE_URL", default=""):
+    DATABASES['default'] = env.db("DATABASE_URL")
+
+# Read replicas - comma separated database URLs, exposed as replica_1, replica_2, ...
+for index, replica_url in enumerate(env.list("DATABASE_REPLICA_URLS", default=[]), start=1):
+    DATABASES[f'replica_{index}'] = env.db_url_config(replica_url)
+    DATABASES[f'replica_{index}']['TEST'] = {'MIRROR': 'default'}
+
+# Workspace shards - comma separated database URLs, exposed as shard_1, shard_2, ...
+# The default database is always a shard too and keeps all global tables.
+for index, shard_url in enumerate(env.list("DATABASE_SHARD_URLS", default=[]), start=1):
+    DATABASES[f'shard_{index}'] = env.db_url_config(shard_url)
+
+WORKSPACE_SHARDS = [alias for alias in DATABASES if alias == 'default' or alias.startswith('shard_')]
+
+# Global ids are reserved from the default database this many at a time per process
+SHARD_ID_BLOCK_SIZE = env.int("SHARD_ID_BLOCK_SIZE", default=100)
+
+DATABASE_ROUTERS = [
+    'core.db_router.WorkspaceShardRouter',
+    'core.db_router.PrimaryReplicaRouter',
+]
+
+# Views whose reads may be served by a replica
+READ_REPLICA_VIEWS = [
+    'core:dashboard',
+    'core:my_tasks',
+    'core:search',
+    'tasks:list',
+    'accounts:profile',
+]
+
+# After a write, keep the user's reads on the primary for this many seconds
+READ_REPLICA_STICKY_SECONDS = env.int("READ_REPLICA_STICKY_SECONDS", default=10)
+READ_REPLICA_PIN_COOKIE = 'primary_pin'
+
+# Response compression - bodies below this size (bytes) are sent as-is
+COMPRESSION_MIN_SIZE = env.int("COMPRESSION_MIN_SIZE", default=512)
+# Strip indentation and blank lines from rendered HTML before compressing
+HTML_MINIFY = env.bool("HTML_MINIFY", default=False)
+
+# Cache shared by all workers in production, e.g. redis://127.0.0.1:6379/1
+CACHES = {
+    'default': env.cache("CACHE_URL", default="locmemcache://"),
+}
+
+# Member autocomplete - max results per lookup and how long result sets are cached
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_CACHE_TIMEOUT = 60
+
+# Rate limits per view: token buckets per user, per client IP and for the
+# whole route, as "requests/period" (s, m, h, d; e.g. "10/15s")
+RATE_LIMIT_ENABLED = env.bool("RATE_LIMIT_ENABLED", default=True)
+RATE_LIMITS = {
+    'tasks:toggle_status': {'user': '20/10s', 'ip': '60/m', 'route': '3000/m'},
+    'tasks:add_comment': {'user': '10/m', 'ip': '30/m', 'route': '1200/m'},
+    'workspaces:add_member': {'user': '20/m', 'ip': '40/m'},
+}
+
+# Optional reads refused with 503 while the average query is slower than this
+LOAD_SHED_VIEWS = ['core:search', 'core:dashboard']
+LOAD_SHED_LATENCY_MS = env.int("LOAD_SHED_LATENCY_MS", default=250)
+
+# Recurring tasks are created as real tasks this many days ahead
+RECURRENCE_HORIZON_DAYS = env.int("RECURRENCE_HORIZON_DAYS", default=14)
+
+# Open tasks due within this many days get a due-soon reminder (remind_tasks);
+# reminders are mailed as per-user digests, REMINDER_BATCH_SIZE rows at a time
+REMINDER_DUE_SOON_DAYS = env.int("REMINDER_DUE_SOON_DAYS", default=1)
+REMINDER_BATCH_SIZE = env.int("REMINDER_BATCH_SIZE", default=200)
+# A reminder whose digest fails to send this many times is marked failed
+REMINDER_MAX_ATTEMPTS = env.int("REMINDER_MAX_ATTEMPTS", default=5)
+
+# iCalendar feeds leave out tasks due longer ago than this; rendered events
+# are cached per task version for CALENDAR_FEED_CACHE_TIMEOUT seconds
+CALENDAR_FEED_PAST_DAYS = env.int("CALENDAR_FEED_PAST_DAYS", default=90)
+CALENDAR_FEED_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# Outbound webhooks (deliver_webhooks worker). Failed batches are retried
+# after BASE, 2*BASE, 4*BASE... seconds (at most MAX) and dead-lettered
+# after WEBHOOK_MAX_ATTEMPTS tries. WEBHOOK_WORKERS webhooks are sent to in
+# parallel, over a connection pool of the same size.
+WEBHOOK_TIMEOUT = env.float("WEBHOOK_TIMEOUT", default=5)
+WEBHOOK_BATCH_SIZE = env.int("WEBHOOK_BATCH_SIZE", default=100)
+WEBHOOK_WORKERS = env.int("WEBHOOK_WORKERS", default=8)
+WEBHOOK_MAX_ATTEMPTS = env.int("WEBHOOK_MAX_ATTEMPTS", default=8)
+WEBHOOK_RETRY_BASE_SECONDS = 30
+WEBHOOK_RETRY_MAX_SECONDS = 60 * 60
+WEBHOOK_RETENTION_DAYS = env.int("WEBHOOK_RETENTION_DAYS", default=7)
+WEBHOOK_SUBSCRIPTIONS_CACHE_TIMEOUT = 300
+# Webhook URLs must resolve to public addresses, so they can't reach
+# internal services; allow private ones only to test against a local receiver
+WEBHOOK_ALLOW_PRIVATE_URLS = env.bool("WEBHOOK_ALLOW_PRIVATE_URLS", default=False)
+
+# Delta sync (/workspaces/sync/). Change log entries are kept for
+# SYNC_RETENTION_DAYS (purge_changes); older tokens get 410 and a full
+# resync. Positions only move past entries older than SYNC_SETTLE_SECONDS,
+# so transactions that commit out of order aren't skipped.
+SYNC_PAGE_SIZE = env.int("SYNC_PAGE_SIZE", default=500)
+SYNC_RETENTION_DAYS = env.int("SYNC_RETENTION_DAYS", default=30)
+SYNC_SETTLE_SECONDS = env.int("SYNC_SETTLE_SECONDS", default=10)
+
+# Prometheus metrics at /metrics. Scrapers send METRICS_TOKEN as a bearer
+# token; without a token the endpoint is off (404). METRICS_ALLOWED_IPS, if
+# set, also limits the client address; behind a reverse proxy every request
+# comes from the proxy, so it is no protection there. With several worker
+# processes set METRICS_DIR to a directory they share (cleared on restart)
+# and each writes its metrics there every METRICS_FLUSH_INTERVAL seconds.
+METRICS_ENABLED = env.bool("METRICS_ENABLED", default=True)
+METRICS_TOKEN = env("METRICS_TOKEN", default="")
+METRICS_ALLOWED_IPS = env.list("METRICS_ALLOWED_IPS", default=[])
+METRICS_DIR = env("METRICS_DIR", default="")
+METRICS_FLUSH_INTERVAL = env.float("METRICS_FLUSH_INTERVAL", default=5)
+
+# Thread pool used by async views to run independent queries concurrently
+ASYNC_QUERY_WORKERS = env.int("ASYNC_QUERY_WORKERS", default=8)
+
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -151,6 +289,16 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'static'] 
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic fingerprints and precompresses assets; StaticFilesMiddleware serves them
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'core.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
 # Allauth Settings
 ACCOUNT_LOGIN_METHODS = {"username", "email"}
 ACCOUNT_SIGNUP_FIELDS = [
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+from core.warmup import warm_up_on_startup  # noqa: E402 - needs configured settings
+
+warm_up_on_startup()
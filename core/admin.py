@@ -1,3 +1,41 @@
 from django.contrib import admin
+from .models import CloneJob, DeletionJob, WorkspaceShard
 
-# Register your models here.
+
+@admin.register(DeletionJob)
+class DeletionJobAdmin(admin.ModelAdmin):
+    """Read-only progress view of background deletions"""
+    
+    list_display = ['target_name', 'target_type', 'comments_deleted', 'tasks_deleted',
+                    'members_deleted', 'created_at', 'finished_at']
+    list_filter = ['target_type', 'finished_at']
+    readonly_fields = [field.name for field in DeletionJob._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(CloneJob)
+class CloneJobAdmin(admin.ModelAdmin):
+    """Read-only progress view of workspace copies"""
+    
+    list_display = ['name', 'source_name', 'as_template', 'tasks_copied', 'tasks_total',
+                    'comments_copied', 'created_at', 'finished_at']
+    list_filter = ['as_template', 'finished_at']
+    readonly_fields = [field.name for field in CloneJob._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(WorkspaceShard)
+class WorkspaceShardAdmin(admin.ModelAdmin):
+    """Shard directory; entries change through the move_workspace command"""
+    
+    list_display = ['workspace_id', 'alias', 'state', 'updated_at']
+    list_filter = ['alias', 'state']
+    search_fields = ['workspace_id']
+    readonly_fields = [field.name for field in WorkspaceShard._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False
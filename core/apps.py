@@ -1,5 +1,17 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .metrics import install_query_recorder, record_compression
+        from .sharding import assign_global_id
+        from .signals import response_compressed
+        from .throttling import install_latency_monitor
+        connection_created.connect(install_latency_monitor)
+        connection_created.connect(install_query_recorder)
+        response_compressed.connect(record_compression)
+        pre_save.connect(assign_global_id)
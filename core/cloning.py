@@ -0,0 +1,312 @@
+"""
+Copying a workspace into a new one: duplicates and templates.
+
+Rows are copied in chunks with bulk_create, never saved one by one, into
+a new workspace that stays hidden (deleted_at set, like the target of a
+shard move) until everything is in. Old ids are mapped to new ones as
+each chunk is inserted, so subtasks, dependencies, labels and comments
+point at the copies. The clone_workspaces worker runs the jobs; if one
+dies halfway, the next run throws its copy away and starts over.
+"""
+import logging
+import re
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from tasks.models import Task, Comment, TaskDependency, Label, TaskLabel
+from tasks.richtext import TASK_REF_RE, render_rich_text
+from workspaces.models import Workspace, WorkspaceMembership
+from .deletion import schedule_deletion
+from .models import CloneJob
+from .sharding import assign_ids, shard_for_workspace
+
+logger = logging.getLogger(__name__)
+
+LEASE_DURATION = timedelta(minutes=5)
+
+CODE_SPAN_RE = re.compile(r'(`[^`\n]+`)')
+
+
+class CloneError(Exception):
+    """The job can't run, e.g. its source workspace is gone"""
+
+
+def schedule_clone(workspace, user, name, as_template=False, start_date=None,
+                   with_comments=False, with_labels=False, with_assignments=False):
+    """Queue a copy of ``workspace`` owned by ``user``; the worker does the rest"""
+    return CloneJob.objects.create(
+        source_workspace_id=workspace.pk,
+        source_name=workspace.name,
+        name=name,
+        as_template=as_template,
+        start_date=start_date,
+        with_comments=with_comments,
+        with_labels=with_labels,
+        with_assignments=with_assignments,
+        requested_by=user,
+    )
+
+
+def claim_job(job):
+    """Take the job's lease; return False if another worker holds it"""
+    now = timezone.now()
+    claimed = CloneJob.objects.filter(
+        pk=job.pk, finished_at__isnull=True,
+    ).exclude(
+        lease_expires_at__gt=now,
+    ).update(
+        lease_expires_at=now + LEASE_DURATION,
+    )
+    return claimed == 1
+
+
+def record_progress(job, **counts):
+    CloneJob.objects.filter(pk=job.pk).update(
+        **{field: F(field) + count for field, count in counts.items()},
+        lease_expires_at=timezone.now() + LEASE_DURATION,
+    )
+
+
+def chunks(queryset, fields, batch_size):
+    """Rows of ``queryset`` as dicts of ``fields``, batch_size at a time in primary key order"""
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk).order_by('pk').values('pk', *fields)[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last_pk = rows[-1]['pk']
+
+
+def has_task_links(obj):
+    return bool(TASK_REF_RE.search(getattr(obj, obj.rich_text[0])))
+
+
+def relink_tasks(objects, task_ids, target):
+    """Point #task links in copied texts at the copies, and render them again"""
+    for obj in objects:
+        source = obj.rich_text[0]
+        # Odd parts are code spans, which are left as written
+        parts = CODE_SPAN_RE.split(getattr(obj, source))
+        parts[::2] = [
+            TASK_REF_RE.sub(lambda match: f'#{task_ids.get(int(match.group(1)), match.group(1))}', part)
+            for part in parts[::2]
+        ]
+        setattr(obj, source, ''.join(parts))
+    # The copies' workspace is still hidden, so live tasks wouldn't include them
+    render_rich_text(objects, target._state.db, tasks=Task.all_objects.filter(workspace_id=target.pk))
+
+
+# Steps
+
+def start_copy(job):
+    """Create the hidden workspace the rows are copied into; return (source, target)"""
+    if job.target_workspace_id is not None:
+        # A previous run died halfway; its copy goes to the reaper
+        leftover = Workspace.all_objects.using(shard_for_workspace(job.target_workspace_id)).filter(
+            pk=job.target_workspace_id,
+        ).first()
+        if leftover is not None:
+            schedule_deletion(leftover)
+
+    source = Workspace.objects.using(shard_for_workspace(job.source_workspace_id)).filter(
+        pk=job.source_workspace_id,
+    ).first()
+    if source is None:
+        raise CloneError('The source workspace no longer exists')
+
+    target = Workspace(
+        name=job.name,
+        description=source.description,
+        owner_id=job.requested_by_id,
+        archive_after_days=source.archive_after_days,
+        is_template=job.as_template,
+        deleted_at=timezone.now(),
+    )
+    target.save()
+    job.target_workspace_id = target.pk
+    CloneJob.objects.filter(pk=job.pk).update(
+        target_workspace_id=target.pk,
+        tasks_total=Task.objects.using(source._state.db).filter(workspace=source).count(),
+        tasks_copied=0,
+        comments_copied=0,
+        started_at=timezone.now(),
+    )
+    return source, target
+
+
+def due_date_shift(source, start_date):
+    """How far to move due dates so the earliest falls on ``start_date`` (None: keep them)"""
+    if start_date is None:
+        return None
+    earliest = Task.objects.using(source._state.db).filter(
+        workspace=source,
+    ).aggregate(earliest=Min('due_date'))['earliest']
+    return start_date - earliest if earliest else None
+
+
+def copy_tasks(job, source, target, batch_size):
+    """Copy the source's live tasks; return {source task id: copy id}"""
+    shift = due_date_shift(source, job.start_date)
+    keep_assignees = job.keeps_assignees()
+    db = target._state.db
+    task_ids = {}
+    orphans = []
+    linked = []
+    fields = [
+        'title', 'description', 'description_html', 'description_excerpt', 'status', 'priority',
+        'due_date', 'assigned_to_id', 'parent_id',
+    ]
+    for rows in chunks(Task.objects.using(source._state.db).filter(workspace=source), fields, batch_size):
+        copies = [
+            Task(
+                workspace_id=target.pk,
+                title=row['title'],
+                description=row['description'],
+                description_html=row['description_html'],
+                description_excerpt=row['description_excerpt'],
+                status=Task.STATUS_TODO if job.as_template else row['status'],
+                priority=row['priority'],
+                due_date=row['due_date'] + shift if shift and row['due_date'] else row['due_date'],
+                assigned_to_id=row['assigned_to_id'] if keep_assignees else None,
+                created_by_id=job.requested_by_id,
+                parent_id=task_ids.get(row['parent_id']),
+            )
+            for row in rows
+        ]
+        Task.objects.using(db).bulk_create(copies)
+        for row, copy in zip(rows, copies):
+            task_ids[row['pk']] = copy.pk
+            if row['parent_id'] and copy.parent_id is None:
+                orphans.append((copy, row['parent_id']))
+        linked.extend(copy for copy in copies if has_task_links(copy))
+        record_progress(job, tasks_copied=len(copies))
+
+    # Subtasks copied before their parent (re-parented after creation)
+    adopted = []
+    for copy, parent_id in orphans:
+        if parent_id in task_ids:
+            copy.parent_id = task_ids[parent_id]
+            adopted.append(copy)
+    Task.all_objects.using(db).bulk_update(adopted, ['parent'], batch_size=batch_size)
+
+    # Links to tasks copied later only resolve now that every copy exists
+    relink_tasks(linked, task_ids, target)
+    Task.all_objects.using(db).bulk_update(
+        linked, ['description', 'description_html', 'description_excerpt'], batch_size=batch_size,
+    )
+    return task_ids
+
+
+def copy_dependencies(source, target, task_ids, batch_size):
+    queryset = TaskDependency.objects.using(source._state.db).filter(task__workspace=source)
+    for rows in chunks(queryset, ['task_id', 'blocker_id'], batch_size):
+        copies = [
+            TaskDependency(task_id=task_ids[row['task_id']], blocker_id=task_ids[row['blocker_id']])
+            for row in rows if row['task_id'] in task_ids and row['blocker_id'] in task_ids
+        ]
+        # Its default manager isn't a ShardedQuerySet, which would do this
+        assign_ids(TaskDependency, copies)
+        TaskDependency.objects.using(target._state.db).bulk_create(copies)
+
+
+def copy_labels(source, target, task_ids, batch_size):
+    """Copy labels and their links to copied tasks, with task counts computed on the way"""
+    db = target._state.db
+    labels = list(Label.objects.using(source._state.db).filter(workspace=source).order_by('pk'))
+    copies = [Label(workspace_id=target.pk, name=label.name, color=label.color) for label in labels]
+    Label.objects.using(db).bulk_create(copies)
+    label_ids = {label.pk: copy.pk for label, copy in zip(labels, copies)}
+
+    counts = Counter()
+    queryset = TaskLabel.objects.using(source._state.db).filter(task__workspace=source)
+    for rows in chunks(queryset, ['task_id', 'label_id'], batch_size):
+        links = [
+            TaskLabel(task_id=task_ids[row['task_id']], label_id=label_ids[row['label_id']])
+            for row in rows if row['task_id'] in task_ids
+        ]
+        TaskLabel.objects.using(db).bulk_create(links)
+        counts.update(link.label_id for link in links)
+    for copy in copies:
+        copy.task_count = counts[copy.pk]
+    Label.objects.using(db).bulk_update(copies, ['task_count'])
+
+
+def copy_comments(job, source, target, task_ids, batch_size):
+    db = target._state.db
+    queryset = Comment.objects.using(source._state.db).filter(task__workspace=source)
+    for rows in chunks(queryset, ['task_id', 'user_id', 'text', 'text_html'], batch_size):
+        copies = [
+            Comment(task_id=task_ids[row['task_id']], user_id=row['user_id'], text=row['text'], text_html=row['text_html'])
+            for row in rows if row['task_id'] in task_ids
+        ]
+        linked = [copy for copy in copies if has_task_links(copy)]
+        for copy in linked:
+            # Rendering reads the workspace through the task; don't query for it
+            copy.task = Task(pk=copy.task_id, workspace_id=target.pk)
+        relink_tasks(linked, task_ids, target)
+        Comment.objects.using(db).bulk_create(copies)
+        record_progress(job, comments_copied=len(copies))
+
+
+def copy_members(source, target):
+    """Members of the source join the copy with their roles, so assignments stay valid"""
+    roles = dict(source.memberships().values_list('user_id', 'role'))
+    # The copy has its own owner; the source's stays on as an admin
+    roles.pop(target.owner_id, None)
+    if roles.get(source.owner_id) == WorkspaceMembership.ROLE_OWNER:
+        roles[source.owner_id] = WorkspaceMembership.ROLE_ADMIN
+    WorkspaceMembership.objects.using(target._state.db).bulk_create([
+        WorkspaceMembership(workspace_id=target.pk, user_id=user_id, role=role)
+        for user_id, role in sorted(roles.items())
+    ])
+
+
+def run_job(job, batch_size=1000):
+    """Copy a job's workspace and reveal the copy; return False if another worker has it"""
+    if not claim_job(job):
+        return False
+    try:
+        source, target = start_copy(job)
+        task_ids = copy_tasks(job, source, target, batch_size)
+        copy_dependencies(source, target, task_ids, batch_size)
+        if job.with_labels:
+            copy_labels(source, target, task_ids, batch_size)
+        if job.with_comments:
+            copy_comments(job, source, target, task_ids, batch_size)
+        if job.keeps_assignees():
+            copy_members(source, target)
+    except Exception as exc:
+        logger.exception('%s failed', job)
+        if job.target_workspace_id is not None:
+            hidden = Workspace.all_objects.using(shard_for_workspace(job.target_workspace_id)).filter(
+                pk=job.target_workspace_id,
+            ).first()
+            if hidden is not None:
+                schedule_deletion(hidden)
+        CloneJob.objects.filter(pk=job.pk).update(
+            error=f'{type(exc).__name__}: {exc}'[:500],
+            finished_at=timezone.now(),
+            lease_expires_at=None,
+        )
+        return True
+
+    with transaction.atomic(using=target._state.db):
+        Workspace.all_objects.using(target._state.db).filter(pk=target.pk).update(deleted_at=None)
+    CloneJob.objects.filter(pk=job.pk).update(finished_at=timezone.now(), lease_expires_at=None)
+    job.refresh_from_db()
+    logger.info('%s finished: %d tasks, %d comments', job, job.tasks_copied, job.comments_copied)
+    return True
+
+
+def run_clones(batch_size=1000, limit=None):
+    """Run waiting clone jobs, oldest first; return how many finished"""
+    finished = 0
+    for job in CloneJob.objects.filter(finished_at__isnull=True)[:limit]:
+        if run_job(job, batch_size=batch_size):
+            finished += 1
+    return finished
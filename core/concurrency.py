@@ -0,0 +1,42 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+# Each worker thread holds its own database connection, so the pool size
+# also caps how many extra connections a single process may open.
+_query_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_QUERY_WORKERS,
+    thread_name_prefix='query',
+)
+
+
+def _run_query(func):
+    """Run a query callable, honouring CONN_MAX_AGE like a normal request would"""
+    close_old_connections()
+    try:
+        return func()
+    finally:
+        close_old_connections()
+
+
+async def gather_queries(*funcs):
+    """
+    Run independent, synchronous ORM callables concurrently.
+
+    Django's async ORM methods all funnel through one thread per request, so
+    they still execute one after another. Each callable here gets its own
+    pool thread (and connection) instead, so the total wait approaches the
+    slowest query rather than the sum. Callables must fully evaluate their
+    querysets (list(), count(), aggregate()) before returning.
+    """
+    loop = asyncio.get_running_loop()
+    futures = [
+        # Copy the context so per-request state such as replica routing follows the query
+        loop.run_in_executor(_query_executor, contextvars.copy_context().run, _run_query, func)
+        for func in funcs
+    ]
+    return await asyncio.gather(*futures)
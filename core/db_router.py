@@ -0,0 +1,133 @@
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from . import sharding
+
+
+class RoutingState:
+    """Per-request routing flags shared between the middleware and router"""
+
+    def __init__(self):
+        self.read_replica = False
+        self.wrote = False
+
+
+routing_state = ContextVar('db_routing_state', default=None)
+
+# Session rows are written on login, so they must never be read from a lagging replica
+PRIMARY_ONLY_APPS = {'sessions'}
+
+
+def get_routing_state():
+    return routing_state.get()
+
+
+def get_replica_aliases():
+    """Return database aliases configured as read replicas"""
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads from whitelisted views to a replica, everything else to the primary.
+
+    Routing is opt-in per request: ReplicaRoutingMiddleware marks the request as
+    replica-safe only for views listed in READ_REPLICA_VIEWS and only when the
+    user has not written recently. Outside of a request (management commands,
+    shell) every query goes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = get_routing_state()
+        if state is None or not state.read_replica or state.wrote:
+            return None
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return None
+
+        replicas = get_replica_aliases()
+        if not replicas:
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = get_routing_state()
+        if state is not None:
+            # Remember the write so the user is pinned to the primary afterwards
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Replicas mirror the primary, so objects from any of them may relate"""
+        databases = {'default', *get_replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class WorkspaceShardRouter:
+    """
+    Send workspace-scoped models to the shard that holds their workspace.
+
+    The shard comes from the instance being saved or related to, falling back
+    to the shard selected for the current request by ShardRoutingMiddleware
+    (or by sharding.use_shard in commands and fan-out queries). Global models
+    are left to the next router, except when reached through a sharded
+    instance, where Django would otherwise fall back to the instance's shard.
+    With a single configured shard this router does nothing. Routing only
+    reads: new rows get their global id from a pre_save receiver, and new
+    workspaces are placed on a shard by Workspace.save.
+    """
+
+    def db_for_read(self, model, **hints):
+        return self.route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self.route(model, hints)
+
+    def route(self, model, hints):
+        if not sharding.sharding_enabled():
+            return None
+        instance = hints.get('instance')
+        if not sharding.is_sharded(model):
+            if instance is not None and sharding.is_sharded(instance):
+                return 'default'
+            return None
+        if instance is not None and sharding.is_sharded(instance):
+            alias = sharding.shard_for_instance(instance)
+            if alias is not None:
+                return alias
+        return sharding.current_shard.get() or 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        """Sharded rows may point at global rows; sharded rows only relate within a shard"""
+        if not sharding.sharding_enabled():
+            return None
+        sharded1, sharded2 = sharding.is_sharded(obj1), sharding.is_sharded(obj2)
+        if sharded1 and sharded2:
+            return obj1._state.db == obj2._state.db
+        if sharded1 or sharded2:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """Shards other than default only get the workspace-scoped tables"""
+        if db == 'default' or db not in sharding.shard_aliases():
+            return None
+        if model_name is None:
+            return False
+        return f'{app_label}.{model_name}' in sharding.SHARDED_MODELS
+
+
+def is_pinned_to_primary(request):
+    """Check if the user wrote recently and must keep reading from the primary"""
+    try:
+        pinned_until = float(request.COOKIES.get(settings.READ_REPLICA_PIN_COOKIE, 0))
+    except ValueError:
+        return False
+    return pinned_until > time.time()
@@ -0,0 +1,155 @@
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from tasks.labels import release_labels
+from tasks.models import Task, Comment, ArchivedTask, ArchivedComment
+from workspaces.changes import record_change
+from workspaces.models import Change, Workspace, WorkspaceMembership
+from workspaces.webhooks import record_event, task_payload
+from .models import DeletionJob, WorkspaceShard
+from .sharding import forget_workspace, on_shard_of, shard_for_task, shard_for_workspace
+
+logger = logging.getLogger(__name__)
+
+LEASE_DURATION = timedelta(minutes=5)
+
+
+def schedule_deletion(obj, user=None):
+    """
+    Hide a workspace or task immediately and queue its rows for the reaper.
+
+    Only the target row is updated here, so the request returns at once no
+    matter how many tasks, comments or members hang off it.
+    """
+    if isinstance(obj, Workspace):
+        model, target_type, name = Workspace, DeletionJob.TARGET_WORKSPACE, obj.name
+    elif isinstance(obj, Task):
+        model, target_type, name = Task, DeletionJob.TARGET_TASK, obj.title
+    else:
+        raise TypeError(f"Can't schedule deletion of {type(obj).__name__}")
+
+    now = timezone.now()
+    target = on_shard_of(model.all_objects.filter(pk=obj.pk), obj)
+    # The job lives on the default database; nesting both transactions rolls
+    # the target back too if the job can't be recorded
+    with transaction.atomic(using=target.db), transaction.atomic(using='default'):
+        target.update(deleted_at=now)
+        if target_type == DeletionJob.TARGET_TASK:
+            record_event(obj.workspace_id, 'task.deleted', task_payload(obj), target.db)
+            record_change(Change.KIND_TASK, obj.workspace_id, obj.pk, target.db, deleted=True)
+        job = DeletionJob.objects.create(
+            target_type=target_type,
+            target_id=obj.pk,
+            target_name=name,
+            requested_by=user,
+        )
+    obj.deleted_at = now
+    return job
+
+
+def delete_in_batches(queryset, batch_size, before_delete=None):
+    """
+    Delete rows matching queryset, batch_size at a time; yield rows deleted per batch.
+
+    ``before_delete(ids, db)`` runs in each batch's transaction, e.g. to
+    adjust counters kept elsewhere.
+    """
+    model, db = queryset.model, queryset.db
+    while True:
+        ids = list(queryset.order_by().values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        with transaction.atomic(using=db):
+            if before_delete is not None:
+                before_delete(ids, db)
+            model._base_manager.using(db).filter(pk__in=ids).delete()
+        yield len(ids)
+
+
+def claim_job(job):
+    """Take the job's lease; return False if another reaper holds it"""
+    now = timezone.now()
+    claimed = DeletionJob.objects.filter(
+        pk=job.pk, finished_at__isnull=True,
+    ).exclude(
+        lease_expires_at__gt=now,
+    ).update(
+        lease_expires_at=now + LEASE_DURATION,
+    )
+    return claimed == 1
+
+
+def record_progress(job, field, count):
+    DeletionJob.objects.filter(pk=job.pk).update(
+        **{field: F(field) + count},
+        lease_expires_at=timezone.now() + LEASE_DURATION,
+    )
+
+
+def run_job(job, batch_size=1000):
+    """Purge everything belonging to a job's target, children first"""
+    if not claim_job(job):
+        return False
+
+    if job.started_at is None:
+        DeletionJob.objects.filter(pk=job.pk).update(started_at=timezone.now())
+
+    if job.target_type == DeletionJob.TARGET_WORKSPACE:
+        db = shard_for_workspace(job.target_id)
+        comment_querysets = [
+            Comment.all_objects.using(db).filter(task__workspace_id=job.target_id),
+            ArchivedComment.objects.using(db).filter(task__workspace_id=job.target_id),
+        ]
+        task_querysets = [
+            Task.all_objects.using(db).filter(workspace_id=job.target_id),
+            ArchivedTask.objects.using(db).filter(workspace_id=job.target_id),
+        ]
+        members = WorkspaceMembership.objects.using(db).filter(workspace_id=job.target_id)
+        target = Workspace.all_objects.using(db).filter(pk=job.target_id)
+        # The workspace's labels go with it, so their counts don't matter
+        before_delete = None
+    else:
+        db = shard_for_task(job.target_id)
+        comment_querysets = [Comment.all_objects.using(db).filter(task_id=job.target_id)]
+        task_querysets = [Task.all_objects.using(db).filter(pk=job.target_id)]
+        members = None
+        target = None
+        before_delete = release_labels
+
+    for comments in comment_querysets:
+        for count in delete_in_batches(comments, batch_size):
+            record_progress(job, 'comments_deleted', count)
+    for tasks in task_querysets:
+        for count in delete_in_batches(tasks, batch_size, before_delete):
+            record_progress(job, 'tasks_deleted', count)
+    if members is not None:
+        for count in delete_in_batches(members, batch_size):
+            record_progress(job, 'members_deleted', count)
+    if target is not None:
+        target.delete()
+        WorkspaceShard.objects.filter(workspace_id=job.target_id).delete()
+        forget_workspace(job.target_id)
+
+    DeletionJob.objects.filter(pk=job.pk).update(
+        finished_at=timezone.now(),
+        lease_expires_at=None,
+    )
+    job.refresh_from_db()
+    logger.info(
+        '%s finished: %d comments, %d tasks, %d members',
+        job, job.comments_deleted, job.tasks_deleted, job.members_deleted,
+    )
+    return True
+
+
+def reap(batch_size=1000, limit=None):
+    """Run pending deletion jobs, oldest first; return how many finished"""
+    finished = 0
+    for job in DeletionJob.objects.filter(finished_at__isnull=True)[:limit]:
+        if run_job(job, batch_size=batch_size):
+            finished += 1
+    return finished
@@ -0,0 +1,25 @@
+from django.contrib.postgres.indexes import OpClass
+from django.db import models
+
+
+class PrefixIndex(models.Index):
+    """
+    Index for case-insensitive prefix search (``__istartswith``).
+
+    Declare it over ``Upper(field)``, matching the UPPER(...) LIKE 'ABC%'
+    that Django generates. On PostgreSQL the expressions get the
+    ``text_pattern_ops`` operator class, without which a B-tree can't serve
+    LIKE under a non-C collation. Other backends get a plain expression index.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+        index = models.Index(
+            *[OpClass(expression, name='text_pattern_ops') for expression in self.expressions],
+            name=self.name,
+            db_tablespace=self.db_tablespace,
+            condition=self.condition,
+        )
+        return index.create_sql(model, schema_editor, using=using, **kwargs)
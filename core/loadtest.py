@@ -0,0 +1,456 @@
+"""
+Load generation for finding the concurrency ceiling of a single node.
+
+Virtual users run in threads. Each one repeatedly logs in as one of the
+load users, performs a number of actions picked by weight from SCENARIOS,
+and starts over with fresh cookies. Requests go either in-process, through
+Django's WSGI or ASGI handler, or over HTTP to a running server. Each
+request's latency and status is recorded in intervals: LoadTest reports
+throughput, latency percentiles, errors and database lock waits over time
+and in total.
+"""
+import asyncio
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter, deque, namedtuple
+from urllib.parse import urlsplit
+
+import requests
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.shortcuts import resolve_url
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from tasks.models import Task
+from workspaces.models import Workspace
+from .sharding import shard_for_workspace
+
+logger = logging.getLogger(__name__)
+
+Result = namedtuple('Result', ['status', 'body', 'error', 'location'])
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+SEARCH_TERMS = ['design', 'api', 'bug', 'review', 'launch', 'test', 'mobile', 'docs']
+COMMENTS = [
+    'Looks good to me.',
+    'Can we discuss this in the next standup?',
+    'I pushed a fix, please take another look.',
+    'Blocked on the design review.',
+]
+
+# Weighted actions a virtual user picks from; override with --mix
+DEFAULT_MIX = {
+    'dashboard': 20,
+    'my_tasks': 10,
+    'task_list': 30,
+    'task_detail': 15,
+    'toggle_status': 10,
+    'add_comment': 10,
+    'search': 5,
+}
+
+
+def percentile(values, fraction):
+    """``fraction`` percentile of already sorted values (nearest rank)"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def parse_mix(value):
+    """Turn 'dashboard=20,search=5' into {'dashboard': 20, 'search': 5}"""
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f'Unknown scenario "{name}", expected one of {", ".join(SCENARIOS)}')
+        mix[name] = int(weight or 1)
+    return mix
+
+
+# Targets
+
+def load_targets(usernames, tasks_per_workspace=200):
+    """
+    {username: (workspace ids, task ids)} the load users may open.
+
+    Read once before the run, so picking what to request costs nothing.
+    """
+    users = {user.username: user for user in get_user_model().objects.filter(username__in=usernames)}
+    missing = set(usernames) - set(users)
+    if missing:
+        raise ValueError(f'No such user(s): {", ".join(sorted(missing))}')
+
+    targets = {}
+    for username, user in users.items():
+        workspace_ids = list(Workspace.objects.filter(
+            members=user,
+        ).values_list('pk', flat=True))
+        task_ids = []
+        for workspace_id in workspace_ids:
+            task_ids.extend(
+                Task.objects.using(shard_for_workspace(workspace_id)).filter(workspace_id=workspace_id)
+                .order_by('-pk').values_list('pk', flat=True)[:tasks_per_workspace]
+            )
+        targets[username] = (workspace_ids, task_ids)
+    return targets
+
+
+def verify_emails(usernames):
+    """Mark the load users' email addresses verified, so mandatory verification lets them log in"""
+    from allauth.account.models import EmailAddress
+
+    for user in get_user_model().objects.filter(username__in=usernames).exclude(email=''):
+        EmailAddress.objects.update_or_create(
+            user=user, email=user.email, defaults={'verified': True, 'primary': True},
+        )
+
+
+# Transports
+
+class InProcessTransport:
+    """Requests through Django's own handler, without a server"""
+
+    def __init__(self, asgi=False):
+        # The test client's "testserver" host isn't in ALLOWED_HOSTS
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+        host = hosts[0] if hosts else 'localhost'
+        self.asgi = asgi
+        if asgi:
+            self.client = AsyncClient(raise_request_exception=False, HTTP_HOST=host)
+            self.loop = asyncio.new_event_loop()
+        else:
+            self.client = Client(raise_request_exception=False, HTTP_HOST=host)
+
+    def request(self, method, path, data=None):
+        call = getattr(self.client, method.lower())
+        if self.asgi:
+            response = self.loop.run_until_complete(call(path, data))
+        else:
+            response = call(path, data)
+        error = None
+        if getattr(response, 'exc_info', None):
+            error = f'{response.exc_info[0].__name__}: {response.exc_info[1]}'
+        body = '' if response.streaming else response.content.decode(errors='replace')
+        return Result(response.status_code, body, error, response.get('Location'))
+
+    def csrf_token(self):
+        cookie = self.client.cookies.get(settings.CSRF_COOKIE_NAME)
+        return cookie.value if cookie else ''
+
+    def reset(self):
+        self.client.cookies.clear()
+
+    def close(self):
+        if self.asgi:
+            self.loop.close()
+
+
+class HttpTransport:
+    """Requests over HTTP to a running server"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def request(self, method, path, data=None):
+        headers = {'Referer': self.base_url + path}
+        if method == 'POST':
+            headers['X-CSRFToken'] = self.csrf_token()
+        try:
+            response = self.session.request(
+                method, self.base_url + path,
+                params=data if method == 'GET' else None,
+                data=data if method == 'POST' else None,
+                headers=headers, timeout=self.timeout, allow_redirects=False,
+            )
+        except requests.RequestException as exc:
+            return Result(0, '', f'{type(exc).__name__}: {exc}', None)
+        return Result(response.status_code, response.text, None, response.headers.get('Location'))
+
+    def csrf_token(self):
+        return self.session.cookies.get(settings.CSRF_COOKIE_NAME, '')
+
+    def reset(self):
+        self.session.cookies.clear()
+
+    def close(self):
+        self.session.close()
+
+
+# Scenarios. Each returns (method, path, data) for a virtual user to request.
+
+def dashboard(user):
+    return 'GET', reverse('core:dashboard'), None
+
+
+def my_tasks(user):
+    return 'GET', reverse('core:my_tasks'), None
+
+
+def task_list(user):
+    filters = {}
+    if random.random() < 0.5:
+        filters['status'] = random.choice([value for value, _label in Task.STATUS_CHOICES])
+    if random.random() < 0.3:
+        filters['priority'] = random.choice([value for value, _label in Task.PRIORITY_CHOICES])
+    if random.random() < 0.2:
+        # Always exists, unlike a page number
+        filters['page'] = 'last'
+    return 'GET', reverse('tasks:list', kwargs={'workspace_id': random.choice(user.workspace_ids)}), filters
+
+
+def task_detail(user):
+    return 'GET', reverse('tasks:detail', kwargs={'pk': random.choice(user.task_ids)}), None
+
+
+def toggle_status(user):
+    return 'POST', reverse('tasks:toggle_status', kwargs={'pk': random.choice(user.task_ids)}), {}
+
+
+def add_comment(user):
+    return 'POST', reverse('tasks:add_comment', kwargs={'task_id': random.choice(user.task_ids)}), {
+        'text': random.choice(COMMENTS),
+    }
+
+
+def search(user):
+    return 'GET', reverse('core:search'), {'q': random.choice(SEARCH_TERMS)}
+
+
+# name: (scenario, whether it needs the user to have tasks)
+SCENARIOS = {
+    'dashboard': (dashboard, False),
+    'my_tasks': (my_tasks, False),
+    'task_list': (task_list, True),
+    'task_detail': (task_detail, True),
+    'toggle_status': (toggle_status, True),
+    'add_comment': (add_comment, True),
+    'search': (search, False),
+}
+
+
+# Recording
+
+def drain(queue):
+    return [queue.popleft() for _ in range(len(queue))]
+
+
+class Recorder:
+    """Collects (scenario, seconds, status, error) samples for the current interval"""
+
+    def __init__(self):
+        # deque appends and pops are thread-safe, so virtual users need no lock
+        self.samples = deque()
+        self.lock_waits = deque()
+
+    def add(self, scenario, seconds, status, error=None):
+        self.samples.append((scenario, seconds, status, error))
+
+    def take(self):
+        """Samples and lock wait readings recorded since the last call"""
+        return drain(self.samples), drain(self.lock_waits)
+
+
+def summarize(samples, seconds):
+    """Throughput, latency percentiles (ms) and outcome counts of some samples"""
+    latencies = sorted(sample[1] for sample in samples)
+    statuses = Counter()
+    locked = 0
+    for _scenario, _seconds, status, error in samples:
+        if status == 0 or status >= 500:
+            statuses['errors'] += 1
+        elif status == 429:
+            statuses['limited'] += 1
+        elif status >= 400:
+            statuses['4xx'] += 1
+        if error and 'locked' in error.lower():
+            locked += 1
+    return {
+        'requests': len(samples),
+        'rps': len(samples) / seconds if seconds else 0.0,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'errors': statuses['errors'],
+        'error_rate': statuses['errors'] / len(samples) if samples else 0.0,
+        'limited': statuses['limited'],
+        'client_errors': statuses['4xx'],
+        'locked': locked,
+    }
+
+
+def lock_waiters():
+    """Sessions of this database waiting for a lock right now, or None if unknown"""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM pg_stat_activity "
+            "WHERE wait_event_type = 'Lock' AND datname = current_database()"
+        )
+        return cursor.fetchone()[0]
+
+
+# Running
+
+class VirtualUser:
+    """One simulated person: a login, then weighted actions, over and over"""
+
+    def __init__(self, username, password, workspace_ids, task_ids, transport):
+        self.username = username
+        self.password = password
+        self.workspace_ids = workspace_ids
+        self.task_ids = task_ids
+        self.transport = transport
+
+    def login(self, recorder):
+        """Open the login page and sign in; the two requests are recorded separately"""
+        self.transport.reset()
+        path = reverse('account_login')
+        started = time.perf_counter()
+        page = self.transport.request('GET', path)
+        recorder.add('login_page', time.perf_counter() - started, page.status, page.error)
+        match = CSRF_INPUT.search(page.body)
+
+        started = time.perf_counter()
+        result = self.transport.request('POST', path, {
+            'login': self.username,
+            'password': self.password,
+            'csrfmiddlewaretoken': match.group(1) if match else self.transport.csrf_token(),
+        })
+        status, error = result.status, result.error
+        # Only a redirect to LOGIN_REDIRECT_URL means success; bad credentials
+        # re-render the form and unverified emails redirect elsewhere
+        logged_in = status == 302 and urlsplit(result.location or '').path == resolve_url(settings.LOGIN_REDIRECT_URL)
+        if not logged_in and status < 400:
+            status, error = 401, error or f'login failed for {self.username}'
+        recorder.add('login', time.perf_counter() - started, status, error)
+        return logged_in
+
+    def run(self, recorder, mix, actions_per_session, think_time, stop):
+        names = [name for name in mix if self.task_ids or not SCENARIOS[name][1]]
+        weights = [mix[name] for name in names]
+        while not stop.is_set():
+            if not self.login(recorder):
+                stop.wait(1)
+                continue
+            for _ in range(actions_per_session):
+                if stop.is_set():
+                    return
+                name = random.choices(names, weights)[0]
+                method, path, data = SCENARIOS[name][0](self)
+                started = time.perf_counter()
+                result = self.transport.request(method, path, data)
+                recorder.add(name, time.perf_counter() - started, result.status, result.error)
+                if think_time:
+                    stop.wait(random.uniform(0, 2 * think_time))
+
+
+class LoadTest:
+    """
+    Drive ``users`` virtual users for ``duration`` seconds and report.
+
+    Users start evenly over ``ramp_up`` seconds. ``report`` is called every
+    ``interval`` seconds with (elapsed seconds, active users, summary) and
+    run() returns the overall summary and one per scenario.
+    """
+
+    def __init__(self, usernames, password, users=10, duration=60, ramp_up=0, interval=5,
+                 mix=None, actions_per_session=20, think_time=0.0, base_url=None, asgi=False):
+        self.usernames = usernames
+        self.password = password
+        self.users = users
+        self.duration = duration
+        self.ramp_up = ramp_up
+        self.interval = interval
+        self.mix = mix or DEFAULT_MIX
+        self.actions_per_session = actions_per_session
+        self.think_time = think_time
+        self.base_url = base_url
+        self.asgi = asgi
+        self.recorder = Recorder()
+        self.stop = threading.Event()
+
+    def make_transport(self):
+        if self.base_url:
+            return HttpTransport(self.base_url)
+        return InProcessTransport(asgi=self.asgi)
+
+    def run_user(self, index, targets):
+        username = self.usernames[index % len(self.usernames)]
+        workspace_ids, task_ids = targets[username]
+        transport = self.make_transport()
+        user = VirtualUser(username, self.password, workspace_ids, task_ids, transport)
+        try:
+            user.run(self.recorder, self.mix, self.actions_per_session, self.think_time, self.stop)
+        except Exception:
+            logger.exception('Virtual user %d crashed', index)
+        finally:
+            transport.close()
+
+    def sample_locks(self):
+        """Read the number of lock waiters a few times per interval"""
+        try:
+            while not self.stop.wait(min(0.5, self.interval)):
+                waiting = lock_waiters()
+                if waiting is None:
+                    return
+                self.recorder.lock_waits.append(waiting)
+        finally:
+            connection.close()
+
+    def run(self, report=None):
+        targets = load_targets(self.usernames)
+        threads = []
+        started = time.monotonic()
+        all_samples = []
+
+        sampler = threading.Thread(target=self.sample_locks, name='loadtest-locks', daemon=True)
+        sampler.start()
+        for index in range(self.users):
+            thread = threading.Thread(
+                target=self.run_user, args=(index, targets), name=f'loadtest-{index}', daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+            if self.ramp_up:
+                time.sleep(self.ramp_up / self.users)
+
+        last = started
+        while True:
+            remaining = started + self.duration - time.monotonic()
+            time.sleep(max(0, min(self.interval - (time.monotonic() - last), remaining)))
+            now = time.monotonic()
+            samples, lock_waits = self.recorder.take()
+            all_samples.extend(samples)
+            summary = summarize(samples, now - last)
+            summary['lock_waits'] = max(lock_waits) if lock_waits else None
+            if report:
+                report(now - started, sum(thread.is_alive() for thread in threads), summary)
+            last = now
+            if now - started >= self.duration:
+                break
+
+        elapsed = time.monotonic() - started
+        self.stop.set()
+        for thread in threads:
+            thread.join(timeout=30)
+        sampler.join(timeout=5)
+
+        by_scenario = {}
+        for sample in all_samples:
+            by_scenario.setdefault(sample[0], []).append(sample)
+        return summarize(all_samples, elapsed), {
+            name: summarize(samples, elapsed) for name, samples in sorted(by_scenario.items())
+        }
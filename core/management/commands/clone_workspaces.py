@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.cloning import run_clones
+from core.models import CloneJob
+
+
+class Command(BaseCommand):
+    help = 'Copy workspaces queued for duplication or as templates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows inserted per statement (default: 1000)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and poll for new jobs')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds between polls with --loop (default: 5)')
+
+    def handle(self, *args, **options):
+        while True:
+            pending = CloneJob.objects.filter(finished_at__isnull=True).count()
+            if pending:
+                self.stdout.write(f'{pending} clone job(s) pending...')
+                finished = run_clones(batch_size=options['batch_size'])
+                self.stdout.write(self.style.SUCCESS(f'Finished {finished} clone job(s)'))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
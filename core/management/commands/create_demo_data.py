@@ -64,7 +64,7 @@ class Command(BaseCommand):
             if created:
                 # Add random members
                 members = random.sample([u for u in demo_users if u != owner], k=random.randint(1, 3))
-                workspace.members.set(members)
+                workspace.members.add(*members)
                 self.stdout.write(f'Created workspace: {workspace.name}')
             workspaces.append(workspace)
 
@@ -85,7 +85,7 @@ class Command(BaseCommand):
         for i, (title, desc, priority) in enumerate(tasks_data):
             workspace = random.choice(workspaces)
             creator = workspace.owner
-            assignee = random.choice(list(workspace.members.all()) + [workspace.owner])
+            assignee = random.choice(list(workspace.get_all_members()))
             
             # Random due date
             days_offset = random.randint(-3, 7)
@@ -117,7 +117,7 @@ class Command(BaseCommand):
                     
                     num_comments = random.randint(1, 3)
                     for _ in range(num_comments):
-                        commenter = random.choice(list(workspace.members.all()) + [workspace.owner])
+                        commenter = random.choice(list(workspace.get_all_members()))
                         Comment.objects.create(
                             task=task,
                             user=commenter,
@@ -0,0 +1,95 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.loadtest import DEFAULT_MIX, LoadTest, parse_mix, verify_emails
+
+
+class Command(BaseCommand):
+    help = 'Drive the app with concurrent virtual users and report throughput, latency and errors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10,
+                            help='Concurrent virtual users (default: 10)')
+        parser.add_argument('--duration', type=float, default=60,
+                            help='Seconds to run (default: 60)')
+        parser.add_argument('--ramp-up', type=float, default=0,
+                            help='Seconds over which users start (default: all at once)')
+        parser.add_argument('--interval', type=float, default=5,
+                            help='Seconds between report lines (default: 5)')
+        parser.add_argument('--accounts', default='alice,bob,charlie,diana',
+                            help='Comma separated usernames the virtual users log in as')
+        parser.add_argument('--password', default='demo123',
+                            help='Password of those accounts (default: the demo data password)')
+        parser.add_argument('--verify-emails', action='store_true',
+                            help="Mark the accounts' emails verified first, so they can log in")
+        parser.add_argument('--mix', default=None,
+                            help='Scenario weights, e.g. "dashboard=20,task_list=30,search=5" '
+                                 f'(default: {",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items())})')
+        parser.add_argument('--actions', type=int, default=20,
+                            help='Actions per login session (default: 20)')
+        parser.add_argument('--think-time', type=float, default=0,
+                            help='Average seconds a user pauses between actions (default: 0)')
+        parser.add_argument('--url', default=None,
+                            help='Base URL of a running server, e.g. http://127.0.0.1:8000 '
+                                 '(default: call the app in-process)')
+        parser.add_argument('--asgi', action='store_true',
+                            help='In-process, go through the ASGI handler instead of WSGI')
+
+    def handle(self, *args, **options):
+        usernames = [name.strip() for name in options['accounts'].split(',') if name.strip()]
+        try:
+            mix = parse_mix(options['mix']) if options['mix'] else None
+        except ValueError as exc:
+            raise CommandError(exc)
+        if options['verify_emails']:
+            verify_emails(usernames)
+        if not options['url']:
+            # Failed requests are counted below; their tracebacks would drown the report
+            logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+        test = LoadTest(
+            usernames, options['password'],
+            users=options['users'],
+            duration=options['duration'],
+            ramp_up=options['ramp_up'],
+            interval=options['interval'],
+            mix=mix,
+            actions_per_session=options['actions'],
+            think_time=options['think_time'],
+            base_url=options['url'],
+            asgi=options['asgi'],
+        )
+        target = options['url'] or ('in-process ASGI' if options['asgi'] else 'in-process WSGI')
+        self.stdout.write(f'{options["users"]} user(s) for {options["duration"]:g}s against {target}')
+        self.stdout.write(
+            f'{"time":>6} {"users":>5} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+            f'{"errors":>7} {"4xx":>5} {"429":>5} {"locks":>5}'
+        )
+        try:
+            total, by_scenario = test.run(report=self.report)
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        self.stdout.write('')
+        self.stdout.write(
+            f'{"scenario":<14} {"requests":>8} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}'
+        )
+        for name, summary in list(by_scenario.items()) + [('total', total)]:
+            self.stdout.write(
+                f'{name:<14} {summary["requests"]:>8} {summary["rps"]:>8.1f} {summary["p50"]:>8.1f} '
+                f'{summary["p95"]:>8.1f} {summary["p99"]:>8.1f} {summary["errors"]:>7}'
+            )
+        style = self.style.SUCCESS if not total['errors'] else self.style.WARNING
+        self.stdout.write(style(
+            f'{total["rps"]:.1f} req/s, p99 {total["p99"]:.0f} ms, '
+            f'{total["error_rate"]:.2%} errors ({total["locked"]} database lock timeouts)'
+        ))
+
+    def report(self, elapsed, users, summary):
+        locks = '-' if summary['lock_waits'] is None else summary['lock_waits']
+        self.stdout.write(
+            f'{elapsed:>6.0f} {users:>5} {summary["rps"]:>8.1f} {summary["p50"]:>8.1f} '
+            f'{summary["p95"]:>8.1f} {summary["p99"]:>8.1f} {summary["errors"]:>7} '
+            f'{summary["client_errors"]:>5} {summary["limited"]:>5} {locks:>5}'
+        )
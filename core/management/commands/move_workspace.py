@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.resharding import move_workspace
+from core.sharding import shard_aliases, sharding_enabled
+
+
+class Command(BaseCommand):
+    help = 'Move a workspace and all its rows to another shard while it stays online'
+
+    def add_arguments(self, parser):
+        parser.add_argument('workspace_id', type=int)
+        parser.add_argument('target', help='Alias of the destination shard, e.g. shard_2')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows copied or deleted per statement (default: 1000)')
+        parser.add_argument('--grace', type=float, default=2,
+                            help='Seconds to wait for in-flight writes after freezing (default: 2)')
+
+    def handle(self, *args, **options):
+        if not sharding_enabled():
+            raise CommandError('Sharding is not enabled; set DATABASE_SHARD_URLS')
+        if options['target'] not in shard_aliases():
+            raise CommandError(f"Unknown shard, choose from: {', '.join(shard_aliases())}")
+
+        try:
+            stats = move_workspace(
+                options['workspace_id'],
+                options['target'],
+                batch_size=options['batch_size'],
+                grace_seconds=options['grace'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(
+            f"Copied {stats['copied']} row(s), then {stats['delta']} changed row(s) and "
+            f"{stats['members']} member(s) while frozen for {stats['frozen_seconds']:.2f}s"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Workspace {options['workspace_id']} moved from {stats['source']} to {stats['target']}; "
+            f"purged {stats['purged']} row(s) from the source"
+        ))
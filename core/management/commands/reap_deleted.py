@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.deletion import reap
+from core.models import DeletionJob
+
+
+class Command(BaseCommand):
+    help = 'Purge workspaces and tasks pending deletion in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows deleted per statement (default: 1000)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and poll for new jobs')
+        parser.add_argument('--interval', type=float, default=10,
+                            help='Seconds between polls with --loop (default: 10)')
+
+    def handle(self, *args, **options):
+        while True:
+            pending = DeletionJob.objects.filter(finished_at__isnull=True).count()
+            if pending:
+                self.stdout.write(f'{pending} deletion job(s) pending...')
+                finished = reap(batch_size=options['batch_size'])
+                self.stdout.write(self.style.SUCCESS(f'Finished {finished} deletion job(s)'))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from core.warmup import WARMUP_STEPS, warm_up
+
+
+class Command(BaseCommand):
+    help = 'Precompile templates, populate URL patterns and load providers, reporting startup time'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--step',
+            action='append',
+            choices=[name for name, _ in WARMUP_STEPS],
+            help='Only run the given step (can be repeated)',
+        )
+        parser.add_argument(
+            '--show-failures',
+            action='store_true',
+            help='List templates that failed to compile',
+        )
+
+    def handle(self, *args, **options):
+        report = warm_up(steps=options['step'])
+
+        self.stdout.write('Startup time breakdown:')
+        for name, seconds, result in report:
+            if name == 'templates':
+                compiled, failed = result
+                detail = f'{compiled} compiled, {len(failed)} failed'
+            else:
+                detail = str(result)
+            self.stdout.write(f'  {name:<18} {seconds * 1000:8.1f} ms   ({detail})')
+
+            if name == 'templates' and options['show_failures']:
+                for template_name, error in result[1]:
+                    self.stdout.write(self.style.WARNING(f'    {template_name}: {error}'))
+
+        total = sum(seconds for _, seconds, _ in report)
+        self.stdout.write(self.style.SUCCESS(f'Warm-up finished in {total * 1000:.1f} ms'))
@@ -0,0 +1,278 @@
+"""
+Runtime metrics in the Prometheus text format.
+
+Every worker process keeps its counters and histograms in memory; an
+observation is a dict update under one uncontended lock. With METRICS_DIR
+set, each process also writes a snapshot of its metrics to
+``<METRICS_DIR>/<pid>.json`` at most every METRICS_FLUSH_INTERVAL seconds,
+and /metrics adds up the snapshots of all processes, so any worker can
+answer a scrape for the whole node. Clear METRICS_DIR when the server is
+(re)started. Gauges (sessions, queues) are read from the database when
+scraped, not tracked.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    'taskflow_http_requests_total': (
+        'counter', 'Requests handled, by URL name, method and status code', None),
+    'taskflow_http_request_duration_seconds': (
+        'histogram', 'Time to produce a response, by URL name', LATENCY_BUCKETS),
+    'taskflow_db_query_duration_seconds': (
+        'histogram', 'Time spent in database queries per request, by URL name', LATENCY_BUCKETS),
+    'taskflow_db_queries': (
+        'histogram', 'Database queries per request, by URL name', QUERY_COUNT_BUCKETS),
+    'taskflow_cache_requests_total': (
+        'counter', 'Cache lookups by cache and result (hit or miss)', None),
+    'taskflow_response_bytes_total': (
+        'counter', 'Bytes of compressed responses before and after compression', None),
+}
+
+UNRESOLVED = '<unresolved>'
+
+
+class Registry:
+    """Counters and histograms of one process, keyed by (name, label items)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        # [count per bucket..., +Inf count, sum]
+        self.histograms = {}
+        self.flushed_at = 0.0
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            state = self.histograms.get(key)
+            if state is None:
+                state = self.histograms[key] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    state[index] += 1
+                    break
+            else:
+                state[len(buckets)] += 1
+            state[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, labels, list(state)] for (name, labels), state in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        """Write this process's snapshot to METRICS_DIR, if it's time to"""
+        directory = settings.METRICS_DIR
+        now = time.monotonic()
+        if not directory or (not force and now - self.flushed_at < settings.METRICS_FLUSH_INTERVAL):
+            return
+        self.flushed_at = now
+        snapshot = self.snapshot()
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Write then rename, so readers never see half a file
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(temp_path, os.path.join(directory, f'{os.getpid()}.json'))
+        except OSError:
+            logger.exception('Could not write metrics to %s', directory)
+
+
+registry = Registry()
+
+
+def load_snapshots():
+    """Snapshots of every process: the files in METRICS_DIR, or just this process"""
+    directory = settings.METRICS_DIR
+    if not directory:
+        return [registry.snapshot()]
+    registry.flush(force=True)
+    snapshots = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            # A process that exited mid-write; the next scrape will see it
+            continue
+    return snapshots
+
+
+def merge_snapshots(snapshots):
+    """Add up counters and histograms with the same name and labels"""
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(tuple(item) for item in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, state in snapshot['histograms']:
+            key = (name, tuple(tuple(item) for item in labels))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], state)]
+            else:
+                histograms[key] = list(state)
+    return counters, histograms
+
+
+# Recording
+
+class QueryStats:
+    """Durations of the queries run for one request"""
+
+    def __init__(self):
+        # list.append is atomic, so fan_out threads need no lock
+        self.durations = []
+
+
+current_queries = ContextVar('current_queries', default=None)
+
+
+def record_queries(execute, sql, params, many, context):
+    """Execute wrapper that times queries run on behalf of a request"""
+    stats = current_queries.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.durations.append(time.perf_counter() - started)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver; adds the query recorder to each new connection"""
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+def record_request(view_name, method, status, seconds, stats):
+    view_name = view_name or UNRESOLVED
+    registry.inc('taskflow_http_requests_total', {'view': view_name, 'method': method, 'status': str(status)})
+    registry.observe('taskflow_http_request_duration_seconds', {'view': view_name}, seconds)
+    registry.observe('taskflow_db_query_duration_seconds', {'view': view_name}, sum(stats.durations))
+    registry.observe('taskflow_db_queries', {'view': view_name}, len(stats.durations))
+    registry.flush()
+
+
+def record_cache(cache_name, hits=0, misses=0):
+    """Count lookups in one of the app's caches, e.g. record_cache('webhook_subscriptions', hits=1)"""
+    if hits:
+        registry.inc('taskflow_cache_requests_total', {'cache': cache_name, 'result': 'hit'}, hits)
+    if misses:
+        registry.inc('taskflow_cache_requests_total', {'cache': cache_name, 'result': 'miss'}, misses)
+
+
+def record_compression(sender, encoding, original_size, compressed_size, **kwargs):
+    """response_compressed receiver"""
+    registry.inc('taskflow_response_bytes_total', {'encoding': encoding, 'stage': 'original'}, original_size)
+    registry.inc('taskflow_response_bytes_total', {'encoding': encoding, 'stage': 'compressed'}, compressed_size)
+
+
+# Gauges, read when scraped
+
+def collect_gauges():
+    """[(name, help, [(labels, value)])] of the queues and sessions, from the database"""
+    from core.models import DeletionJob
+    from core.sharding import fan_out, sum_counts
+    from workspaces.models import WebhookDelivery
+
+    gauges = []
+    if settings.SESSION_ENGINE in ('django.contrib.sessions.backends.db', 'django.contrib.sessions.backends.cached_db'):
+        from django.contrib.sessions.models import Session
+        active = Session.objects.filter(expire_date__gt=timezone.now()).count()
+        gauges.append(('taskflow_active_sessions', 'Unexpired sessions', [({}, active)]))
+
+    pending = DeletionJob.objects.filter(finished_at__isnull=True)
+    gauges.append(('taskflow_deletion_jobs_pending', 'Deletions waiting for the reaper', [({}, pending.count())]))
+    stalled_before = timezone.now() - timedelta(hours=1)
+    gauges.append((
+        'taskflow_deletion_jobs_stalled', 'Unfinished deletions requested over an hour ago',
+        [({}, pending.filter(created_at__lt=stalled_before).count())],
+    ))
+
+    by_status = sum_counts(fan_out(lambda: dict(
+        WebhookDelivery.objects.filter(
+            status__in=[WebhookDelivery.STATUS_PENDING, WebhookDelivery.STATUS_DEAD],
+        ).order_by().values('status').annotate(total=Count('pk')).values_list('status', 'total')
+    )))
+    gauges.append((
+        'taskflow_webhook_deliveries', 'Webhook events queued (pending) or given up on (dead)',
+        [({'status': status.lower()}, by_status.get(status, 0))
+         for status in (WebhookDelivery.STATUS_PENDING, WebhookDelivery.STATUS_DEAD)],
+    ))
+    return gauges
+
+
+# Exposition
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels) + '}'
+
+
+def format_number(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+def render(snapshots, gauges=()):
+    """Merged snapshots and gauges in the Prometheus text format"""
+    counters, histograms = merge_snapshots(snapshots)
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{name}{format_labels(labels)} {format_number(value)}')
+            continue
+        for (metric, labels), state in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], state[:-1]):
+                cumulative += count
+                le = bound if bound == '+Inf' else format_number(float(bound))
+                lines.append(f'{name}_bucket{format_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_number(state[-1])}')
+            lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+    for name, help_text, samples in gauges:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in samples:
+            lines.append(f'{name}{format_labels(tuple(sorted(labels.items())))} {format_number(value)}')
+    return '\n'.join(lines) + '\n'
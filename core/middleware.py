@@ -0,0 +1,500 @@
+import json
+import logging
+import math
+import mimetypes
+import time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+from .compression import StreamCompressor, available_encodings, is_compressible, minify_html
+from .metrics import QueryStats, current_queries, record_request
+from .db_router import RoutingState, routing_state, is_pinned_to_primary
+from .sharding import (
+    WorkspaceMoving, check_writable, shard_for_workspace, sharding_enabled, use_shard,
+    workspace_for_view,
+)
+from .signals import response_compressed
+from .throttling import check_rate_limits, should_shed
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsMiddleware:
+    """
+    Record each request's latency, query count and query time per URL name.
+
+    Sits first in MIDDLEWARE so the time covers the whole stack. For
+    streaming responses the time is until the response starts.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats = QueryStats()
+        token = current_queries.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = current_queries.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_queries.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def record(self, request, response, seconds, stats):
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        record_request(view_name, request.method, response.status_code, seconds, stats)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Enable replica reads for read-heavy views and pin writers to the primary.
+
+    After any write the response sets a short-lived cookie; while it is valid
+    every read from that browser goes to the primary, so a redirect after
+    e.g. toggle_task_status never renders stale replica data.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        state = RoutingState()
+        token = routing_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        return self.pin_writer(response, state)
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = routing_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing_state.reset(token)
+        return self.pin_writer(response, state)
+
+    def pin_writer(self, response, state):
+        if state.wrote:
+            sticky_seconds = settings.READ_REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                settings.READ_REPLICA_PIN_COOKIE,
+                str(time.time() + sticky_seconds),
+                max_age=sticky_seconds,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = routing_state.get()
+        if state is None or request.method not in ('GET', 'HEAD'):
+            return None
+
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        if view_name in settings.READ_REPLICA_VIEWS and not is_pinned_to_primary(request):
+            state.read_replica = True
+        return None
+
+
+class RateLimitMiddleware:
+    """
+    Throttle hot write endpoints and shed optional reads while the database is slow.
+
+    Views listed in RATE_LIMITS draw from per-user, per-IP and per-route token
+    buckets kept in the shared cache; an empty bucket means 429 with
+    Retry-After. Views in LOAD_SHED_VIEWS get 503 while the average query
+    takes longer than LOAD_SHED_LATENCY_MS, leaving the database to writes.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.RATE_LIMIT_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        # Returns the coroutine as-is when running async
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        if not view_name:
+            return None
+
+        retry_after = check_rate_limits(request, view_name)
+        if retry_after:
+            logger.debug('Rate limited %s for %s', view_name, request.META.get('REMOTE_ADDR'))
+            return self.refuse(429, 'Too many requests. Please slow down.', retry_after)
+
+        if should_shed(view_name):
+            logger.warning('Shedding %s, database is slow', view_name)
+            return self.refuse(503, 'The server is busy. Please try again shortly.', 5)
+        return None
+
+    def refuse(self, status, message, retry_after):
+        response = HttpResponse(message, status=status, content_type='text/plain')
+        response['Retry-After'] = str(math.ceil(retry_after))
+        return response
+
+
+class ShardRoutingMiddleware:
+    """
+    Point the request's sharded queries at the shard of the workspace it is about.
+
+    The workspace comes from the URL (a workspace, task or comment id), so
+    views need no changes. Cross-workspace views (dashboard, search) get no
+    shard and use sharding.fan_out instead. Writes to a workspace frozen for
+    a shard move are answered with 503 until the move switches over.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not sharding_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        alias, response = self.route(request)
+        if response is not None:
+            return response
+        with use_shard(alias):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        alias, response = await sync_to_async(self.route)(request)
+        if response is not None:
+            return response
+        with use_shard(alias):
+            return await self.get_response(request)
+
+    def route(self, request):
+        """Return (shard alias or None, early response or None)"""
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return None, None
+
+        workspace_id = workspace_for_view(match.view_name, match.kwargs)
+        if workspace_id is None:
+            return None, None
+
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            try:
+                check_writable(workspace_id)
+            except WorkspaceMoving:
+                response = HttpResponse(
+                    'This workspace is being moved. Please try again in a few seconds.',
+                    status=503,
+                    content_type='text/plain',
+                )
+                response['Retry-After'] = '5'
+                return None, response
+        return shard_for_workspace(workspace_id), None
+
+
+class StaticFilesMiddleware:
+    """
+    Serve collected static files with precompressed variants and far-future caching.
+
+    The STATIC_ROOT tree is indexed once at startup. Fingerprinted files get
+    ``Cache-Control: immutable`` since their name changes with their content;
+    the best ``.br``/``.gz`` sibling is picked from Accept-Encoding. Works under
+    WSGI and ASGI (files are read in a worker thread there), so a single node
+    needs no nginx in front. Disabled in DEBUG, where runserver serves static
+    files from the source directories.
+    """
+
+    IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+    DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+    ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.DEBUG or not settings.STATIC_ROOT:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.prefix = settings.STATIC_URL
+        if not self.prefix.startswith('/'):
+            self.prefix = '/' + self.prefix
+        self.files, self.immutable = self.build_index(Path(settings.STATIC_ROOT))
+
+    def build_index(self, root):
+        """Map each served name to its variants: {name: {encoding: (path, size, mtime)}}"""
+        files = {}
+        if not root.is_dir():
+            return files, set()
+
+        for path in root.rglob('*'):
+            if not path.is_file():
+                continue
+            name = path.relative_to(root).as_posix()
+            encoding = None
+            for candidate, suffix in self.ENCODINGS:
+                if name.endswith(suffix):
+                    name, encoding = name[:-len(suffix)], candidate
+                    break
+            stat = path.stat()
+            files.setdefault(name, {})[encoding] = (path, stat.st_size, int(stat.st_mtime))
+
+        # A stand-alone .gz/.br that isn't a variant of another file is served as-is
+        for name in [name for name, variants in files.items() if None not in variants]:
+            for encoding, suffix in self.ENCODINGS:
+                if encoding in files[name]:
+                    files.setdefault(name + suffix, {})[None] = files[name].pop(encoding)
+            if not files[name]:
+                del files[name]
+
+        immutable = set()
+        manifest_path = root / 'staticfiles.json'
+        if manifest_path.is_file():
+            with open(manifest_path) as f:
+                immutable = set(json.load(f).get('paths', {}).values())
+        return files, immutable
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        name = self.match(request)
+        if name is not None:
+            return self.serve(request, name)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        name = self.match(request)
+        if name is not None:
+            # Read the file up front: ASGI would drain a file iterator in a thread anyway
+            return await sync_to_async(self.serve)(request, name, read=True)
+        return await self.get_response(request)
+
+    def match(self, request):
+        """Name of the static file the request asks for, or None"""
+        if request.path.startswith(self.prefix) and request.method in ('GET', 'HEAD'):
+            name = request.path[len(self.prefix):]
+            if name in self.files:
+                return name
+        return None
+
+    def select_encoding(self, request, variants):
+        accepted = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        for encoding, _suffix in self.ENCODINGS:
+            if encoding in variants and accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return None
+
+    def serve(self, request, name, read=False):
+        variants = self.files[name]
+        encoding = self.select_encoding(request, variants)
+        path, size, mtime = variants[encoding]
+        etag = f'"{size:x}-{mtime:x}{"-" + encoding if encoding else ""}"'
+
+        # Handles lists, weak tags and * in If-None-Match, and If-Modified-Since
+        response = get_conditional_response(request, etag=etag, last_modified=mtime)
+        if response is None:
+            if request.method == 'HEAD':
+                response = HttpResponse()
+            elif read:
+                response = HttpResponse(path.read_bytes())
+            else:
+                response = FileResponse(open(path, 'rb'))
+
+        content_type, _ = mimetypes.guess_type(name)
+        response['Content-Type'] = content_type or 'application/octet-stream'
+        if response.status_code == 200:
+            response['Content-Length'] = str(size)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if len(variants) > 1:
+            response['Vary'] = 'Accept-Encoding'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(mtime)
+        response['Cache-Control'] = (
+            self.IMMUTABLE_CACHE_CONTROL if name in self.immutable else self.DEFAULT_CACHE_CONTROL
+        )
+        return response
+
+
+def parse_accept_encoding(header):
+    """Parse an Accept-Encoding header into {encoding: qvalue}"""
+    accepted = {}
+    for item in header.split(','):
+        encoding, _, params = item.strip().partition(';')
+        if not encoding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[encoding.strip().lower()] = quality
+    return accepted
+
+
+class CompressionMiddleware:
+    """
+    Compress dynamic responses with brotli or gzip, optionally minifying HTML.
+
+    Bodies smaller than COMPRESSION_MIN_SIZE are left alone. Streaming
+    responses (sync and async) are compressed chunk by chunk without
+    buffering. Every compressed response fires core.signals.response_compressed
+    with its sizes, so metrics can track ratios per response.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        content_type = response.get('Content-Type', '')
+        if not is_compressible(content_type):
+            return response
+
+        if (
+            settings.HTML_MINIFY
+            and not response.streaming
+            and content_type.startswith('text/html')
+        ):
+            response.content = minify_html(response.content)
+            if response.has_header('Content-Length'):
+                response.headers['Content-Length'] = str(len(response.content))
+
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = self.select_encoding(request)
+        if encoding is None:
+            return response
+
+        compressor = StreamCompressor(encoding, content_type)
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.acompress_stream(
+                    request, compressor, response.streaming_content
+                )
+            else:
+                response.streaming_content = self.compress_stream(
+                    request, compressor, response.streaming_content
+                )
+            del response.headers['Content-Length']
+        else:
+            compressed = compressor.compress(response.content) + compressor.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+            self.report(request, compressor)
+
+        # A strong ETag must not survive a change of representation
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def select_encoding(self, request):
+        accepted = parse_accept_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        for encoding in available_encodings():
+            if accepted.get(encoding, 0) > 0:
+                return encoding
+        return None
+
+    def compress_stream(self, request, compressor, chunks):
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+        self.report(request, compressor)
+
+    async def acompress_stream(self, request, compressor, chunks):
+        async for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.finish()
+        self.report(request, compressor)
+
+    def report(self, request, compressor):
+        response_compressed.send(
+            sender=self.__class__,
+            request=request,
+            encoding=compressor.encoding,
+            original_size=compressor.original_size,
+            compressed_size=compressor.compressed_size,
+        )
+        logger.debug(
+            'Compressed %s with %s: %d -> %d bytes (ratio %.2f)',
+            request.path, compressor.encoding,
+            compressor.original_size, compressor.compressed_size, compressor.ratio,
+        )
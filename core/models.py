@@ -1,3 +1,181 @@
 from django.db import models
+from django.conf import settings
 
-# Create your models here.
+
+class DeletionJob(models.Model):
+    """
+    DeletionJob model - tracks the background purge of a workspace or task.
+    The target is hidden from all querysets as soon as the job is created;
+    the reaper then deletes its rows in bounded batches.
+    """
+    
+    TARGET_WORKSPACE = 'workspace'
+    TARGET_TASK = 'task'
+    
+    TARGET_CHOICES = [
+        (TARGET_WORKSPACE, 'Workspace'),
+        (TARGET_TASK, 'Task'),
+    ]
+    
+    target_type = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    target_id = models.PositiveIntegerField()
+    target_name = models.CharField(max_length=200, help_text="Name at the time of deletion")
+    
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name='deletion_jobs',
+        null=True,
+        blank=True,
+    )
+    
+    # Progress
+    comments_deleted = models.PositiveIntegerField(default=0)
+    tasks_deleted = models.PositiveIntegerField(default=0)
+    members_deleted = models.PositiveIntegerField(default=0)
+    
+    # Lease so two reapers never work on the same job
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'Deletion Job'
+        verbose_name_plural = 'Deletion Jobs'
+        indexes = [
+            models.Index(fields=['finished_at', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Delete {self.get_target_type_display().lower()} \"{self.target_name}\""
+    
+    def is_finished(self):
+        return self.finished_at is not None
+
+
+class CloneJob(models.Model):
+    """
+    CloneJob model - tracks the background copy of a workspace into a new one.
+    The copy stays hidden until every row is in, then appears at once; a
+    duplicate is an ordinary workspace, a template is flagged as one.
+    """
+    
+    source_workspace_id = models.PositiveIntegerField()
+    source_name = models.CharField(max_length=200, help_text="Name of the source at the time of the request")
+    # Set once the copy's workspace row exists
+    target_workspace_id = models.PositiveIntegerField(null=True, blank=True)
+    
+    name = models.CharField(max_length=200, help_text="Name of the new workspace")
+    as_template = models.BooleanField(default=False)
+    start_date = models.DateField(
+        null=True,
+        blank=True,
+        help_text="Due dates are shifted so the earliest one falls on this date"
+    )
+    with_comments = models.BooleanField(default=False)
+    with_labels = models.BooleanField(default=False)
+    with_assignments = models.BooleanField(default=False, help_text="Keep assignees and members")
+    
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='clone_jobs',
+    )
+    
+    # Progress
+    tasks_total = models.PositiveIntegerField(default=0)
+    tasks_copied = models.PositiveIntegerField(default=0)
+    comments_copied = models.PositiveIntegerField(default=0)
+    error = models.CharField(max_length=500, blank=True)
+    
+    # Lease so two workers never run the same job
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'Clone Job'
+        verbose_name_plural = 'Clone Jobs'
+        indexes = [
+            models.Index(fields=['finished_at', 'created_at']),
+        ]
+    
+    def __str__(self):
+        kind = 'template' if self.as_template else 'copy'
+        return f"{kind.capitalize()} of \"{self.source_name}\" as \"{self.name}\""
+    
+    def is_finished(self):
+        return self.finished_at is not None
+    
+    def keeps_assignees(self):
+        """Assignees are copied along with the members; templates have neither"""
+        return self.with_assignments and not self.as_template
+    
+    def succeeded(self):
+        return self.is_finished() and not self.error
+    
+    def percent_done(self):
+        if self.is_finished():
+            return 100
+        if not self.tasks_total:
+            return 0
+        # Tasks are the bulk of the work; the last percent is comments and the reveal
+        return min(99, self.tasks_copied * 100 // self.tasks_total)
+
+
+class WorkspaceShard(models.Model):
+    """
+    WorkspaceShard model - directory entry saying which database holds a workspace.
+    A workspace's tasks, comments and memberships always live on the same shard.
+    Workspaces without an entry live on the default database.
+    """
+    
+    STATE_ACTIVE = 'ACTIVE'
+    STATE_COPYING = 'COPYING'
+    STATE_FROZEN = 'FROZEN'
+    
+    STATE_CHOICES = [
+        (STATE_ACTIVE, 'Active'),
+        (STATE_COPYING, 'Copying to another shard'),
+        (STATE_FROZEN, 'Frozen for final copy'),
+    ]
+    
+    workspace_id = models.PositiveIntegerField(unique=True)
+    alias = models.CharField(max_length=100, help_text="Database alias from settings.DATABASES")
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default=STATE_ACTIVE)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Workspace Shard'
+        verbose_name_plural = 'Workspace Shards'
+        indexes = [
+            models.Index(fields=['alias']),
+        ]
+    
+    def __str__(self):
+        return f"Workspace {self.workspace_id} on {self.alias}"
+
+
+class IdSequence(models.Model):
+    """
+    IdSequence model - hands out primary keys that are unique across all shards.
+    Processes reserve ids in blocks, so this row is touched once per block.
+    """
+    
+    name = models.CharField(max_length=100, primary_key=True)
+    next_value = models.BigIntegerField()
+    
+    class Meta:
+        verbose_name = 'ID Sequence'
+        verbose_name_plural = 'ID Sequences'
+    
+    def __str__(self):
+        return f"{self.name} (next {self.next_value})"
@@ -0,0 +1,208 @@
+import logging
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from tasks.models import (
+    Task, Comment, RecurrenceRule, TaskDependency, Label, TaskLabel, Reminder, ArchivedTask, ArchivedComment,
+)
+from workspaces.models import Workspace, WorkspaceMembership, Webhook, WebhookDelivery
+from .deletion import delete_in_batches
+from .models import WorkspaceShard
+from .sharding import forget_workspace, shard_aliases, shard_for_workspace
+
+logger = logging.getLogger(__name__)
+
+
+def workspace_querysets(workspace_id, db):
+    """Rows of a workspace on one shard, parents before children"""
+    return [
+        Task._base_manager.using(db).filter(workspace_id=workspace_id),
+        Comment._base_manager.using(db).filter(task__workspace_id=workspace_id),
+        RecurrenceRule._base_manager.using(db).filter(template__workspace_id=workspace_id),
+        TaskDependency._base_manager.using(db).filter(task__workspace_id=workspace_id),
+        Label._base_manager.using(db).filter(workspace_id=workspace_id),
+        TaskLabel._base_manager.using(db).filter(task__workspace_id=workspace_id),
+        Reminder._base_manager.using(db).filter(task__workspace_id=workspace_id),
+        ArchivedTask._base_manager.using(db).filter(workspace_id=workspace_id),
+        ArchivedComment._base_manager.using(db).filter(task__workspace_id=workspace_id),
+        Webhook._base_manager.using(db).filter(workspace_id=workspace_id),
+        WebhookDelivery._base_manager.using(db).filter(webhook__workspace_id=workspace_id),
+    ]
+
+
+def copy_rows(queryset, target, batch_size):
+    """
+    Upsert the rows of queryset into the target database in primary key order.
+
+    bulk_create re-applies auto_now/auto_now_add, so timestamps are written
+    back with bulk_update. All batches share one transaction, so rows that
+    point at later rows of the same table (recurring task occurrences) pass
+    the deferred foreign key checks. Returns rows copied.
+    """
+    model = queryset.model
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    timestamps = [
+        field.name for field in fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    manager = model._base_manager.db_manager(target)
+    last_pk, copied = 0, 0
+    with transaction.atomic(using=target):
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not rows:
+                return copied
+            originals = [[getattr(row, name) for name in timestamps] for row in rows]
+            manager.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=[model._meta.pk.name],
+                update_fields=[field.name for field in fields],
+            )
+            if timestamps:
+                for row, values in zip(rows, originals):
+                    for name, value in zip(timestamps, values):
+                        setattr(row, name, value)
+                manager.bulk_update(rows, timestamps)
+            last_pk = rows[-1].pk
+            copied += len(rows)
+
+
+def copy_workspace(workspace_id, source, target, batch_size, since=None):
+    """Copy a workspace's rows, or only those changed since ``since``; return rows copied"""
+    copied = 0
+    for queryset in workspace_querysets(workspace_id, source):
+        if since is not None:
+            if queryset.model is ArchivedTask:
+                queryset = queryset.filter(archived_at__gte=since)
+            elif queryset.model is ArchivedComment:
+                queryset = queryset.filter(task__archived_at__gte=since)
+            elif queryset.model in (TaskDependency, TaskLabel):
+                queryset = queryset.filter(created_at__gte=since)
+            elif queryset.model is Reminder:
+                queryset = (
+                    queryset.filter(created_at__gte=since)
+                    | queryset.filter(sent_at__gte=since)
+                    | queryset.filter(failed_at__gte=since)
+                )
+            elif queryset.model is Label:
+                # Counts change without touching updated_at; there are few labels
+                pass
+            elif queryset.model is Task:
+                # deleted_at is set with update(), which doesn't touch updated_at
+                queryset = queryset.filter(updated_at__gte=since) | queryset.filter(deleted_at__isnull=False)
+            else:
+                queryset = queryset.filter(updated_at__gte=since)
+        copied += copy_rows(queryset, target, batch_size)
+    return copied
+
+
+def remove_stale_rows(workspace_id, source, target):
+    """Delete rows from the target that were deleted on the source during the copy"""
+    removed = 0
+    pairs = zip(workspace_querysets(workspace_id, source), workspace_querysets(workspace_id, target))
+    for source_rows, target_rows in reversed(list(pairs)):
+        stale = set(target_rows.values_list('pk', flat=True)) - set(source_rows.values_list('pk', flat=True))
+        if stale:
+            removed += len(stale)
+            target_rows.model._base_manager.using(target).filter(pk__in=stale).delete()
+    return removed
+
+
+def copy_memberships(workspace_id, source, target):
+    """Replace the target's membership rows; their ids are per shard, so they get new ones"""
+    rows = [
+        WorkspaceMembership(workspace_id=workspace_id, user_id=user_id, role=role, joined_at=joined_at)
+        for user_id, role, joined_at in WorkspaceMembership.objects.using(source).filter(
+            workspace_id=workspace_id
+        ).values_list('user_id', 'role', 'joined_at')
+    ]
+    with transaction.atomic(using=target):
+        WorkspaceMembership.objects.using(target).filter(workspace_id=workspace_id).delete()
+        WorkspaceMembership.objects.using(target).bulk_create(rows)
+    return len(rows)
+
+
+def set_state(entry, state):
+    entry.state = state
+    entry.save(update_fields=['state', 'updated_at'])
+
+
+def move_workspace(workspace_id, target, batch_size=1000, grace_seconds=2):
+    """
+    Move a workspace with all its tasks, comments and members to another shard.
+
+    1. Bulk copy to the target while the workspace stays fully usable. The
+       copy is hidden (deleted_at set) so fan-out queries don't list it twice.
+    2. Freeze writes (ShardRoutingMiddleware answers them with 503), wait
+       for in-flight requests, then copy what changed since step 1 started.
+    3. Switch the directory entry, so requests go to the target.
+    4. Purge the rows left behind on the source in batches.
+
+    Returns a dict of counters for reporting.
+    """
+    if target not in shard_aliases():
+        raise ValueError(f'Unknown shard "{target}"')
+    source = shard_for_workspace(workspace_id)
+    if source == target:
+        raise ValueError(f'Workspace {workspace_id} is already on {target}')
+
+    workspace = Workspace._base_manager.using(source).filter(pk=workspace_id).first()
+    if workspace is None:
+        raise ValueError(f'Workspace {workspace_id} does not exist')
+    if workspace.deleted_at is not None:
+        raise ValueError(f'Workspace {workspace_id} is pending deletion')
+
+    entry, _ = WorkspaceShard.objects.get_or_create(
+        workspace_id=workspace_id, defaults={'alias': source},
+    )
+    stats = {'source': source, 'target': target}
+    started = timezone.now()
+    workspace_row = Workspace._base_manager.using(source).filter(pk=workspace_id)
+
+    set_state(entry, WorkspaceShard.STATE_COPYING)
+    try:
+        copy_rows(workspace_row, target, batch_size)
+        Workspace._base_manager.using(target).filter(pk=workspace_id).update(deleted_at=started)
+        stats['copied'] = copy_workspace(workspace_id, source, target, batch_size)
+
+        set_state(entry, WorkspaceShard.STATE_FROZEN)
+        forget_workspace(workspace_id)
+        time.sleep(grace_seconds)
+
+        frozen_at = time.perf_counter()
+        copy_rows(workspace_row, target, batch_size)
+        Workspace._base_manager.using(target).filter(pk=workspace_id).update(deleted_at=started)
+        stats['delta'] = copy_workspace(workspace_id, source, target, batch_size, since=started)
+        stats['removed'] = remove_stale_rows(workspace_id, source, target)
+        stats['members'] = copy_memberships(workspace_id, source, target)
+
+        # Switch over: show the target copy, hide the source, repoint the directory
+        Workspace._base_manager.using(target).filter(pk=workspace_id).update(deleted_at=None)
+        Workspace._base_manager.using(source).filter(pk=workspace_id).update(deleted_at=timezone.now())
+        entry.alias = target
+        entry.state = WorkspaceShard.STATE_ACTIVE
+        entry.save(update_fields=['alias', 'state', 'updated_at'])
+        forget_workspace(workspace_id)
+        stats['frozen_seconds'] = time.perf_counter() - frozen_at
+    except Exception:
+        # The source copy is untouched until the switch, so simply keep using it
+        Workspace._base_manager.using(source).filter(pk=workspace_id).update(deleted_at=None)
+        set_state(entry, WorkspaceShard.STATE_ACTIVE)
+        forget_workspace(workspace_id)
+        Workspace._base_manager.using(target).filter(pk=workspace_id).update(deleted_at=started)
+        raise
+
+    purged = 0
+    for queryset in reversed(workspace_querysets(workspace_id, source)):
+        purged += sum(delete_in_batches(queryset, batch_size))
+    purged += sum(delete_in_batches(
+        WorkspaceMembership.objects.using(source).filter(workspace_id=workspace_id), batch_size,
+    ))
+    workspace_row.delete()
+    stats['purged'] = purged
+
+    logger.info('Moved workspace %s from %s to %s: %s', workspace_id, source, target, stats)
+    return stats
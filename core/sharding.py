@@ -0,0 +1,383 @@
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from heapq import merge
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, models, transaction
+from django.db.models import Count, Max
+
+from .metrics import record_cache
+
+
+# Models whose rows live on their workspace's shard. Everything else (users,
+# sessions, allauth, deletion jobs, the shard directory itself) stays global
+# on the default database.
+SHARDED_MODELS = {
+    'workspaces.workspace',
+    'workspaces.workspacemembership',
+    'workspaces.webhook',
+    'workspaces.webhookdelivery',
+    'workspaces.change',
+    'tasks.task',
+    'tasks.comment',
+    'tasks.recurrencerule',
+    'tasks.taskdependency',
+    'tasks.label',
+    'tasks.tasklabel',
+    'tasks.reminder',
+    'tasks.reminderscan',
+    'tasks.archivedtask',
+    'tasks.archivedcomment',
+}
+
+# Rows that may move between shards need ids that are unique across all of them
+GLOBAL_ID_MODELS = {
+    'workspaces.workspace',
+    'workspaces.webhook',
+    'workspaces.webhookdelivery',
+    'tasks.task',
+    'tasks.comment',
+    'tasks.recurrencerule',
+    'tasks.taskdependency',
+    'tasks.label',
+    'tasks.tasklabel',
+    'tasks.reminder',
+}
+
+DIRECTORY_CACHE_TIMEOUT = 300
+
+current_shard = ContextVar('current_shard', default=None)
+
+_id_blocks = {}
+_id_lock = threading.Lock()
+_shard_executor = None
+
+
+class WorkspaceMoving(Exception):
+    """Raised when writing to a workspace that is frozen for a shard move"""
+
+
+def shard_aliases():
+    return settings.WORKSPACE_SHARDS
+
+
+def sharding_enabled():
+    return len(shard_aliases()) > 1
+
+
+def model_label(model):
+    """'app_label.modelname' of a model class or instance"""
+    return model._meta.label_lower
+
+
+def is_sharded(model):
+    return model_label(model) in SHARDED_MODELS
+
+
+@contextmanager
+def use_shard(alias):
+    """Route sharded queries without an instance hint to ``alias``"""
+    token = current_shard.set(alias)
+    try:
+        yield
+    finally:
+        current_shard.reset(token)
+
+
+def on_shard_of(queryset, instance):
+    """Run a queryset on the database the given sharded instance was loaded from"""
+    if sharding_enabled() and instance._state.db:
+        return queryset.using(instance._state.db)
+    return queryset
+
+
+# Directory
+
+def directory_key(workspace_id):
+    return f'shard:workspace:{workspace_id}'
+
+
+def get_directory_entry(workspace_id):
+    from .models import WorkspaceShard
+    return WorkspaceShard.objects.using('default').filter(workspace_id=workspace_id).first()
+
+
+def shard_for_workspace(workspace_id):
+    """
+    Return the alias of the database holding a workspace.
+
+    Workspaces created before sharding was enabled have no directory entry
+    and stay on the default database.
+    """
+    if not sharding_enabled() or workspace_id is None:
+        return 'default'
+    alias = cache.get(directory_key(workspace_id))
+    record_cache('shard_directory', hits=alias is not None, misses=alias is None)
+    if alias is None:
+        entry = get_directory_entry(workspace_id)
+        alias = entry.alias if entry else 'default'
+        cache.set(directory_key(workspace_id), alias, DIRECTORY_CACHE_TIMEOUT)
+    return alias
+
+
+def forget_workspace(workspace_id):
+    cache.delete(directory_key(workspace_id))
+
+
+def choose_shard():
+    """Pick the shard with the fewest workspaces for a new one"""
+    from .models import WorkspaceShard
+    counts = dict(
+        WorkspaceShard.objects.using('default').values_list('alias').annotate(total=Count('pk'))
+    )
+    return min(shard_aliases(), key=lambda alias: counts.get(alias, 0))
+
+
+def place_workspace(workspace):
+    """Give a new workspace a global id and a home shard; return the alias"""
+    from .models import WorkspaceShard
+    alias = choose_shard()
+    workspace.pk = allocate_id(model_label(workspace))
+    WorkspaceShard.objects.using('default').create(workspace_id=workspace.pk, alias=alias)
+    cache.set(directory_key(workspace.pk), alias, DIRECTORY_CACHE_TIMEOUT)
+    return alias
+
+
+def unplace_workspace(workspace):
+    """Undo place_workspace for a workspace whose insert failed"""
+    from .models import WorkspaceShard
+    WorkspaceShard.objects.using('default').filter(workspace_id=workspace.pk).delete()
+    forget_workspace(workspace.pk)
+    workspace.pk = None
+
+
+def check_writable(workspace_id):
+    """Refuse writes to a workspace in the final phase of a shard move"""
+    from .models import WorkspaceShard
+    if not sharding_enabled() or workspace_id is None:
+        return
+    entry = get_directory_entry(workspace_id)
+    if entry is not None and entry.state == WorkspaceShard.STATE_FROZEN:
+        raise WorkspaceMoving(f'Workspace {workspace_id} is being moved to another shard')
+
+
+# Locating rows by primary key
+
+def locate_key(label, pk):
+    return f'shard:locate:{label}:{pk}'
+
+
+def workspace_of(model, pk, lookup='workspace_id'):
+    """
+    Find which workspace a task or comment belongs to.
+
+    Rows never change workspace, so the answer is cached indefinitely; the
+    workspace's shard is then read from the directory, which stays correct
+    after moves. Returns None if no shard holds the row.
+    """
+    if pk is None:
+        return None
+    key = locate_key(model_label(model), pk)
+    workspace_id = cache.get(key)
+    record_cache('shard_locate', hits=workspace_id is not None, misses=workspace_id is None)
+    if workspace_id is None:
+        for alias in shard_aliases():
+            workspace_id = model._base_manager.using(alias).filter(pk=pk).values_list(
+                lookup, flat=True
+            ).first()
+            if workspace_id is not None:
+                cache.set(key, workspace_id, None)
+                break
+    return workspace_id
+
+
+def task_workspace(task_id):
+    """Workspace id of a live or archived task"""
+    from tasks.models import Task, ArchivedTask
+    workspace_id = workspace_of(Task, task_id)
+    if workspace_id is None:
+        workspace_id = workspace_of(ArchivedTask, task_id)
+    return workspace_id
+
+
+def comment_workspace(comment_id):
+    from tasks.models import Comment
+    return workspace_of(Comment, comment_id, 'task__workspace_id')
+
+
+def shard_for_task(task_id):
+    if not sharding_enabled():
+        return 'default'
+    return shard_for_workspace(task_workspace(task_id))
+
+
+# Views addressing a comment by pk; other tasks:* views with a pk address a task
+COMMENT_VIEWS = {'tasks:edit_comment', 'tasks:delete_comment'}
+
+
+def workspace_for_view(view_name, kwargs):
+    """Workspace a request is about, judged from its URL; None for cross-workspace views"""
+    if 'workspace_id' in kwargs:
+        return kwargs['workspace_id']
+    if 'task_id' in kwargs:
+        return task_workspace(kwargs['task_id'])
+    pk = kwargs.get('pk')
+    if pk is None or not view_name:
+        return None
+    namespace = view_name.partition(':')[0]
+    if namespace == 'workspaces':
+        return pk
+    if view_name in COMMENT_VIEWS:
+        return comment_workspace(pk)
+    if namespace == 'tasks':
+        return task_workspace(pk)
+    return None
+
+
+def shard_for_instance(instance):
+    """Work out the shard of a (possibly unsaved) sharded instance; None if it has none yet"""
+    if instance._state.db and not instance._state.adding:
+        return instance._state.db
+    if model_label(instance) == 'workspaces.workspace':
+        # New workspaces are placed by Workspace.save, not here
+        if instance.pk is None:
+            return None
+        return shard_for_workspace(instance.pk)
+    workspace_id = getattr(instance, 'workspace_id', None)
+    if workspace_id is not None:
+        return shard_for_workspace(workspace_id)
+    task_id = getattr(instance, 'task_id', None)
+    if task_id is not None:
+        return shard_for_task(task_id)
+    return None
+
+
+# Global ids
+
+def reserve_ids(label, count):
+    """Reserve ``count`` consecutive ids for a model; return the first one"""
+    from django.apps import apps
+    from .models import IdSequence
+    with transaction.atomic(using='default'):
+        sequence = IdSequence.objects.using('default').select_for_update().filter(name=label).first()
+        if sequence is None:
+            # Start above every id handed out before sharding was enabled
+            model = apps.get_model(label)
+            highest = max(
+                model._base_manager.using(alias).aggregate(highest=Max('pk'))['highest'] or 0
+                for alias in shard_aliases()
+            )
+            sequence = IdSequence.objects.using('default').create(name=label, next_value=highest + 1)
+        first = sequence.next_value
+        sequence.next_value += count
+        sequence.save(using='default', update_fields=['next_value'])
+    return first
+
+
+def allocate_id(label):
+    """Next id from this process's block, reserving a new block when it runs out"""
+    with _id_lock:
+        block = _id_blocks.get(label)
+        if block is None or block[0] >= block[1]:
+            size = settings.SHARD_ID_BLOCK_SIZE
+            first = reserve_ids(label, size)
+            block = _id_blocks[label] = [first, first + size]
+        value = block[0]
+        block[0] += 1
+    return value
+
+
+def assign_global_id(sender, instance, **kwargs):
+    """pre_save receiver: give a new row its global id right before the insert"""
+    if instance.pk is None and sharding_enabled() and model_label(sender) in GLOBAL_ID_MODELS:
+        instance.pk = allocate_id(model_label(sender))
+
+
+def assign_ids(model, objs):
+    """Give unsaved objects global ids ahead of bulk_create"""
+    label = model_label(model)
+    if not sharding_enabled() or label not in GLOBAL_ID_MODELS:
+        return
+    for obj in objs:
+        if obj.pk is None:
+            obj.pk = allocate_id(label)
+
+
+class ShardedQuerySet(models.QuerySet):
+    """QuerySet whose create/bulk_create assign global ids and find the right shard"""
+
+    def create(self, **kwargs):
+        # QuerySet.create saves with using=self.db, which routes without the
+        # instance; let save() route with it, so e.g. a task follows its workspace
+        if self._db is None and sharding_enabled():
+            obj = self.model(**kwargs)
+            obj.save(force_insert=True)
+            return obj
+        return super().create(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        if objs and sharding_enabled():
+            assign_ids(self.model, objs)
+            if self._db is None and current_shard.get() is None:
+                alias = shard_for_instance(objs[0])
+                if alias is not None:
+                    return super(ShardedQuerySet, self.using(alias)).bulk_create(objs, *args, **kwargs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+
+# Fan-out
+
+def get_shard_executor():
+    global _shard_executor
+    if _shard_executor is None:
+        _shard_executor = ThreadPoolExecutor(
+            max_workers=len(shard_aliases()),
+            thread_name_prefix='shard',
+        )
+    return _shard_executor
+
+
+def _run_on_shard(alias, func):
+    close_old_connections()
+    try:
+        with use_shard(alias):
+            return func()
+    finally:
+        close_old_connections()
+
+
+def fan_out(func):
+    """
+    Call ``func`` once per shard, concurrently, and return the results in
+    shard order. Without sharding it simply runs inline on the default
+    database. ``func`` must fully evaluate its querysets before returning.
+    """
+    if not sharding_enabled():
+        return [func()]
+    executor = get_shard_executor()
+    futures = [
+        executor.submit(contextvars.copy_context().run, _run_on_shard, alias, func)
+        for alias in shard_aliases()
+    ]
+    return [future.result() for future in futures]
+
+
+def merge_sorted(results, key, reverse=False, limit=None):
+    """Merge per-shard lists that are each already sorted by ``key``"""
+    merged = merge(*results, key=key, reverse=reverse)
+    return list(islice(merged, limit))
+
+
+def sum_counts(results):
+    """Add up per-shard dicts of counts (e.g. from aggregate())"""
+    totals = {}
+    for result in results:
+        for name, value in result.items():
+            totals[name] = totals.get(name, 0) + (value or 0)
+    return totals
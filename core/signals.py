@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+
+# Sent by CompressionMiddleware once a response body has been fully compressed.
+# Arguments: request, encoding, original_size, compressed_size
+response_compressed = Signal()
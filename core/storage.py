@@ -0,0 +1,61 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional, gzip variants are always written
+    brotli = None
+
+
+# Only text formats benefit from compression; images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico',
+}
+
+# Variants that don't save at least this fraction are skipped
+MIN_COMPRESSION_SAVING = 0.05
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Fingerprint static files and precompress them at collectstatic time.
+
+    Next to every hashed text asset a ``.gz`` (and ``.br`` when Brotli is
+    installed) variant is written, so StaticFilesMiddleware can serve the
+    smallest encoding a client accepts without compressing per request.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+
+        for name in self.hashed_files.values():
+            if self.is_compressible(name):
+                for compressed_name in self.compress(name):
+                    yield name, compressed_name, True
+
+    def is_compressible(self, name):
+        return os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+    def compress(self, name):
+        """Write compressed variants of a stored file, return the new names"""
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        # mtime=0 keeps the output byte-identical across collectstatic runs
+        variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content)))
+
+        written = []
+        for suffix, compressed in variants:
+            if len(compressed) > len(content) * (1 - MIN_COMPRESSION_SAVING):
+                continue
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(name + suffix)
+        return written
@@ -0,0 +1,146 @@
+from datetime import datetime, timezone
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, router
+from django.test import Client, RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+
+from accounts.models import User
+from tasks.models import Task
+from workspaces.models import Workspace, WorkspaceMembership
+from . import sharding
+from .models import WorkspaceShard
+from .resharding import move_workspace
+from .throttling import check_rate_limits
+
+
+@override_settings(RATE_LIMITS={'tasks:add_comment': {'user': '2/m', 'ip': '3/m', 'route': '10/m'}})
+class RateLimitTests(SimpleTestCase):
+    """Token buckets per user, per IP and for the whole route"""
+
+    def setUp(self):
+        cache.clear()
+        self.now = 1000.0
+
+    def check(self, user_id, ip):
+        request = RequestFactory().post('/', REMOTE_ADDR=ip)
+        request.user = User(pk=user_id)
+        return check_rate_limits(request, 'tasks:add_comment', now=self.now)
+
+    def test_limits_apply_per_user(self):
+        self.assertEqual([self.check(1, '10.0.0.1') for _ in range(2)], [0, 0])
+        self.assertGreater(self.check(1, '10.0.0.1'), 0)
+        self.assertEqual(self.check(2, '10.0.0.1'), 0)
+
+    def test_refused_requests_take_no_shared_tokens(self):
+        refused = sum(self.check(1, '10.0.0.1') > 0 for _ in range(12))
+        self.assertEqual(refused, 10)
+        # The route bucket still holds the 8 tokens user 1 didn't get to use
+        for user_id in range(2, 10):
+            self.assertEqual(self.check(user_id, f'10.0.1.{user_id}'), 0)
+        self.assertGreater(self.check(10, '10.0.1.10'), 0)
+
+    def test_tokens_come_back(self):
+        self.check(1, '10.0.0.1')
+        self.check(1, '10.0.0.1')
+        self.assertAlmostEqual(self.check(1, '10.0.0.1'), 30)
+        self.now += 30
+        self.assertEqual(self.check(1, '10.0.0.1'), 0)
+
+
+@skipUnless('shard_1' in settings.DATABASES, 'set DATABASE_SHARD_URLS to test sharding')
+@override_settings(WORKSPACE_SHARDS=['default', 'shard_1'])
+class ShardingTests(TransactionTestCase):
+    """Placement, routing and fan-out over two shards (fan-out threads need committed rows)"""
+
+    # The runner sets up every listed alias, even for skipped classes
+    databases = {'default', 'shard_1'} & set(settings.DATABASES)
+
+    def setUp(self):
+        cache.clear()
+        # Blocks reserved by earlier tests point at sequences that were flushed
+        sharding._id_blocks.clear()
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+
+    def test_save_places_a_new_workspace_and_routing_only_reads(self):
+        workspace = Workspace(name='A', owner=self.user)
+        router.db_for_write(Workspace, instance=workspace)
+        self.assertIsNone(workspace.pk)
+        self.assertFalse(WorkspaceShard.objects.exists())
+
+        workspace.save()
+        other = Workspace.objects.create(name='B', owner=self.user)
+        self.assertEqual({workspace._state.db, other._state.db}, {'default', 'shard_1'})
+        for placed in (workspace, other):
+            alias = placed._state.db
+            self.assertEqual(WorkspaceShard.objects.get(workspace_id=placed.pk).alias, alias)
+            self.assertEqual(sharding.shard_for_workspace(placed.pk), alias)
+            self.assertTrue(WorkspaceMembership.objects.using(alias).filter(
+                workspace_id=placed.pk, user_id=self.user.pk, role=WorkspaceMembership.ROLE_OWNER,
+            ).exists())
+
+        # Rows follow their workspace, with ids unique across shards
+        first = Task.objects.create(workspace=workspace, title='1', created_by=self.user)
+        second = Task.objects.create(workspace=other, title='2', created_by=self.user)
+        self.assertEqual(first._state.db, workspace._state.db)
+        self.assertEqual(second._state.db, other._state.db)
+        self.assertNotEqual(first.pk, second.pk)
+
+    def test_failed_insert_releases_the_placement(self):
+        workspace = Workspace(name='A')
+        with self.assertRaises(IntegrityError):
+            workspace.save()
+        self.assertIsNone(workspace.pk)
+        self.assertFalse(WorkspaceShard.objects.exists())
+
+    def test_fan_out_merges_shards_in_order(self):
+        days = [3, 1, 4, 2]
+        for day in days:
+            workspace = Workspace.objects.create(name=f'Day {day}', owner=self.user)
+            Workspace.objects.using(workspace._state.db).filter(pk=workspace.pk).update(
+                created_at=datetime(2026, 1, day, tzinfo=timezone.utc),
+            )
+
+        results = sharding.fan_out(lambda: list(
+            Workspace.objects.filter(members=self.user).order_by('-created_at')
+        ))
+        self.assertEqual([len(result) for result in results], [2, 2])
+        merged = sharding.merge_sorted(results, key=lambda workspace: workspace.created_at, reverse=True)
+        self.assertEqual([workspace.name for workspace in merged], ['Day 4', 'Day 3', 'Day 2', 'Day 1'])
+
+    def test_move_keeps_rows_and_members_and_refuses_writes_while_frozen(self):
+        workspace = Workspace.objects.create(name='A', owner=self.user)
+        self.assertEqual(workspace._state.db, 'default')
+        member = User.objects.create_user('member', 'member@example.com', 'pw')
+        WorkspaceMembership.objects.using('default').create(
+            workspace=workspace, user=member, role=WorkspaceMembership.ROLE_ADMIN,
+        )
+        tasks = [Task.objects.create(workspace=workspace, title=str(i), created_by=self.user) for i in range(3)]
+        client = Client()
+        client.force_login(self.user)
+        toggle = f'/tasks/{tasks[0].pk}/toggle-status/'
+
+        frozen_responses = []
+        with mock.patch('core.resharding.time.sleep', lambda seconds: frozen_responses.append(
+            client.post(toggle).status_code
+        )):
+            move_workspace(workspace.pk, 'shard_1', grace_seconds=0)
+
+        self.assertEqual(frozen_responses, [503])
+        self.assertEqual(sharding.shard_for_workspace(workspace.pk), 'shard_1')
+        self.assertEqual(
+            set(Task.objects.using('shard_1').filter(workspace_id=workspace.pk).values_list('pk', flat=True)),
+            {task.pk for task in tasks},
+        )
+        self.assertFalse(Task.all_objects.using('default').filter(workspace_id=workspace.pk).exists())
+        self.assertEqual(
+            set(WorkspaceMembership.objects.using('shard_1').filter(
+                workspace_id=workspace.pk,
+            ).values_list('user_id', 'role')),
+            {(self.user.pk, WorkspaceMembership.ROLE_OWNER), (member.pk, WorkspaceMembership.ROLE_ADMIN)},
+        )
+
+        # Writes go through again, to the new shard
+        self.assertEqual(client.post(toggle).status_code, 302)
+        self.assertEqual(Task.objects.using('shard_1').get(pk=tasks[0].pk).status, Task.STATUS_IN_PROGRESS)
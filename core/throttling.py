@@ -0,0 +1,194 @@
+import math
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+RATE_PATTERN = re.compile(r'^(\d+)/(\d*)([smhd])$')
+PERIOD_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+OUTCOMES = ('allowed', 'limited')
+
+
+def parse_rate(rate):
+    """Turn '30/m' or '10/15s' into (requests, period in seconds)"""
+    match = RATE_PATTERN.match(rate.replace(' ', ''))
+    if not match:
+        raise ValueError(f'Invalid rate "{rate}", expected e.g. "30/m" or "10/15s"')
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * PERIOD_SECONDS[unit]
+
+
+def next_arrival(arrival, rate, now):
+    """
+    Where a bucket goes if it hands out one more token: returns (seconds to
+    wait, new arrival time); a positive wait means the bucket is empty.
+
+    A bucket is kept as a GCRA "theoretical arrival time": a single float
+    per key, refilled continuously at ``count / period`` and holding at most
+    ``count`` tokens, so bursts up to the limit pass and sustained traffic
+    is smoothed.
+    """
+    count, period = parse_rate(rate)
+    interval = period / count
+    arrival = max(arrival if arrival is not None else now, now)
+    wait = arrival + interval - now - period
+    # Allow for float rounding, so a full bucket really holds ``count`` tokens
+    if wait > 1e-6:
+        return wait, arrival
+    return 0, arrival + interval
+
+
+def bucket_timeout(rate):
+    return math.ceil(parse_rate(rate)[1]) + 1
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def bucket_keys(request, view_name, limits):
+    """Yield (scope, cache key, rate) for every bucket a request draws from"""
+    for scope, rate in limits.items():
+        if scope == 'user':
+            if not request.user.is_authenticated:
+                continue
+            ident = request.user.pk
+        elif scope == 'ip':
+            ident = client_ip(request)
+        elif scope == 'route':
+            ident = '*'
+        else:
+            raise ValueError(f'Unknown rate limit scope "{scope}"')
+        yield scope, f'ratelimit:bucket:{view_name}:{scope}:{ident}', rate
+
+
+def check_rate_limits(request, view_name, now=None):
+    """
+    Return seconds to wait if the request exceeds any of its view's limits, else 0.
+
+    Every bucket is checked first and tokens are only taken when all of them
+    allow the request, so a client refused by its own bucket doesn't drain
+    the buckets it shares with others (its IP's, the route's).
+
+    Read and write are separate cache calls, so concurrent requests may
+    overshoot a limit by a request or two; that is fine for throttling.
+    """
+    limits = settings.RATE_LIMITS.get(view_name)
+    if not limits:
+        return 0
+
+    now = time.time() if now is None else now
+    buckets = list(bucket_keys(request, view_name, limits))
+    arrivals = cache.get_many([key for _, key, _ in buckets])
+    retry_after = 0
+    taken = []
+    for scope, key, rate in buckets:
+        wait, arrival = next_arrival(arrivals.get(key), rate, now)
+        if wait:
+            count(view_name, scope, 'limited')
+            retry_after = max(retry_after, wait)
+        else:
+            taken.append((scope, key, rate, arrival))
+    if retry_after:
+        return retry_after
+
+    for scope, key, rate, arrival in taken:
+        cache.set(key, arrival, bucket_timeout(rate))
+        count(view_name, scope, 'allowed')
+    return 0
+
+
+# Counters
+
+def counter_key(view_name, scope, outcome):
+    return f'ratelimit:count:{view_name}:{scope}:{outcome}'
+
+
+def count(view_name, scope, outcome):
+    key = counter_key(view_name, scope, outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def get_counters():
+    """Allowed/limited/shed counts for every configured view, for tuning limits"""
+    keys = {
+        counter_key(view_name, scope, outcome): (view_name, scope, outcome)
+        for view_name, limits in settings.RATE_LIMITS.items()
+        for scope in limits
+        for outcome in OUTCOMES
+    }
+    keys.update({
+        counter_key(view_name, 'load', 'shed'): (view_name, 'load', 'shed')
+        for view_name in settings.LOAD_SHED_VIEWS
+    })
+    values = cache.get_many(list(keys))
+    counters = {}
+    for key, (view_name, scope, outcome) in keys.items():
+        counters.setdefault(view_name, {}).setdefault(scope, {})[outcome] = values.get(key, 0)
+    return counters
+
+
+# Load shedding
+
+class LatencyMonitor:
+    """
+    Exponentially weighted average of query durations in this process.
+
+    Installed as an execute wrapper on every database connection, so it sees
+    queries from request threads and from the async views' query pool alike.
+    """
+
+    def __init__(self, alpha=0.1, stale_after=30):
+        self.alpha = alpha
+        self.stale_after = stale_after
+        self.average = 0.0
+        self.updated_at = 0.0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(time.perf_counter() - started)
+
+    def record(self, seconds):
+        with self.lock:
+            if self.updated_at:
+                self.average += self.alpha * (seconds - self.average)
+            else:
+                self.average = seconds
+            self.updated_at = time.monotonic()
+
+    def latency_ms(self):
+        """Current average in milliseconds; 0 once no query has run for a while"""
+        if time.monotonic() - self.updated_at > self.stale_after:
+            return 0.0
+        return self.average * 1000
+
+
+latency_monitor = LatencyMonitor()
+
+
+def install_latency_monitor(sender, connection, **kwargs):
+    """connection_created receiver; adds the monitor to each new connection"""
+    if latency_monitor not in connection.execute_wrappers:
+        connection.execute_wrappers.append(latency_monitor)
+
+
+def should_shed(view_name):
+    """Check if a non-critical view should be refused while the database is slow"""
+    if view_name not in settings.LOAD_SHED_VIEWS:
+        return False
+    if latency_monitor.latency_ms() <= settings.LOAD_SHED_LATENCY_MS:
+        return False
+    count(view_name, 'load', 'shed')
+    return True
@@ -6,5 +6,9 @@ app_name = 'core'
 urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('my-tasks/', views.my_tasks, name='my_tasks'),
+    path('my-tasks/calendar/', views.my_calendar, name='my_calendar'),
+    path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
     path('search/', views.search, name='search'),
+    path('ops/rate-limits/', views.rate_limit_stats, name='rate_limit_stats'),
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -1,68 +1,109 @@
-from django.shortcuts import render
+import hmac
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render, get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q, Count
-from workspaces.models import Workspace
-from tasks.models import Task
+from django.db.models import Q, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+from accounts.models import User
+from workspaces.models import Workspace, WorkspaceMembership
+from tasks.calendars import (
+    VIEW_CHOICES, VIEW_MONTH, calendar_range, feed_etag, fill_weeks, iter_feed, parse_day, tasks_due_between,
+)
+from tasks.labels import MATCH_ANY, MATCH_CHOICES, filter_by_labels
+from tasks.models import Task, Label
 from django.utils import timezone
+from .concurrency import gather_queries
+from .metrics import collect_gauges, load_snapshots, render as render_metrics
+from .sharding import fan_out, merge_sorted, sum_counts
+from .throttling import get_counters, latency_monitor
 
 
 @login_required
-def dashboard(request):
+async def dashboard(request):
     """Main dashboard view"""
-    user = request.user
+    user = await request.auser()
+    today = timezone.now().date()
+    
+    user_workspaces = Workspace.objects.filter(members=user)
+    user_tasks = Task.objects.filter(Q(assigned_to=user) | Q(created_by=user))
+    
+    # Per-workspace counts as subqueries, so the template doesn't query per row
+    member_counts = WorkspaceMembership.objects.filter(
+        workspace=OuterRef('pk')
+    ).order_by().values('workspace').annotate(total=Count('pk')).values('total')
+    task_counts = Task.objects.filter(
+        workspace=OuterRef('pk')
+    ).order_by().values('workspace').annotate(total=Count('pk')).values('total')
+    
+    def get_workspaces():
+        # Latest 5 from every shard, merged into the latest 5 overall
+        workspaces = merge_sorted(fan_out(lambda: list(
+            user_workspaces.annotate(
+                num_members=Coalesce(Subquery(member_counts), 0),
+                num_tasks=Coalesce(Subquery(task_counts), 0),
+            )[:5]
+        )), key=lambda workspace: workspace.created_at, reverse=True, limit=5)
+        for workspace in workspaces:
+            workspace.is_owner_by_user = workspace.owner_id == user.pk
+        return workspaces
+    
+    def get_my_tasks():
+        # Users live on the default database, so they are prefetched rather than joined
+        return merge_sorted(fan_out(lambda: list(
+            user_tasks.select_related('workspace').prefetch_related('assigned_to')[:10]
+        )), key=lambda task: task.created_at, reverse=True, limit=10)
+    
+    def get_task_stats():
+        return sum_counts(fan_out(lambda: user_tasks.aggregate(
+            total=Count('pk'),
+            todo=Count('pk', filter=Q(status=Task.STATUS_TODO)),
+            in_progress=Count('pk', filter=Q(status=Task.STATUS_IN_PROGRESS)),
+            done=Count('pk', filter=Q(status=Task.STATUS_DONE)),
+            overdue=Count('pk', filter=Q(
+                due_date__lt=today,
+                status__in=[Task.STATUS_TODO, Task.STATUS_IN_PROGRESS],
+            )),
+        )))
+    
+    def get_overdue_tasks():
+        return merge_sorted(fan_out(lambda: list(user_tasks.filter(
+            due_date__lt=today,
+            status__in=[Task.STATUS_TODO, Task.STATUS_IN_PROGRESS]
+        )[:3])), key=lambda task: task.created_at, reverse=True, limit=3)
     
-    # Get user's workspaces
-    workspaces = Workspace.objects.filter(
-        Q(owner=user) | Q(members=user)
-    ).distinct()[:5]  # Latest 5
-
-    for workspace in workspaces:
-        workspace.is_owner_by_user = workspace.is_owner(user)
-    
-    # Get user's tasks (assigned or created)
-    my_tasks = Task.objects.filter(
-        Q(assigned_to=user) | Q(created_by=user)
-    ).distinct().select_related('workspace', 'assigned_to')[:10]
-    
-    # Task statistics
-    total_tasks = Task.objects.filter(
-        Q(assigned_to=user) | Q(created_by=user)
-    ).distinct().count()
-    
-    todo_tasks = Task.objects.filter(
-        Q(assigned_to=user) | Q(created_by=user),
-        status=Task.STATUS_TODO
-    ).distinct().count()
-    
-    in_progress_tasks = Task.objects.filter(
-        Q(assigned_to=user) | Q(created_by=user),
-        status=Task.STATUS_IN_PROGRESS
-    ).distinct().count()
-    
-    done_tasks = Task.objects.filter(
-        Q(assigned_to=user) | Q(created_by=user),
-        status=Task.STATUS_DONE
-    ).distinct().count()
-    
-    # Overdue tasks
-    overdue_tasks = Task.objects.filter(
-        Q(assigned_to=user) | Q(created_by=user),
-        due_date__lt=timezone.now().date(),
-        status__in=[Task.STATUS_TODO, Task.STATUS_IN_PROGRESS]
-    ).distinct()
+    def get_workspace_count():
+        return sum(fan_out(lambda: user_workspaces.count()))
+    
+    # Independent queries run concurrently instead of one after another
+    workspaces, my_tasks, stats, overdue_tasks, total_workspaces = await gather_queries(
+        get_workspaces,
+        get_my_tasks,
+        get_task_stats,
+        get_overdue_tasks,
+        get_workspace_count,
+    )
     
     context = {
         'workspaces': workspaces,
         'my_tasks': my_tasks,
-        'total_tasks': total_tasks,
-        'todo_tasks': todo_tasks,
-        'in_progress_tasks': in_progress_tasks,
-        'done_tasks': done_tasks,
+        'total_tasks': stats['total'],
+        'todo_tasks': stats['todo'],
+        'in_progress_tasks': stats['in_progress'],
+        'done_tasks': stats['done'],
         'overdue_tasks': overdue_tasks,
-        'total_workspaces': workspaces.count(),
+        'overdue_count': stats['overdue'],
+        'total_workspaces': total_workspaces,
     }
     
-    return render(request, 'core/dashboard.html', context)
+    # Rendering touches the session (messages), which is sync-only
+    return await sync_to_async(render)(request, 'core/dashboard.html', context)
 
 
 @login_required
@@ -73,33 +114,61 @@ def my_tasks(request):
     # Get filter parameters
     status_filter = request.GET.get('status', '')
     priority_filter = request.GET.get('priority', '')
-    
-    # Base queryset
-    tasks = Task.objects.filter(
-        Q(assigned_to=user) | Q(created_by=user)
-    ).distinct().select_related('workspace', 'assigned_to', 'created_by')
+    label_filter = request.GET.getlist('labels')
+    match_filter = request.GET.get('match', MATCH_ANY)
     
     # Apply filters
-    if status_filter:
-        tasks = tasks.filter(status=status_filter)
+    filtered = Task.objects.all()
+    if status_filter.isdigit():
+        filtered = filtered.filter(status=status_filter)
+    
+    if priority_filter.isdigit():
+        filtered = filtered.filter(priority=priority_filter)
+    
+    # Labels belong to workspaces, so across workspaces they are matched by name
+    if label_filter:
+        filtered = filter_by_labels(filtered, names=label_filter, match=match_filter)
     
-    if priority_filter:
-        tasks = tasks.filter(priority=priority_filter)
+    tasks = filtered.filter(Q(assigned_to=user) | Q(created_by=user)).distinct()
+    label_names = sorted(set().union(*fan_out(lambda: set(
+        Label.objects.filter(
+            workspace__members=user
+        ).values_list('name', flat=True)
+    ))))
     
-    # Statistics
-    total_count = tasks.count()
-    todo_count = tasks.filter(status=Task.STATUS_TODO).count()
-    in_progress_count = tasks.filter(status=Task.STATUS_IN_PROGRESS).count()
-    done_count = tasks.filter(status=Task.STATUS_DONE).count()
+    # Statistics, one aggregate per shard
+    stats = sum_counts(fan_out(lambda: tasks.aggregate(
+        total=Count('pk'),
+        todo=Count('pk', filter=Q(status=Task.STATUS_TODO)),
+        in_progress=Count('pk', filter=Q(status=Task.STATUS_IN_PROGRESS)),
+        done=Count('pk', filter=Q(status=Task.STATUS_DONE)),
+    )))
+    
+    # Assigned and created tasks are read apart, each in LIST_ORDERING straight
+    # from its user's index, and merged; users are prefetched from the default database
+    def task_lists(queryset):
+        return fan_out(lambda: list(queryset.order_by(*Task.LIST_ORDERING).select_related(
+            'workspace'
+        ).prefetch_related('assigned_to', 'created_by', 'labels')))
+    
+    task_list = merge_sorted(
+        task_lists(filtered.filter(assigned_to=user))
+        + task_lists(filtered.filter(created_by=user).exclude(assigned_to=user)),
+        key=Task.list_sort_key,
+    )
     
     context = {
-        'tasks': tasks,
-        'total_count': total_count,
-        'todo_count': todo_count,
-        'in_progress_count': in_progress_count,
-        'done_count': done_count,
+        'tasks': task_list,
+        'total_count': stats['total'],
+        'todo_count': stats['todo'],
+        'in_progress_count': stats['in_progress'],
+        'done_count': stats['done'],
         'status_filter': status_filter,
         'priority_filter': priority_filter,
+        'label_filter': label_filter,
+        'match_filter': match_filter,
+        'label_names': label_names,
+        'MATCH_CHOICES': MATCH_CHOICES,
         'STATUS_CHOICES': Task.STATUS_CHOICES,
         'PRIORITY_CHOICES': Task.PRIORITY_CHOICES,
     }
@@ -107,6 +176,56 @@ def my_tasks(request):
     return render(request, 'core/my_tasks.html', context)
 
 
+@login_required
+def my_calendar(request):
+    """Month or week calendar of the tasks assigned to or created by user"""
+    view = request.GET.get('view', VIEW_MONTH)
+    day = parse_day(request.GET.get('date'))
+    shown = calendar_range(view, day)
+    tasks = tasks_due_between(
+        Task.objects.filter(Q(assigned_to=request.user) | Q(created_by=request.user)).distinct(),
+        shown['first'], shown['last'],
+    )
+    
+    # Every shard returns its tasks by due date, so merging keeps the day order
+    task_list = merge_sorted(fan_out(lambda: list(
+        tasks.select_related('workspace').prefetch_related('assigned_to')
+    )), key=lambda task: task.due_date)
+    
+    context = {
+        'calendar': shown,
+        'weeks': fill_weeks(shown['weeks'], task_list, month=day.month if view == VIEW_MONTH else None),
+        'view': view,
+        'VIEW_CHOICES': VIEW_CHOICES,
+        'feed_token': request.user.calendar_token,
+    }
+    return render(request, 'core/my_calendar.html', context)
+
+
+@require_safe
+def calendar_feed(request, token):
+    """
+    A user's tasks as an iCalendar feed, for subscribing from calendar apps.
+
+    The token in the URL stands in for a login. Polls of an unchanged feed
+    are answered with 304 from the ETag alone; otherwise events are
+    streamed as they are rendered.
+    """
+    user = get_object_or_404(User, calendar_token=token, is_active=True)
+    etag = f'"{feed_etag(user)}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = StreamingHttpResponse(
+            iter_feed(user, request.build_absolute_uri('/').rstrip('/')),
+            content_type='text/calendar; charset=utf-8',
+        )
+        response['Content-Disposition'] = 'inline; filename="taskflow.ics"'
+    response['ETag'] = etag
+    # Clients may keep the feed but must check the ETag before using it again
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 def custom_404(request, exception):
     """Custom 404 page"""
     return render(request, 'errors/404.html', status=404)
@@ -128,27 +247,58 @@ def search(request):
     """Global search for workspaces and tasks"""
     query = request.GET.get('q', '').strip()
 
-    workspaces = Workspace.objects.none()
-    tasks = Task.objects.none()
+    workspaces = []
+    tasks = []
     
     if query:
-        # Search workspaces
-        workspaces = Workspace.objects.filter(
-            Q(owner=request.user) | Q(members=request.user),
-            Q(name__icontains=query) | Q(description__icontains=query)
-        ).distinct()
+        # Search workspaces on every shard
+        workspaces = merge_sorted(fan_out(lambda: list(Workspace.objects.filter(
+            Q(name__icontains=query) | Q(description__icontains=query),
+            members=request.user,
+        ))), key=lambda workspace: workspace.created_at, reverse=True)
         
-        # Search tasks
-        tasks = Task.objects.filter(
+        # Search tasks on every shard
+        tasks = merge_sorted(fan_out(lambda: list(Task.objects.filter(
             Q(created_by=request.user) | Q(assigned_to=request.user),
             Q(title__icontains=query) | Q(description__icontains=query)
-        ).distinct().select_related('workspace', 'assigned_to')
+        ).distinct().select_related('workspace').prefetch_related('assigned_to'))),
+            key=lambda task: task.created_at, reverse=True)
     
     context = {
         'query': query,
         'workspaces': workspaces,
         'tasks': tasks,
-        'total_results': workspaces.count() + tasks.count(),
+        'total_results': len(workspaces) + len(tasks),
     }
     
-    return render(request, 'core/search.html', context)
\ No newline at end of file
+    return render(request, 'core/search.html', context)
+
+
+@staff_member_required
+def rate_limit_stats(request):
+    """Rate limit and load shedding counters, for tuning the limits"""
+    return JsonResponse({
+        'limits': settings.RATE_LIMITS,
+        'counters': get_counters(),
+        # Measured by the worker process that answers this request
+        'db_latency_ms': round(latency_monitor.latency_ms(), 2),
+        'load_shed_views': settings.LOAD_SHED_VIEWS,
+        'load_shed_latency_ms': settings.LOAD_SHED_LATENCY_MS,
+    })
+
+
+@require_safe
+def metrics(request):
+    """Prometheus scrape endpoint, for the metrics token (off without one)"""
+    if not settings.METRICS_ENABLED or not settings.METRICS_TOKEN:
+        raise Http404
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+    allowed = hmac.compare_digest(supplied, settings.METRICS_TOKEN)
+    if settings.METRICS_ALLOWED_IPS:
+        allowed = allowed and request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+    if not allowed:
+        raise PermissionDenied
+    body = render_metrics(load_snapshots(), collect_gauges())
+    response = HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+    patch_cache_control(response, no_store=True)
+    return response
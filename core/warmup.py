@@ -0,0 +1,112 @@
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateSyntaxError, engines
+from django.template.utils import get_app_template_dirs
+from django.urls import URLResolver, get_resolver
+
+logger = logging.getLogger(__name__)
+
+
+def iter_template_names(engine):
+    """Yield every template name found in the engine's project and app directories"""
+    dirs = list(engine.dirs) + list(get_app_template_dirs('templates'))
+    seen = set()
+    for template_dir in dirs:
+        template_dir = Path(template_dir)
+        if not template_dir.is_dir():
+            continue
+        for path in template_dir.rglob('*'):
+            if path.is_file() and path.suffix in ('.html', '.txt', '.xml'):
+                name = path.relative_to(template_dir).as_posix()
+                if name not in seen:
+                    seen.add(name)
+                    yield name
+
+
+def compile_templates():
+    """Parse all templates so the cached loader holds them; return (compiled, failed)"""
+    compiled, failed = 0, []
+    for engine in engines.all():
+        for name in iter_template_names(engine):
+            try:
+                engine.get_template(name)
+            except TemplateSyntaxError as exc:
+                # Third-party templates may need libraries this project doesn't install
+                failed.append((name, str(exc).splitlines()[0]))
+            else:
+                compiled += 1
+    return compiled, failed
+
+
+def populate_urls(resolver=None):
+    """Populate the resolver tree (every included namespace too); return pattern count"""
+    resolver = resolver or get_resolver()
+    # Accessing reverse_dict triggers the resolver's lazy population
+    resolver.reverse_dict
+    count = 0
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            count += populate_urls(pattern)
+        else:
+            count += 1
+    return count
+
+
+def load_social_providers():
+    """Import allauth provider modules that are otherwise loaded on first use"""
+    from allauth.socialaccount import providers
+    return len(providers.registry.get_class_list())
+
+
+def connect_databases():
+    """Check every database accepts a connection, then close it again"""
+    for alias in settings.DATABASES:
+        connections[alias].ensure_connection()
+    connections.close_all()
+    return len(settings.DATABASES)
+
+
+WARMUP_STEPS = [
+    ('urls', populate_urls),
+    ('social providers', load_social_providers),
+    ('templates', compile_templates),
+    ('databases', connect_databases),
+]
+
+# Steps run when the WSGI/ASGI module is imported. Not the databases: the
+# import may happen before the server forks its workers, which would then
+# share one socket, and ASGI requests use connections of their own threads.
+STARTUP_STEPS = ['urls', 'social providers', 'templates']
+
+
+def warm_up(steps=None):
+    """
+    Do the lazy per-worker initialisation up front.
+
+    Returns a list of (step, seconds, result) tuples so callers can report
+    where startup time goes.
+    """
+    report = []
+    for name, func in WARMUP_STEPS:
+        if steps is not None and name not in steps:
+            continue
+        started = time.perf_counter()
+        result = func()
+        report.append((name, time.perf_counter() - started, result))
+    return report
+
+
+def warm_up_on_startup():
+    """Entry point for config.wsgi / config.asgi, enabled by WARMUP_ON_STARTUP"""
+    if not settings.WARMUP_ON_STARTUP:
+        return
+    report = warm_up(steps=STARTUP_STEPS)
+    logger.info(
+        'Worker warm-up finished in %.3fs (%s)',
+        sum(seconds for _, seconds, _ in report),
+        ', '.join(f'{name}: {seconds:.3f}s' for name, seconds, _ in report),
+    )
@@ -0,0 +1,102 @@
+// Member autocomplete for TaskFlow
+//
+// <select data-autocomplete-url="..."> gets a search box above it; matching
+// members are fetched as you type and replace the non-fixed options.
+// <input data-autocomplete-url="..."> gets a <datalist> of suggestions.
+
+(function () {
+    var DEBOUNCE_MS = 200;
+
+    function fetchMatches(url, term, callback) {
+        var separator = url.indexOf('?') === -1 ? '?' : '&';
+        fetch(url + separator + 'q=' + encodeURIComponent(term), {
+            credentials: 'same-origin',
+            headers: {'Accept': 'application/json'}
+        })
+            .then(function (response) { return response.ok ? response.json() : {results: []}; })
+            .then(function (data) { callback(data.results || []); })
+            .catch(function () { callback([]); });
+    }
+
+    function debounce(func) {
+        var timer = null;
+        return function () {
+            var args = arguments;
+            clearTimeout(timer);
+            timer = setTimeout(function () { func.apply(null, args); }, DEBOUNCE_MS);
+        };
+    }
+
+    function label(user) {
+        return user.name ? user.username + ' (' + user.name + ')' : user.username;
+    }
+
+    function setupSelect(select) {
+        var search = document.createElement('input');
+        search.type = 'search';
+        search.className = 'form-control form-control-sm mb-1';
+        search.placeholder = 'Type to search members...';
+        search.setAttribute('aria-label', 'Search members');
+        select.parentNode.insertBefore(search, select);
+
+        // Options rendered by the server ("All", "Unassigned", current value) are kept
+        Array.prototype.forEach.call(select.options, function (option) {
+            option.dataset.fixed = 'true';
+        });
+
+        search.addEventListener('input', debounce(function () {
+            var term = search.value.trim();
+            if (!term) {
+                return;
+            }
+            fetchMatches(select.dataset.autocompleteUrl, term, function (results) {
+                Array.prototype.slice.call(select.options).forEach(function (option) {
+                    if (!option.dataset.fixed && !option.selected) {
+                        option.remove();
+                    }
+                });
+                var present = {};
+                Array.prototype.forEach.call(select.options, function (option) {
+                    present[option.value] = true;
+                });
+                results.forEach(function (user) {
+                    if (!present[String(user.id)]) {
+                        select.add(new Option(label(user), user.id));
+                    }
+                });
+                if (results.length === 1) {
+                    select.value = String(results[0].id);
+                }
+            });
+        }));
+    }
+
+    function setupInput(input, index) {
+        var datalist = document.createElement('datalist');
+        datalist.id = 'autocomplete-list-' + index;
+        input.setAttribute('list', datalist.id);
+        input.setAttribute('autocomplete', 'off');
+        input.parentNode.appendChild(datalist);
+
+        input.addEventListener('input', debounce(function () {
+            var term = input.value.trim();
+            if (!term) {
+                return;
+            }
+            fetchMatches(input.dataset.autocompleteUrl, term, function (results) {
+                datalist.innerHTML = '';
+                results.forEach(function (user) {
+                    var option = document.createElement('option');
+                    option.value = user.username;
+                    option.label = user.name || user.username;
+                    datalist.appendChild(option);
+                });
+            });
+        }));
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('select[data-autocomplete-url]').forEach(setupSelect);
+        document.querySelectorAll('input[data-autocomplete-url]').forEach(setupInput);
+    });
+})();
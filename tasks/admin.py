@@ -1,23 +1,30 @@
 from django.contrib import admin
-from .models import Task, Comment
+from core.admin_tools import LargeTableAdminMixin, autocomplete_filter
+from .labels import recount_labels
+from .models import Task, Comment, RecurrenceRule, TaskDependency, Label, Reminder, ArchivedTask
 
 
 @admin.register(Task)
-class TaskAdmin(admin.ModelAdmin):
+class TaskAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Admin interface for Task"""
     
     list_display = ['title', 'workspace', 'assigned_to', 'status', 'priority', 'due_date', 'created_at']
-    list_filter = ['status', 'priority', 'workspace', 'created_at', 'due_date']
+    list_filter = ['status', 'priority', autocomplete_filter('workspace'), 'created_at', 'due_date']
+    list_select_related = ['workspace']
     search_fields = ['title', 'description', 'workspace__name']
+    # Newest first by primary key, which is indexed; created_at isn't
+    ordering = ['-pk']
     
     readonly_fields = ['created_at', 'updated_at', 'created_by']
+    autocomplete_fields = ['workspace', 'assigned_to']
+    raw_id_fields = ['parent']
     
     fieldsets = (
         ('Basic Info', {
             'fields': ('title', 'description', 'workspace')
         }),
         ('Assignment', {
-            'fields': ('created_by', 'assigned_to')
+            'fields': ('created_by', 'assigned_to', 'parent')
         }),
         ('Status & Priority', {
             'fields': ('status', 'priority', 'due_date')
@@ -28,6 +35,10 @@ class TaskAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # Users live on the default database, so they are prefetched rather than joined
+        return super().get_queryset(request).prefetch_related('assigned_to')
+    
     def save_model(self, request, obj, form, change):
         """Auto-set created_by if creating new task"""
         if not change:  # If creating new object
@@ -36,15 +47,100 @@ class TaskAdmin(admin.ModelAdmin):
 
 # Add Comment Admin
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Admin interface for Comment"""
     
     list_display = ['user', 'task', 'text_preview', 'created_at']
-    list_filter = ['created_at', 'task__workspace']
+    list_filter = ['created_at', autocomplete_filter('task__workspace')]
+    list_select_related = ['task']
     search_fields = ['text', 'user__username', 'task__title']
+    ordering = ['-pk']
     readonly_fields = ['created_at', 'updated_at']
+    raw_id_fields = ['task']
+    autocomplete_fields = ['user']
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('user')
     
     def text_preview(self, obj):
         """Show preview of comment text"""
         return obj.text[:50] + "..." if len(obj.text) > 50 else obj.text
-    text_preview.short_description = "Comment"
\ No newline at end of file
+    text_preview.short_description = "Comment"
+
+
+@admin.register(RecurrenceRule)
+class RecurrenceRuleAdmin(admin.ModelAdmin):
+    """Admin interface for recurrence rules"""
+    
+    list_display = ['template', 'frequency', 'interval', 'weekdays', 'starts_on', 'until', 'materialized_until']
+    list_filter = ['frequency']
+    list_select_related = ['template']
+    search_fields = ['template__title']
+    raw_id_fields = ['template']
+    readonly_fields = ['materialized_until', 'created_at', 'updated_at']
+
+
+@admin.register(TaskDependency)
+class TaskDependencyAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    """Admin interface for task dependencies"""
+    
+    list_display = ['task', 'blocker', 'created_at']
+    list_filter = [autocomplete_filter('task__workspace')]
+    list_select_related = ['task', 'blocker']
+    search_fields = ['task__title', 'blocker__title']
+    raw_id_fields = ['task', 'blocker']
+    readonly_fields = ['created_at']
+
+
+@admin.register(Label)
+class LabelAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    """Admin interface for workspace labels"""
+    
+    list_display = ['name', 'workspace', 'color', 'task_count', 'created_at']
+    list_filter = ['color', autocomplete_filter('workspace')]
+    list_select_related = ['workspace']
+    search_fields = ['name', 'workspace__name']
+    autocomplete_fields = ['workspace']
+    readonly_fields = ['task_count', 'created_at', 'updated_at']
+    actions = ['recount']
+    
+    @admin.action(description="Recount tasks of selected labels")
+    def recount(self, request, queryset):
+        recount_labels(queryset)
+        self.message_user(request, f"Recounted {queryset.count()} label(s).")
+
+
+@admin.register(Reminder)
+class ReminderAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    """Admin interface for task reminders (read-only)"""
+    
+    list_display = ['task', 'kind', 'due_date', 'user', 'created_at', 'sent_at', 'attempts']
+    list_filter = ['kind', 'sent_at', 'failed_at']
+    list_select_related = ['task']
+    search_fields = ['task__title']
+    ordering = ['-pk']
+    readonly_fields = [field.name for field in Reminder._meta.fields]
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('user')
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ArchivedTask)
+class ArchivedTaskAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    """Admin interface for archived tasks (read-only)"""
+    
+    list_display = ['title', 'workspace', 'assigned_to', 'status', 'priority', 'archived_at']
+    list_filter = [autocomplete_filter('workspace')]
+    list_select_related = ['workspace']
+    search_fields = ['title', 'description']
+    ordering = ['-pk']
+    readonly_fields = [field.name for field in ArchivedTask._meta.fields]
+    
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('assigned_to')
+    
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,124 @@
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from core.sharding import on_shard_of, shard_aliases
+from workspaces.changes import record_changes
+from workspaces.models import Change, Workspace
+from .labels import release_labels
+from .models import Task, Comment, ArchivedTask, ArchivedComment
+
+logger = logging.getLogger(__name__)
+
+TASK_FIELDS = [
+    'id', 'title', 'description', 'description_html', 'description_excerpt', 'workspace_id',
+    'created_by_id', 'assigned_to_id', 'parent_id', 'status', 'priority', 'due_date', 'created_at', 'updated_at',
+]
+COMMENT_FIELDS = ['id', 'task_id', 'user_id', 'text', 'text_html', 'created_at', 'updated_at']
+
+
+def archivable_tasks(workspace, now=None):
+    """Done tasks of a workspace untouched for longer than its threshold"""
+    if workspace.archive_after_days is None:
+        return Task.objects.none()
+    cutoff = (now or timezone.now()) - timedelta(days=workspace.archive_after_days)
+    # Recurring templates stay live, archiving would delete their rule.
+    # Parents wait for their subtasks, which would otherwise lose them.
+    return on_shard_of(Task.objects.filter(
+        workspace=workspace,
+        status=Task.STATUS_DONE,
+        updated_at__lt=cutoff,
+        recurrence__isnull=True,
+    ).exclude(
+        Exists(Task.objects.filter(parent=OuterRef('pk'))),
+    ), workspace)
+
+
+def archive_batch(queryset, batch_size):
+    """
+    Move one batch of tasks with their comments into the archive tables.
+
+    Copy and delete happen in one transaction on the queryset's shard, so a
+    task is always in exactly one of the two tables. Returns the number of
+    tasks moved.
+    """
+    db = queryset.db
+    with transaction.atomic(using=db):
+        tasks = list(
+            queryset.order_by('pk').select_for_update(of=('self',)).values(*TASK_FIELDS)[:batch_size]
+        )
+        if not tasks:
+            return 0
+        task_ids = [task['id'] for task in tasks]
+        comments = list(
+            Comment.all_objects.using(db).filter(task_id__in=task_ids).values(*COMMENT_FIELDS)
+        )
+
+        ArchivedTask.objects.using(db).bulk_create([ArchivedTask(**task) for task in tasks])
+        ArchivedComment.objects.using(db).bulk_create(
+            [ArchivedComment(**comment) for comment in comments]
+        )
+
+        # Archived tasks drop their labels
+        release_labels(task_ids, db)
+        Comment.all_objects.using(db).filter(task_id__in=task_ids).delete()
+        Task.all_objects.using(db).filter(pk__in=task_ids).delete()
+
+        # Archived rows leave synced clients like deleted ones
+        workspace_of = {task['id']: task['workspace_id'] for task in tasks}
+        record_changes(Change.KIND_TASK, [(task['workspace_id'], task['id']) for task in tasks], db, deleted=True)
+        record_changes(Change.KIND_COMMENT, [
+            (workspace_of[comment['task_id']], comment['id']) for comment in comments
+        ], db, deleted=True)
+    return len(tasks)
+
+
+def archive_workspace(workspace, batch_size=500):
+    """Archive all eligible tasks of a workspace in batches; return tasks moved"""
+    total = 0
+    while True:
+        moved = archive_batch(archivable_tasks(workspace), batch_size)
+        if not moved:
+            break
+        total += moved
+    if total:
+        logger.info('Archived %d task(s) from workspace %s', total, workspace.pk)
+    return total
+
+
+def archive_all(batch_size=500):
+    """Archive eligible tasks across every workspace (on every shard) with a threshold set"""
+    results = {}
+    for alias in shard_aliases():
+        workspaces = Workspace.objects.using(alias).filter(archive_after_days__isnull=False)
+        for workspace in workspaces:
+            results[workspace] = archive_workspace(workspace, batch_size)
+    return results
+
+
+def restore_task(archived):
+    """Move an archived task and its comments back into the live tables"""
+    db = archived._state.db
+    with transaction.atomic(using=db):
+        comments = list(archived.comments.values(*COMMENT_FIELDS))
+        task = Task(**{field: getattr(archived, field) for field in TASK_FIELDS})
+        # The parent may have been archived or deleted since
+        if task.parent_id and not Task.objects.using(db).filter(pk=task.parent_id).exists():
+            task.parent_id = None
+        # bulk_create still applies auto_now/auto_now_add, so restore them afterwards.
+        # updated_at stays "now", so the task isn't archived again on the next run.
+        Task.objects.using(db).bulk_create([task])
+        Task.all_objects.using(db).filter(pk=task.pk).update(created_at=archived.created_at)
+        restored_comments = [Comment(**comment) for comment in comments]
+        Comment.objects.using(db).bulk_create(restored_comments)
+        for restored, comment in zip(restored_comments, comments):
+            restored.created_at = comment['created_at']
+            restored.updated_at = comment['updated_at']
+        Comment.all_objects.using(db).bulk_update(restored_comments, ['created_at', 'updated_at'])
+        archived.delete()
+        record_changes(Change.KIND_TASK, [(task.workspace_id, task.pk)], db)
+        record_changes(Change.KIND_COMMENT, [(task.workspace_id, comment.pk) for comment in restored_comments], db)
+    return task
@@ -0,0 +1,214 @@
+"""
+Calendar views and the iCalendar feed of task due dates.
+
+Both read tasks by due date range, which the (due_date, status) index
+answers directly. The feed is polled by calendar clients every few
+minutes, so it is built to be cheap when nothing changed: its ETag comes
+from one small aggregate per shard, and when it did change each event is
+rendered once per task version and cached, so only edited tasks are
+rendered again.
+"""
+import calendar
+import hashlib
+from datetime import date, timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from core.metrics import record_cache
+from core.sharding import fan_out, shard_aliases
+from .models import Task
+
+VIEW_MONTH = 'month'
+VIEW_WEEK = 'week'
+
+VIEW_CHOICES = [
+    (VIEW_MONTH, 'Month'),
+    (VIEW_WEEK, 'Week'),
+]
+
+
+# Calendar grid
+
+def parse_day(value, default=None):
+    """A YYYY-MM-DD query parameter as a date, or ``default`` (today)"""
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return default or timezone.localdate()
+
+
+def calendar_range(view, day):
+    """
+    The weeks shown for ``day`` in a month or week view.
+
+    Returns a dict with ``weeks`` (lists of seven dates, Monday first), the
+    ``first`` and ``last`` dates shown, a ``title`` and the days to link
+    to as ``previous`` and ``next``.
+    """
+    if view == VIEW_WEEK:
+        monday = day - timedelta(days=day.weekday())
+        weeks = [[monday + timedelta(days=offset) for offset in range(7)]]
+        title = f'Week of {monday:%b %d, %Y}'
+        previous, next_ = monday - timedelta(days=7), monday + timedelta(days=7)
+    else:
+        weeks = calendar.Calendar().monthdatescalendar(day.year, day.month)
+        title = f'{day:%B %Y}'
+        first_of_month = day.replace(day=1)
+        previous = (first_of_month - timedelta(days=1)).replace(day=1)
+        next_ = (first_of_month + timedelta(days=31)).replace(day=1)
+    return {
+        'weeks': weeks,
+        'first': weeks[0][0],
+        'last': weeks[-1][-1],
+        'title': title,
+        'previous': previous,
+        'next': next_,
+    }
+
+
+def fill_weeks(weeks, tasks, month=None):
+    """Pair every day of the grid with the tasks due on it, for the template"""
+    by_day = {}
+    for task in tasks:
+        by_day.setdefault(task.due_date, []).append(task)
+    today = timezone.localdate()
+    return [
+        [
+            {
+                'date': day,
+                'tasks': by_day.get(day, []),
+                'is_today': day == today,
+                'outside': month is not None and day.month != month,
+            }
+            for day in week
+        ]
+        for week in weeks
+    ]
+
+
+def tasks_due_between(tasks, first, last):
+    """Tasks due from ``first`` to ``last``, in the order a day lists them"""
+    return tasks.filter(due_date__range=(first, last)).order_by('due_date', 'status', 'pk')
+
+
+# iCalendar feed
+
+def feed_tasks(user):
+    """Dated tasks a user's feed shows: assigned to or created by them, not long past"""
+    since = timezone.localdate() - timedelta(days=settings.CALENDAR_FEED_PAST_DAYS)
+    return Task.objects.filter(
+        Q(assigned_to=user) | Q(created_by=user),
+        due_date__gte=since,
+    )
+
+
+def feed_etag(user):
+    """
+    Fingerprint of everything the feed would contain.
+
+    Edits bump updated_at and removals lower the count, so an unchanged
+    feed is recognised from one aggregate per shard, without reading the
+    tasks.
+    """
+    tasks = feed_tasks(user)
+    states = fan_out(lambda: tasks.aggregate(total=Count('pk'), changed=Max('updated_at')))
+    since = timezone.localdate() - timedelta(days=settings.CALENDAR_FEED_PAST_DAYS)
+    fingerprint = ';'.join(
+        f"{state['total']}:{state['changed'].timestamp() if state['changed'] else ''}"
+        for state in states
+    )
+    return hashlib.md5(f'{since}|{fingerprint}'.encode()).hexdigest()
+
+
+def escape_text(value):
+    """Escape a TEXT value (RFC 5545, 3.3.11)"""
+    return (
+        value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n').replace('\r', '\\n')
+    )
+
+
+def fold(line):
+    """Split a content line into chunks of at most 75 octets (RFC 5545, 3.1)"""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    chunks, start = [], 0
+    while start < len(encoded):
+        end = min(start + (75 if not chunks else 74), len(encoded))
+        # Never cut a multi-byte character in half
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        chunks.append(encoded[start:end].decode())
+        start = end
+    return '\r\n '.join(chunks) + '\r\n'
+
+
+def render_event(task, base_url):
+    """One task as an all-day VEVENT on its due date"""
+    stamp = f'{task.updated_at.astimezone(dt_timezone.utc):%Y%m%dT%H%M%SZ}'
+    summary = f'✅ {task.title}' if task.status == Task.STATUS_DONE else task.title
+    description = f'{task.get_status_display()} · {task.get_priority_display()} priority'
+    if task.description:
+        description += f'\n\n{task.description}'
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:task-{task.pk}@taskflow',
+        f'DTSTAMP:{stamp}',
+        f'LAST-MODIFIED:{stamp}',
+        f'SEQUENCE:{task.version}',
+        f'DTSTART;VALUE=DATE:{task.due_date:%Y%m%d}',
+        f'DTEND;VALUE=DATE:{task.due_date + timedelta(days=1):%Y%m%d}',
+        f'SUMMARY:{escape_text(summary)}',
+        f'DESCRIPTION:{escape_text(description)}',
+        f'URL:{base_url}{task.get_absolute_url()}',
+        'TRANSP:TRANSPARENT',
+        'END:VEVENT',
+    ]
+    return ''.join(fold(line) for line in lines)
+
+
+def event_key(task, base_url):
+    # Any change to a task bumps its version, so old entries are never read again
+    return f'ical:event:{task.pk}:{task.version}:{hashlib.md5(base_url.encode()).hexdigest()[:8]}'
+
+
+def render_events(tasks, base_url):
+    """Render a batch of tasks, reusing the events cached for unchanged ones"""
+    keys = {event_key(task, base_url): task for task in tasks}
+    events = cache.get_many(keys)
+    missing = {key: render_event(task, base_url) for key, task in keys.items() if key not in events}
+    record_cache('calendar_events', hits=len(events), misses=len(missing))
+    if missing:
+        cache.set_many(missing, settings.CALENDAR_FEED_CACHE_TIMEOUT)
+        events.update(missing)
+    return ''.join(events[key] for key in keys)
+
+
+def iter_feed(user, base_url, batch_size=500):
+    """
+    Yield the user's feed as an iCalendar document, a batch of events at a time.
+
+    Tasks are read shard by shard in primary key order with a server-side
+    cursor, so memory stays flat however many tasks the user has.
+    """
+    yield ''.join(fold(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//TaskFlow//Tasks//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_text(f"TaskFlow - {user.username}")}',
+        'REFRESH-INTERVAL;VALUE=DURATION:PT15M',
+    ])
+    for alias in shard_aliases():
+        tasks = feed_tasks(user).using(alias).only(
+            'pk', 'title', 'description', 'status', 'priority', 'due_date', 'updated_at', 'version',
+        ).order_by('pk').iterator(chunk_size=batch_size)
+        while batch := list(islice(tasks, batch_size)):
+            yield render_events(batch, base_url)
+    yield 'END:VCALENDAR\r\n'
@@ -1,13 +1,28 @@
 from django import forms
-from .models import Task, Comment
+from django.urls import reverse
+from .models import Task, Comment, RecurrenceRule, Label
+from .graph import descendant_ids
+from .labels import MATCH_ANY, MATCH_CHOICES
+from core.sharding import on_shard_of
+from workspaces.widgets import MemberAutocompleteSelect
 
 
 class TaskForm(forms.ModelForm):
     """Form for creating and updating tasks"""
     
+    # Version the edit is based on, see Task.update_versioned
+    version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+    
+    # Saved through tasks.labels.set_task_labels, which keeps the label counts
+    labels = forms.ModelMultipleChoiceField(
+        queryset=Label.objects.none(),
+        required=False,
+        widget=forms.CheckboxSelectMultiple(attrs={'class': 'form-check-input'})
+    )
+    
     class Meta:
         model = Task
-        fields = ['title', 'description', 'assigned_to', 'status', 'priority', 'due_date']
+        fields = ['title', 'description', 'assigned_to', 'status', 'priority', 'due_date', 'parent']
         widgets = {
             'title': forms.TextInput(attrs={
                 'class': 'form-control',
@@ -16,7 +31,7 @@ class TaskForm(forms.ModelForm):
             'description': forms.Textarea(attrs={
                 'class': 'form-control',
                 'rows': 4,
-                'placeholder': 'Describe the task in detail...'
+                'placeholder': 'Describe the task in detail... (Markdown, @username, #task number)'
             }),
             'assigned_to': forms.Select(attrs={
                 'class': 'form-select'
@@ -31,6 +46,7 @@ class TaskForm(forms.ModelForm):
                 'class': 'form-control',
                 'type': 'date'
             }),
+            'parent': forms.HiddenInput,
         }
     
     def __init__(self, *args, **kwargs):
@@ -38,10 +54,115 @@ class TaskForm(forms.ModelForm):
         workspace = kwargs.pop('workspace', None)
         super().__init__(*args, **kwargs)
         
-        # Only show workspace members in assigned_to dropdown
+        if self.instance.pk:
+            self.fields['version'].initial = self.instance.version
+            self.fields['labels'].initial = list(self.instance.labels.all())
+        
+        # Only workspace members can be assigned; matches are loaded on demand
         if workspace:
             self.fields['assigned_to'].queryset = workspace.get_all_members()
             self.fields['assigned_to'].empty_label = "Unassigned"
+            self.fields['assigned_to'].widget = MemberAutocompleteSelect(
+                url=reverse('workspaces:member_autocomplete', kwargs={'pk': workspace.pk})
+            )
+            self.fields['assigned_to'].widget.choices = self.fields['assigned_to'].choices
+            self.fields['parent'].queryset = on_shard_of(Task.objects.filter(workspace=workspace), workspace)
+            self.fields['labels'].queryset = on_shard_of(Label.objects.filter(workspace=workspace), workspace)
+    
+    def clean_parent(self):
+        """A task can't become a subtask of itself or of one of its subtasks"""
+        parent = self.cleaned_data['parent']
+        if parent and self.instance.pk:
+            if parent.pk == self.instance.pk or parent.pk in descendant_ids(self.instance):
+                raise forms.ValidationError('A task can\'t be a subtask of its own subtask.')
+        return parent
+
+
+class DependencyForm(forms.Form):
+    """Form for marking a task as blocked by another task of the workspace"""
+    
+    blocker = forms.IntegerField(
+        min_value=1,
+        widget=forms.NumberInput(attrs={
+            'class': 'form-control',
+            'placeholder': 'Task #'
+        })
+    )
+    
+    def __init__(self, *args, **kwargs):
+        self.task = kwargs.pop('task')
+        super().__init__(*args, **kwargs)
+    
+    def clean_blocker(self):
+        """Turn the task number into a task of the same workspace"""
+        blocker = on_shard_of(Task.objects.filter(
+            workspace_id=self.task.workspace_id,
+            pk=self.cleaned_data['blocker'],
+        ), self.task).first()
+        if blocker is None:
+            raise forms.ValidationError('There is no such task in this workspace.')
+        if blocker.pk == self.task.pk:
+            raise forms.ValidationError('A task can\'t block itself.')
+        return blocker
+
+
+class RecurrenceForm(forms.ModelForm):
+    """Repeat settings shown below the task form; the task becomes the template"""
+    
+    repeats = forms.BooleanField(
+        required=False,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+    
+    weekdays = forms.MultipleChoiceField(
+        choices=RecurrenceRule.WEEKDAY_CHOICES,
+        required=False,
+        widget=forms.CheckboxSelectMultiple(attrs={'class': 'form-check-input'}),
+        help_text="Weekly only; defaults to the due date's weekday"
+    )
+    
+    class Meta:
+        model = RecurrenceRule
+        fields = ['frequency', 'interval', 'weekdays', 'until', 'count']
+        widgets = {
+            'frequency': forms.Select(attrs={
+                'class': 'form-select'
+            }),
+            'interval': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'min': 1
+            }),
+            'until': forms.DateInput(attrs={
+                'class': 'form-control',
+                'type': 'date'
+            }),
+            'count': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'min': 1,
+                'placeholder': 'Forever'
+            }),
+        }
+    
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('prefix', 'repeat')
+        super().__init__(*args, **kwargs)
+        
+        if self.instance.pk:
+            self.fields['repeats'].initial = True
+            self.initial['weekdays'] = [day for day in self.instance.weekdays.split(',') if day]
+    
+    def is_enabled(self):
+        """Whether the repeat checkbox is ticked in the submitted data"""
+        return self.is_bound and self['repeats'].data
+    
+    def clean_interval(self):
+        interval = self.cleaned_data['interval']
+        if interval < 1:
+            raise forms.ValidationError('Repeat at least every 1 day/week/month.')
+        return interval
+    
+    def clean_weekdays(self):
+        return ','.join(self.cleaned_data['weekdays'])
 
 
 class TaskFilterForm(forms.Form):
@@ -65,15 +186,78 @@ class TaskFilterForm(forms.Form):
         widget=forms.Select(attrs={'class': 'form-select'})
     )
     
+    labels = forms.MultipleChoiceField(
+        choices=[],
+        required=False,
+        widget=forms.CheckboxSelectMultiple(attrs={'class': 'btn-check'})
+    )
+    
+    match = forms.ChoiceField(
+        choices=MATCH_CHOICES,
+        required=False,
+        initial=MATCH_ANY,
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'})
+    )
+    
     def __init__(self, *args, **kwargs):
         workspace = kwargs.pop('workspace', None)
         super().__init__(*args, **kwargs)
+        self.label_objects = []
         
         if workspace:
-            members = workspace.get_all_members()
+            # Chips show the maintained counts, no COUNT query per label
+            self.label_objects = list(on_shard_of(Label.objects.filter(workspace=workspace), workspace))
+            self.fields['labels'].choices = [(label.pk, label.name) for label in self.label_objects]
+            
             choices = [('', 'All Assignees'), ('unassigned', 'Unassigned')]
-            choices += [(m.id, m.username) for m in members]
+            
+            # Only the currently filtered member is rendered, the rest load on demand
+            selected = self.data.get('assigned_to') if self.is_bound else None
+            if selected and selected.isdigit():
+                member = workspace.get_all_members().filter(pk=selected).first()
+                if member:
+                    choices.append((member.id, member.username))
+            
             self.fields['assigned_to'].choices = choices
+            self.fields['assigned_to'].widget = MemberAutocompleteSelect(
+                url=reverse('workspaces:member_autocomplete', kwargs={'pk': workspace.pk}),
+                fixed_values=('', 'unassigned'),
+            )
+            self.fields['assigned_to'].widget.choices = choices
+    
+    def label_chips(self):
+        """(label, selected) pairs for rendering the label filter as toggle chips"""
+        selected = set(self['labels'].value() or [])
+        return [(label, str(label.pk) in selected) for label in self.label_objects]
+
+
+class LabelForm(forms.ModelForm):
+    """Form for creating workspace labels"""
+    
+    class Meta:
+        model = Label
+        fields = ['name', 'color']
+        widgets = {
+            'name': forms.TextInput(attrs={
+                'class': 'form-control',
+                'placeholder': 'Label name'
+            }),
+            'color': forms.Select(attrs={
+                'class': 'form-select'
+            }),
+        }
+    
+    def __init__(self, *args, **kwargs):
+        self.workspace = kwargs.pop('workspace')
+        super().__init__(*args, **kwargs)
+        self.instance.workspace = self.workspace
+    
+    def clean_name(self):
+        name = self.cleaned_data['name'].strip()
+        labels = on_shard_of(Label.objects.filter(workspace=self.workspace, name__iexact=name), self.workspace)
+        if labels.exists():
+            raise forms.ValidationError('This workspace already has a label with that name.')
+        return name
 
 
 class CommentForm(forms.ModelForm):
@@ -86,7 +270,7 @@ class CommentForm(forms.ModelForm):
             'text': forms.Textarea(attrs={
                 'class': 'form-control',
                 'rows': 3,
-                'placeholder': 'Write your comment...'
+                'placeholder': 'Write your comment... (Markdown, @username, #task number)'
             }),
         }
         labels = {
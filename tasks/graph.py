@@ -0,0 +1,218 @@
+"""
+Dependency and subtask graph queries.
+
+Every traversal is a single recursive CTE, so walking a graph costs one
+round trip however many tasks it reaches. Queries run on the shard of the
+task they start from; edges never cross workspaces, so the whole graph is
+there. UNION (not UNION ALL) drops nodes already seen, so the queries stay
+linear in the size of the graph even when many paths lead to a task.
+"""
+from collections import deque
+
+from django.db import connections, transaction
+
+from core.sharding import assign_ids
+from workspaces.models import Workspace
+from .models import Task, TaskDependency, DependencyCycle
+
+# Guard for subtask trees edited outside the app (e.g. in the admin)
+MAX_SUBTASK_DEPTH = 100
+
+
+def format_sql(db, sql):
+    """Fill in the quoted table names"""
+    quote_name = connections[db].ops.quote_name
+    return sql.format(
+        task=quote_name(Task._meta.db_table),
+        dependency=quote_name(TaskDependency._meta.db_table),
+    )
+
+
+def run_query(db, sql, params):
+    """Run sql on db and return all rows"""
+    with connections[db].cursor() as cursor:
+        cursor.execute(format_sql(db, sql), params)
+        return cursor.fetchall()
+
+
+def get_db(task):
+    return task._state.db or 'default'
+
+
+# Dependencies
+
+REACHABLE_SQL = """
+    WITH RECURSIVE reachable(id) AS (
+        SELECT blocker_id FROM {dependency} WHERE task_id = %s
+        UNION
+        SELECT d.blocker_id FROM {dependency} d JOIN reachable r ON d.task_id = r.id
+    )
+    SELECT 1 FROM reachable WHERE id = %s LIMIT 1
+"""
+
+OPEN_BLOCKERS_SQL = """
+    WITH RECURSIVE upstream(id) AS (
+        SELECT d.blocker_id FROM {dependency} d
+        JOIN {task} t ON t.id = d.blocker_id
+        WHERE d.task_id = %s AND t.status <> %s AND t.deleted_at IS NULL
+        UNION
+        SELECT d.blocker_id FROM {dependency} d
+        JOIN upstream u ON d.task_id = u.id
+        JOIN {task} t ON t.id = d.blocker_id
+        WHERE t.status <> %s AND t.deleted_at IS NULL
+    )
+"""
+
+# Blockers already done don't hold anything up, so the walk stops at them
+UPSTREAM_EDGES_SQL = OPEN_BLOCKERS_SQL + """
+    SELECT d.task_id, d.blocker_id FROM {dependency} d
+    JOIN {task} t ON t.id = d.blocker_id
+    WHERE (d.task_id = %s OR d.task_id IN (SELECT id FROM upstream))
+    AND t.status <> %s AND t.deleted_at IS NULL
+"""
+
+
+def depends_on(task_id, blocker_id, db='default'):
+    """Check if a task is blocked by another, directly or through other tasks"""
+    return bool(run_query(db, REACHABLE_SQL, [task_id, blocker_id]))
+
+
+def add_dependency(task, blocker):
+    """
+    Record that ``task`` is blocked by ``blocker``; return the dependency.
+
+    Raises DependencyCycle if ``blocker`` already depends on ``task``. Graph
+    edits lock the workspace row, so two concurrent inserts can't close a
+    cycle between them.
+    """
+    db = get_db(task)
+    with transaction.atomic(using=db):
+        list(Workspace._base_manager.using(db).select_for_update().filter(
+            pk=task.workspace_id,
+        ).values_list('pk', flat=True))
+        existing = TaskDependency.objects.using(db).filter(task=task, blocker=blocker).first()
+        if existing:
+            return existing
+        if task.pk == blocker.pk or depends_on(blocker.pk, task.pk, db):
+            raise DependencyCycle(f'Task {blocker.pk} already depends on task {task.pk}')
+        dependency = TaskDependency(task=task, blocker=blocker)
+        assign_ids(TaskDependency, [dependency])
+        dependency.save(using=db)
+    return dependency
+
+
+def open_blockers(task):
+    """All unfinished tasks that (indirectly) block ``task``"""
+    db = get_db(task)
+    sql = format_sql(db, OPEN_BLOCKERS_SQL + """
+        SELECT t.* FROM {task} t JOIN upstream u ON t.id = u.id ORDER BY t.due_date, t.id
+    """)
+    return Task.objects.raw(sql, [task.pk, Task.STATUS_DONE, Task.STATUS_DONE]).using(db)
+
+
+def critical_path(task):
+    """
+    Work out what stands between ``task`` and done.
+
+    One query fetches the edges among its unfinished blockers; the longest
+    chain is then found in memory with a topological pass (Kahn's
+    algorithm), O(tasks + edges). Enumerating paths in SQL instead would
+    grow with the number of paths, which explodes on dense graphs.
+
+    Returns a dict with ``path`` (task ids from the first thing to do up to
+    ``task``), ``ready`` (open blockers that nothing blocks any more) and
+    the ``blockers``/``edges`` counts of the subgraph.
+    """
+    edges = run_query(
+        get_db(task), UPSTREAM_EDGES_SQL,
+        [task.pk, Task.STATUS_DONE, Task.STATUS_DONE, task.pk, Task.STATUS_DONE],
+    )
+    blockers_of, dependents_of = {task.pk: []}, {}
+    for task_id, blocker_id in edges:
+        blockers_of.setdefault(task_id, []).append(blocker_id)
+        blockers_of.setdefault(blocker_id, [])
+        dependents_of.setdefault(blocker_id, []).append(task_id)
+
+    # Chain length ending at each node, visiting blockers before their dependents
+    remaining = {node: len(blockers) for node, blockers in blockers_of.items()}
+    queue = deque(node for node, count in remaining.items() if count == 0)
+    length, best_blocker = {}, {}
+    while queue:
+        node = queue.popleft()
+        blockers = blockers_of[node]
+        if blockers:
+            best = max(blockers, key=length.__getitem__)
+            length[node], best_blocker[node] = length[best] + 1, best
+        else:
+            length[node] = 1
+        for dependent in dependents_of.get(node, ()):
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                queue.append(dependent)
+
+    path = []
+    node = task.pk if task.pk in length else None
+    while node is not None:
+        path.append(node)
+        node = best_blocker.get(node)
+    path.reverse()
+
+    ready = [node for node, blockers in blockers_of.items() if not blockers and node != task.pk]
+    return {
+        'path': path,
+        'ready': ready,
+        'blockers': len(blockers_of) - 1,
+        'edges': len(edges),
+    }
+
+
+# Subtasks
+
+SUBTREE_SQL = """
+    WITH RECURSIVE tree(id, depth) AS (
+        SELECT id, 1 FROM {task} WHERE parent_id = %s AND deleted_at IS NULL
+        UNION ALL
+        SELECT t.id, tree.depth + 1 FROM {task} t
+        JOIN tree ON t.parent_id = tree.id
+        WHERE t.deleted_at IS NULL AND tree.depth < %s
+    )
+"""
+
+
+def descendant_ids(task):
+    """Ids of all subtasks of ``task``, at any depth"""
+    rows = run_query(get_db(task), SUBTREE_SQL + 'SELECT id FROM tree', [task.pk, MAX_SUBTASK_DEPTH])
+    return {row[0] for row in rows}
+
+
+def subtask_tree(task):
+    """Subtasks at any depth as (task, depth) pairs, each parent followed by its children"""
+    db = get_db(task)
+    sql = format_sql(db, SUBTREE_SQL + """
+        SELECT t.*, tree.depth FROM {task} t JOIN tree ON t.id = tree.id ORDER BY t.created_at
+    """)
+    subtasks = Task.objects.raw(sql, [task.pk, MAX_SUBTASK_DEPTH]).using(db).prefetch_related('assigned_to')
+    children = {}
+    for subtask in subtasks:
+        children.setdefault(subtask.parent_id, []).append(subtask)
+
+    tree, stack = [], list(reversed(children.get(task.pk, [])))
+    while stack:
+        subtask = stack.pop()
+        tree.append((subtask, subtask.depth))
+        stack.extend(reversed(children.get(subtask.pk, [])))
+    return tree
+
+
+def rollup(task):
+    """Completion of a task's subtasks at any depth: total, done and percent"""
+    sql = SUBTREE_SQL + """
+        SELECT COUNT(*), COALESCE(SUM(CASE WHEN t.status = %s THEN 1 ELSE 0 END), 0)
+        FROM {task} t JOIN tree ON t.id = tree.id
+    """
+    [(total, done)] = run_query(get_db(task), sql, [task.pk, MAX_SUBTASK_DEPTH, Task.STATUS_DONE])
+    return {
+        'total': total,
+        'done': done,
+        'percent': round(done * 100 / total) if total else 0,
+    }
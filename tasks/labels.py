@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Label, TaskLabel
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+
+MATCH_CHOICES = [
+    (MATCH_ANY, 'Any label'),
+    (MATCH_ALL, 'All labels'),
+]
+
+
+def filter_by_labels(tasks, ids=None, names=None, match=MATCH_ANY):
+    """
+    Narrow tasks to those carrying any (or all) of the given labels.
+
+    Labels are matched by id within a workspace, or by name across
+    workspaces. Both become a semi-join on the (label, task) index. For
+    MATCH_ALL the ids are grouped per task and compared to the number of
+    labels asked for.
+    """
+    if ids:
+        links, required = TaskLabel.objects.filter(label_id__in=ids), len(set(ids))
+    elif names:
+        # Names are unique per workspace, and a task only has its workspace's labels
+        links, required = TaskLabel.objects.filter(label__name__in=names), len(set(names))
+    else:
+        return tasks
+    if match == MATCH_ALL:
+        links = links.values('task_id').annotate(matched=Count('label_id')).filter(matched=required)
+    return tasks.filter(pk__in=links.values('task_id'))
+
+
+def set_task_labels(task, labels):
+    """Replace a task's labels, adjusting the labels' task counts in the same transaction"""
+    db = task._state.db
+    wanted = {label.pk for label in labels}
+    with transaction.atomic(using=db):
+        current = set(TaskLabel.objects.using(db).filter(task=task).values_list('label_id', flat=True))
+        added, removed = wanted - current, current - wanted
+        if removed:
+            TaskLabel.objects.using(db).filter(task=task, label_id__in=removed).delete()
+            Label.objects.using(db).filter(pk__in=removed).update(task_count=F('task_count') - 1)
+        if added:
+            TaskLabel.objects.using(db).bulk_create([TaskLabel(task=task, label_id=pk) for pk in added])
+            Label.objects.using(db).filter(pk__in=added).update(task_count=F('task_count') + 1)
+
+
+def release_labels(task_ids, db):
+    """
+    Take tasks about to be deleted off their labels' counts.
+
+    Call inside the transaction that deletes them; the TaskLabel rows
+    themselves go with the tasks.
+    """
+    counts = list(TaskLabel.objects.using(db).filter(task_id__in=task_ids).values('label_id').annotate(
+        total=Count('pk'),
+    ).values_list('label_id', 'total'))
+    for label_id, total in counts:
+        Label.objects.using(db).filter(pk=label_id).update(task_count=F('task_count') - total)
+
+
+def recount_labels(labels):
+    """Recompute task counts from scratch, e.g. after editing links in the admin"""
+    for label in labels.annotate(actual=Count('task_labels')):
+        if label.task_count != label.actual:
+            Label.objects.using(label._state.db).filter(pk=label.pk).update(task_count=label.actual)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from tasks.archive import archive_all
+
+
+class Command(BaseCommand):
+    help = 'Move done tasks older than each workspace\'s threshold into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Tasks moved per transaction (default: 500)')
+
+    def handle(self, *args, **options):
+        results = archive_all(batch_size=options['batch_size'])
+        for workspace, moved in results.items():
+            if moved:
+                self.stdout.write(f'{workspace.name}: archived {moved} task(s)')
+        total = sum(results.values())
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} task(s)'))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from core.sharding import shard_aliases
+from tasks.models import Task, ArchivedTask
+
+# Codes the status and priority columns held before they became integers
+OLD_STATUSES = {'TODO': Task.STATUS_TODO, 'IN_PROGRESS': Task.STATUS_IN_PROGRESS, 'DONE': Task.STATUS_DONE}
+OLD_PRIORITIES = {'LOW': Task.PRIORITY_LOW, 'MEDIUM': Task.PRIORITY_MEDIUM, 'HIGH': Task.PRIORITY_HIGH}
+
+
+def case(column, mapping, quote_name):
+    whens = ' '.join(f"WHEN '{old}' THEN '{new}'" for old, new in mapping.items())
+    return f'{quote_name(column)} = CASE {quote_name(column)} {whens} ELSE {quote_name(column)} END'
+
+
+class Command(BaseCommand):
+    help = (
+        'Rewrite task status and priority codes (TODO, HIGH, ...) as the digits of their new '
+        'integer values. Run before the migration that turns the columns into integers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows updated per statement (default: 5000)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for alias in shard_aliases():
+            connection = connections[alias]
+            quote_name = connection.ops.quote_name
+            for model in [Task, ArchivedTask]:
+                table = quote_name(model._meta.db_table)
+                # Raw SQL: the models already expect integers in these columns
+                sql = (
+                    f'UPDATE {table} SET {case("status", OLD_STATUSES, quote_name)}, '
+                    f'{case("priority", OLD_PRIORITIES, quote_name)} '
+                    f'WHERE {quote_name("id")} > %s AND {quote_name("id")} <= %s'
+                )
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT MAX({quote_name("id")}) FROM {table}')
+                    max_id = cursor.fetchone()[0] or 0
+                    for start in range(0, max_id, batch_size):
+                        with transaction.atomic(using=alias):
+                            cursor.execute(sql, [start, start + batch_size])
+                self.stdout.write(self.style.SUCCESS(
+                    f'{alias}: encoded {model._meta.verbose_name_plural.lower()} up to id {max_id}'
+                ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from tasks.recurrence import horizon, materialize_all
+
+
+class Command(BaseCommand):
+    help = 'Create recurring task occurrences up to RECURRENCE_HORIZON_DAYS ahead'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rules read and tasks inserted per query (default: 500)')
+
+    def handle(self, *args, **options):
+        created = materialize_all(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} occurrence(s) up to {horizon():%Y-%m-%d}'
+        ))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tasks.reminders import scan_all, send_pending
+
+
+class Command(BaseCommand):
+    help = 'Record due-soon and overdue reminders once per task and mail them as digests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Reminders mailed per batch (default: REMINDER_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running, scanning every --interval seconds')
+        parser.add_argument('--interval', type=float, default=300,
+                            help='Seconds between scans with --loop (default: 300)')
+
+    def handle(self, *args, **options):
+        while True:
+            recorded = scan_all()
+            sent = send_pending(options['batch_size'])
+            if recorded or sent:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Recorded {recorded} reminder(s), sent {sent}'
+                ))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
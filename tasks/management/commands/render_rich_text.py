@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from core.sharding import shard_aliases
+from tasks.models import Task, Comment
+from tasks.richtext import render_rich_text
+
+
+class Command(BaseCommand):
+    help = 'Render the stored HTML of task descriptions and comments written before Markdown support'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Re-render every row, e.g. after changing the renderer')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Rows rendered and updated per query (default: 500)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model, queryset in [
+            (Task, Task.all_objects.all()),
+            (Comment, Comment.all_objects.select_related('task')),
+        ]:
+            source, html_field, excerpt_field = model.rich_text
+            if not options['all']:
+                queryset = queryset.filter(**{html_field: ''}).exclude(**{source: ''})
+            fields = [field for field in (html_field, excerpt_field) if field]
+            total = 0
+            for alias in shard_aliases():
+                last_pk = 0
+                while True:
+                    batch = list(queryset.using(alias).filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+                    if not batch:
+                        break
+                    render_rich_text(batch, alias)
+                    # bulk_update leaves version and updated_at alone: the text itself didn't change
+                    model.all_objects.using(alias).bulk_update(batch, fields)
+                    last_pk = batch[-1].pk
+                    total += len(batch)
+            self.stdout.write(self.style.SUCCESS(
+                f'Rendered {total} {model._meta.verbose_name_plural.lower()}'
+            ))
@@ -1,8 +1,34 @@
-from django.db import models
+import calendar
+from datetime import timedelta
+
+from django.db import models, router, transaction
+from django.db.models import Case, F, Value, When
 from django.conf import settings
 from django.urls import reverse
-from workspaces.models import Workspace
+from workspaces.changes import record_change
+from workspaces.models import Change, Workspace
+from workspaces.webhooks import comment_payload, record_event, task_payload
 from django.utils import timezone
+from core.sharding import ShardedQuerySet, on_shard_of
+from .richtext import render_rich_text
+
+
+class TaskConflict(Exception):
+    """Raised when a task changed since the version an edit was based on"""
+
+
+class DependencyCycle(Exception):
+    """Raised when a new dependency would make a task (indirectly) block itself"""
+
+
+class TaskManager(models.Manager.from_queryset(ShardedQuerySet)):
+    """Hide tasks pending deletion, directly or through their workspace"""
+    
+    def get_queryset(self):
+        return super().get_queryset().filter(
+            deleted_at__isnull=True,
+            workspace__deleted_at__isnull=True,
+        )
 
 
 class Task(models.Model):
@@ -11,10 +37,10 @@ class Task(models.Model):
     Tasks can be assigned to workspace members and have status/priority.
     """
     
-    # Status choices
-    STATUS_TODO = 'TODO'
-    STATUS_IN_PROGRESS = 'IN_PROGRESS'
-    STATUS_DONE = 'DONE'
+    # Status choices, stored as small integers in workflow order
+    STATUS_TODO = 1
+    STATUS_IN_PROGRESS = 2
+    STATUS_DONE = 3
     
     STATUS_CHOICES = [
         (STATUS_TODO, 'To Do'),
@@ -22,10 +48,10 @@ class Task(models.Model):
         (STATUS_DONE, 'Done'),
     ]
     
-    # Priority choices
-    PRIORITY_LOW = 'LOW'
-    PRIORITY_MEDIUM = 'MEDIUM'
-    PRIORITY_HIGH = 'HIGH'
+    # Priority choices, stored as small integers so they sort by importance
+    PRIORITY_LOW = 1
+    PRIORITY_MEDIUM = 2
+    PRIORITY_HIGH = 3
     
     PRIORITY_CHOICES = [
         (PRIORITY_LOW, 'Low'),
@@ -33,9 +59,20 @@ class Task(models.Model):
         (PRIORITY_HIGH, 'High'),
     ]
     
+    # Task lists: most important first, then soonest due (see the indexes below)
+    LIST_ORDERING = ['-priority', F('due_date').asc(nulls_last=True), 'pk']
+    
+    # Names used by webhook and sync payloads, which predate the integers
+    STATUS_NAMES = {STATUS_TODO: 'TODO', STATUS_IN_PROGRESS: 'IN_PROGRESS', STATUS_DONE: 'DONE'}
+    PRIORITY_NAMES = {PRIORITY_LOW: 'LOW', PRIORITY_MEDIUM: 'MEDIUM', PRIORITY_HIGH: 'HIGH'}
+    
     # Basic fields
     title = models.CharField(max_length=200)
-    description = models.TextField(blank=True, help_text="Detailed description of the task")
+    # Enforced by forms: rendering runs on every save, so the source is bounded
+    description = models.TextField(max_length=20000, blank=True, help_text="Detailed description of the task (Markdown)")
+    # Rendered from description on save (tasks.richtext), so pages never parse Markdown
+    description_html = models.TextField(blank=True, editable=False)
+    description_excerpt = models.CharField(max_length=255, blank=True, editable=False)
     
     # Relationships
     workspace = models.ForeignKey(
@@ -45,9 +82,11 @@ class Task(models.Model):
         help_text="Workspace this task belongs to"
     )
     
+    # User keys carry no database constraint, see Workspace.owner
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_constraint=False,
         related_name='created_tasks',
         help_text="User who created this task"
     )
@@ -55,6 +94,7 @@ class Task(models.Model):
     assigned_to = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
+        db_constraint=False,
         related_name='assigned_tasks',
         null=True,
         blank=True,
@@ -62,14 +102,12 @@ class Task(models.Model):
     )
     
     # Task properties
-    status = models.CharField(
-        max_length=20,
+    status = models.PositiveSmallIntegerField(
         choices=STATUS_CHOICES,
         default=STATUS_TODO
     )
     
-    priority = models.CharField(
-        max_length=20,
+    priority = models.PositiveSmallIntegerField(
         choices=PRIORITY_CHOICES,
         default=PRIORITY_MEDIUM
     )
@@ -80,18 +118,163 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Set when deletion is requested; rows are removed later in batches (core.deletion)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    # Bumped on every write, so edits based on an older copy can be detected
+    version = models.PositiveIntegerField(default=1, editable=False)
+    
+    labels = models.ManyToManyField(
+        'Label',
+        through='TaskLabel',
+        related_name='tasks',
+        blank=True
+    )
+    
+    # Subtasks point at the task they break down
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        related_name='subtasks',
+        null=True,
+        blank=True,
+    )
+    
+    # Set on occurrences materialized from a recurring template task
+    recurring_from = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        related_name='occurrences',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    occurrence_date = models.DateField(null=True, blank=True, editable=False)
+    
+    objects = TaskManager()
+    all_objects = ShardedQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Task'
         verbose_name_plural = 'Tasks'
+        indexes = [
+            # Archiver scan: done tasks of a workspace by age
+            models.Index(fields=['workspace', 'status', 'updated_at']),
+            # Calendars and the iCal feed: tasks due in a date range
+            models.Index(fields=['due_date', 'status']),
+            # Task lists in LIST_ORDERING, per workspace, assignee and creator
+            models.Index(fields=['workspace', '-priority', 'due_date', 'id']),
+            models.Index(fields=['assigned_to', '-priority', 'due_date', 'id']),
+            models.Index(fields=['created_by', '-priority', 'due_date', 'id']),
+            # Reminder scans (tasks.reminders): open (To Do, In Progress)
+            # tasks by due date, and open tasks with a due date by last change
+            models.Index(
+                fields=['due_date'],
+                condition=models.Q(status__in=[1, 2], deleted_at__isnull=True),
+                name='task_open_due_date',
+            ),
+            models.Index(
+                fields=['updated_at'],
+                condition=models.Q(status__in=[1, 2], deleted_at__isnull=True, due_date__isnull=False),
+                name='task_open_dated_updated_at',
+            ),
+        ]
+        constraints = [
+            # Lets the materializer insert with ignore_conflicts and stay idempotent
+            models.UniqueConstraint(
+                fields=['recurring_from', 'occurrence_date'],
+                name='unique_task_occurrence',
+            ),
+        ]
     
     def __str__(self):
         return self.title
     
+    rich_text = ('description', 'description_html', 'description_excerpt')
+    
+    @property
+    def rich_text_workspace_id(self):
+        return self.workspace_id
+    
+    def save(self, *args, **kwargs):
+        # Full saves (admin, scripts) count as a new version too
+        adding = self._state.adding
+        if not adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        db = kwargs.get('using') or router.db_for_write(Task, instance=self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'description' in update_fields:
+            render_rich_text([self], db)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'description_html', 'description_excerpt'}
+        # The webhook event and sync change commit or roll back with the task
+        with transaction.atomic(using=db):
+            super().save(*args, **kwargs)
+            record_event(self.workspace_id, 'task.created' if adding else 'task.updated', task_payload(self), db)
+            record_change(Change.KIND_TASK, self.workspace_id, self.pk, db)
+    
     def get_absolute_url(self):
         """Return URL for task detail page"""
         return reverse('tasks:detail', kwargs={'pk': self.pk})
     
+    def is_done(self):
+        return self.status == self.STATUS_DONE
+    
+    def list_sort_key(self):
+        """LIST_ORDERING in Python, for merging lists read from several shards"""
+        return (-self.priority, self.due_date is None, self.due_date, self.pk)
+    
+    def update_versioned(self, changes, expected_version=None):
+        """
+        Write only ``changes`` in one UPDATE and bump the version.
+        
+        With ``expected_version`` the UPDATE only matches while the row is
+        still at that version, so a stale edit raises TaskConflict instead
+        of overwriting someone else's change. Values may be expressions;
+        the stored results are read back onto the instance.
+        """
+        # all_objects keeps this a plain primary-key UPDATE (no join to workspaces)
+        tasks = on_shard_of(Task.all_objects.filter(pk=self.pk, deleted_at__isnull=True), self)
+        matching = tasks if expected_version is None else tasks.filter(version=expected_version)
+        if 'description' in changes:
+            self.description = changes['description']
+            render_rich_text([self], tasks.db)
+            changes = {
+                **changes,
+                'description_html': self.description_html,
+                'description_excerpt': self.description_excerpt,
+            }
+        now = timezone.now()
+        with transaction.atomic(using=tasks.db):
+            if not matching.update(**changes, version=F('version') + 1, updated_at=now):
+                raise TaskConflict(f'Task {self.pk} was changed or deleted since version {expected_version}')
+            
+            fields = ['version', *(name for name, value in changes.items() if hasattr(value, 'resolve_expression'))]
+            for name, value in changes.items():
+                setattr(self, name, value)
+            for name, value in tasks.values(*fields).get().items():
+                setattr(self, name, value)
+            self.updated_at = now
+            record_event(self.workspace_id, 'task.updated', task_payload(self), tasks.db)
+            record_change(Change.KIND_TASK, self.workspace_id, self.pk, tasks.db)
+    
+    def advance_status(self, expected_version=None):
+        """
+        Move to the next status (To Do → In Progress → Done → To Do).
+        
+        The database picks the next status with CASE, so two toggles at the
+        same moment can't both start from the same status.
+        """
+        next_status = Case(
+            When(status=self.STATUS_TODO, then=Value(self.STATUS_IN_PROGRESS)),
+            When(status=self.STATUS_IN_PROGRESS, then=Value(self.STATUS_DONE)),
+            default=Value(self.STATUS_TODO),
+        )
+        self.update_versioned({'status': next_status}, expected_version)
+    
     def is_overdue(self):
         """Check if task is overdue"""
         if self.due_date and self.status != self.STATUS_DONE:
@@ -128,6 +311,20 @@ class Task(models.Model):
         # Only workspace owner or task creator can delete
         return self.workspace.is_owner(user) or self.created_by == user
     
+    def is_recurring(self):
+        """Check if this task is a recurring template or one of its occurrences"""
+        return self.recurring_from_id is not None or hasattr(self, 'recurrence')
+    
+
+class CommentManager(models.Manager.from_queryset(ShardedQuerySet)):
+    """Hide comments whose task or workspace is pending deletion"""
+    
+    def get_queryset(self):
+        return super().get_queryset().filter(
+            task__deleted_at__isnull=True,
+            task__workspace__deleted_at__isnull=True,
+        )
+
 
 class Comment(models.Model):
     """
@@ -145,15 +342,21 @@ class Comment(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_constraint=False,
         related_name='comments',
         help_text="User who wrote this comment"
     )
     
-    text = models.TextField(help_text="Comment text")
+    text = models.TextField(max_length=10000, help_text="Comment text (Markdown)")
+    # Rendered from text on save (tasks.richtext)
+    text_html = models.TextField(blank=True, editable=False)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = CommentManager()
+    all_objects = ShardedQuerySet.as_manager()
+    
     class Meta:
         ordering = ['created_at']  # Oldest first
         verbose_name = 'Comment'
@@ -162,6 +365,37 @@ class Comment(models.Model):
     def __str__(self):
         return f"{self.user.username} on {self.task.title}"
     
+    rich_text = ('text', 'text_html', None)
+    
+    @property
+    def rich_text_workspace_id(self):
+        return self.task.workspace_id
+    
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        db = kwargs.get('using') or router.db_for_write(Comment, instance=self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'text' in update_fields:
+            render_rich_text([self], db)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'text_html'}
+        with transaction.atomic(using=db):
+            super().save(*args, **kwargs)
+            record_event(
+                self.task.workspace_id,
+                'comment.created' if adding else 'comment.updated',
+                comment_payload(self),
+                db,
+            )
+            record_change(Change.KIND_COMMENT, self.task.workspace_id, self.pk, db)
+    
+    def delete(self, *args, **kwargs):
+        db = kwargs.get('using') or router.db_for_write(Comment, instance=self)
+        with transaction.atomic(using=db):
+            record_event(self.task.workspace_id, 'comment.deleted', comment_payload(self), db)
+            record_change(Change.KIND_COMMENT, self.task.workspace_id, self.pk, db, deleted=True)
+            return super().delete(*args, **kwargs)
+    
     def can_edit(self, user):
         """Check if user can edit this comment"""
         return self.user == user
@@ -173,4 +407,440 @@ class Comment(models.Model):
     
     def is_edited(self):
         """Check if comment was edited"""
-        return self.updated_at > self.created_at + timezone.timedelta(seconds=1)
\ No newline at end of file
+        return self.updated_at > self.created_at + timezone.timedelta(seconds=1)
+
+
+class RecurrenceRule(models.Model):
+    """
+    RecurrenceRule model - repeats a template task on a schedule (RRULE subset).
+    Occurrences are created as real tasks only up to a rolling horizon
+    (tasks.recurrence); dates further out are computed on the fly.
+    """
+    
+    FREQ_DAILY = 'DAILY'
+    FREQ_WEEKLY = 'WEEKLY'
+    FREQ_MONTHLY = 'MONTHLY'
+    
+    FREQUENCY_CHOICES = [
+        (FREQ_DAILY, 'Daily'),
+        (FREQ_WEEKLY, 'Weekly'),
+        (FREQ_MONTHLY, 'Monthly'),
+    ]
+    
+    WEEKDAY_CHOICES = [
+        ('MO', 'Mon'), ('TU', 'Tue'), ('WE', 'Wed'), ('TH', 'Thu'),
+        ('FR', 'Fri'), ('SA', 'Sat'), ('SU', 'Sun'),
+    ]
+    
+    template = models.OneToOneField(
+        Task,
+        on_delete=models.CASCADE,
+        related_name='recurrence',
+        help_text="Task copied for every occurrence"
+    )
+    
+    frequency = models.CharField(max_length=10, choices=FREQUENCY_CHOICES, default=FREQ_WEEKLY)
+    interval = models.PositiveIntegerField(default=1, help_text="Repeat every N days/weeks/months")
+    weekdays = models.CharField(
+        max_length=20,
+        blank=True,
+        help_text="Comma separated BYDAY codes for weekly rules, e.g. MO,WE"
+    )
+    
+    starts_on = models.DateField()
+    until = models.DateField(null=True, blank=True, help_text="Last possible occurrence date")
+    count = models.PositiveIntegerField(null=True, blank=True, help_text="Total number of occurrences")
+    
+    # Occurrences up to and including this date exist as tasks
+    materialized_until = models.DateField()
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Recurrence Rule'
+        verbose_name_plural = 'Recurrence Rules'
+        indexes = [
+            # Materializer scan: rules whose horizon has fallen behind
+            models.Index(fields=['materialized_until']),
+        ]
+    
+    def __str__(self):
+        return f"{self.template.title} ({self.as_rrule()})"
+    
+    def get_weekdays(self):
+        """BYDAY codes as weekday numbers (Monday = 0); defaults to the start's weekday"""
+        codes = [code for code, _ in self.WEEKDAY_CHOICES]
+        days = [codes.index(code) for code in self.weekdays.split(',') if code in codes]
+        return sorted(days) or [self.starts_on.weekday()]
+    
+    def iter_dates(self):
+        """Yield occurrence dates in order, from starts_on up to until/count"""
+        produced = 0
+        for day in self._candidate_dates():
+            if self.until and day > self.until:
+                return
+            yield day
+            produced += 1
+            if self.count and produced >= self.count:
+                return
+    
+    def _candidate_dates(self):
+        start = self.starts_on
+        if self.frequency == self.FREQ_DAILY:
+            day = start
+            while True:
+                yield day
+                day += timedelta(days=self.interval)
+        elif self.frequency == self.FREQ_WEEKLY:
+            week = start - timedelta(days=start.weekday())
+            weekdays = self.get_weekdays()
+            while True:
+                for weekday in weekdays:
+                    day = week + timedelta(days=weekday)
+                    if day >= start:
+                        yield day
+                week += timedelta(weeks=self.interval)
+        else:
+            # Months without the start's day (e.g. the 31st) are skipped, as in RFC 5545
+            months = start.year * 12 + start.month - 1
+            while True:
+                year, month = divmod(months, 12)
+                if start.day <= calendar.monthrange(year, month + 1)[1]:
+                    yield start.replace(year=year, month=month + 1)
+                months += self.interval
+    
+    def dates_between(self, first, last):
+        """Occurrence dates from first to last, inclusive"""
+        dates = []
+        for day in self.iter_dates():
+            if day > last:
+                break
+            if day >= first:
+                dates.append(day)
+        return dates
+    
+    def as_rrule(self):
+        """The rule as an RFC 5545 RRULE value"""
+        parts = [f'FREQ={self.frequency}', f'INTERVAL={self.interval}']
+        if self.frequency == self.FREQ_WEEKLY:
+            codes = [code for code, _ in self.WEEKDAY_CHOICES]
+            parts.append('BYDAY=' + ','.join(codes[day] for day in self.get_weekdays()))
+        if self.count:
+            parts.append(f'COUNT={self.count}')
+        if self.until:
+            parts.append(f'UNTIL={self.until:%Y%m%d}')
+        return ';'.join(parts)
+    
+    def describe(self):
+        """Human readable summary, e.g. 'Every 2 weeks on Mon, Wed'"""
+        unit = {self.FREQ_DAILY: 'day', self.FREQ_WEEKLY: 'week', self.FREQ_MONTHLY: 'month'}[self.frequency]
+        text = f'Every {unit}' if self.interval == 1 else f'Every {self.interval} {unit}s'
+        if self.frequency == self.FREQ_WEEKLY:
+            names = [name for _, name in self.WEEKDAY_CHOICES]
+            text += ' on ' + ', '.join(names[day] for day in self.get_weekdays())
+        elif self.frequency == self.FREQ_MONTHLY:
+            text += f' on day {self.starts_on.day}'
+        if self.until:
+            text += f' until {self.until:%b %d, %Y}'
+        if self.count:
+            text += f', {self.count} times'
+        return text
+
+
+class TaskDependency(models.Model):
+    """
+    TaskDependency model - an edge of the workspace's dependency graph:
+    ``task`` is blocked until ``blocker`` is done. See tasks.graph.
+    """
+    
+    task = models.ForeignKey(
+        Task,
+        on_delete=models.CASCADE,
+        related_name='dependencies'
+    )
+    
+    blocker = models.ForeignKey(
+        Task,
+        on_delete=models.CASCADE,
+        related_name='dependents'
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'Task Dependency'
+        verbose_name_plural = 'Task Dependencies'
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'blocker'], name='unique_task_dependency'),
+            models.CheckConstraint(condition=~models.Q(task=F('blocker')), name='task_not_blocking_itself'),
+        ]
+    
+    def __str__(self):
+        return f"{self.task.title} blocked by {self.blocker.title}"
+
+
+class Label(models.Model):
+    """Label model - a workspace's own tags for categorizing tasks"""
+    
+    COLOR_CHOICES = [
+        ('primary', 'Blue'),
+        ('success', 'Green'),
+        ('danger', 'Red'),
+        ('warning', 'Yellow'),
+        ('info', 'Cyan'),
+        ('secondary', 'Gray'),
+        ('dark', 'Black'),
+    ]
+    
+    workspace = models.ForeignKey(
+        Workspace,
+        on_delete=models.CASCADE,
+        related_name='labels'
+    )
+    
+    name = models.CharField(max_length=50)
+    color = models.CharField(max_length=20, choices=COLOR_CHOICES, default='primary')
+    
+    # Kept up to date by tasks.labels, so filter chips need no COUNT query
+    task_count = models.PositiveIntegerField(default=0, editable=False)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['name']
+        verbose_name = 'Label'
+        verbose_name_plural = 'Labels'
+        constraints = [
+            models.UniqueConstraint(fields=['workspace', 'name'], name='unique_label_name'),
+        ]
+    
+    def __str__(self):
+        return self.name
+
+
+class TaskLabel(models.Model):
+    """TaskLabel model - a label attached to a task"""
+    
+    # Both directions are covered by the composite indexes below
+    task = models.ForeignKey(
+        Task,
+        on_delete=models.CASCADE,
+        related_name='task_labels',
+        db_index=False
+    )
+    
+    label = models.ForeignKey(
+        Label,
+        on_delete=models.CASCADE,
+        related_name='task_labels',
+        db_index=False
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = 'Task Label'
+        verbose_name_plural = 'Task Labels'
+        constraints = [
+            # Also the index for "labels of these tasks"
+            models.UniqueConstraint(fields=['task', 'label'], name='unique_task_label'),
+        ]
+        indexes = [
+            # Label filters: task ids per label, answered from the index alone
+            models.Index(fields=['label', 'task']),
+        ]
+    
+    def __str__(self):
+        return f"{self.task.title}: {self.label.name}"
+
+
+class Reminder(models.Model):
+    """
+    Reminder model - a due-soon or overdue notice for a task, recorded once
+    per task, kind and due date and sent in batches (tasks.reminders).
+    """
+    
+    KIND_DUE_SOON = 'DUE_SOON'
+    KIND_OVERDUE = 'OVERDUE'
+    
+    KIND_CHOICES = [
+        (KIND_DUE_SOON, 'Due soon'),
+        (KIND_OVERDUE, 'Overdue'),
+    ]
+    
+    task = models.ForeignKey(
+        Task,
+        on_delete=models.CASCADE,
+        related_name='reminders'
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # The due date reminded about; moving the due date allows a new reminder
+    due_date = models.DateField()
+    
+    # Assignee, or creator of an unassigned task
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name='reminders'
+    )
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # Failed sends; after REMINDER_MAX_ATTEMPTS the reminder is given up on
+    attempts = models.PositiveIntegerField(default=0)
+    failed_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = 'Reminder'
+        verbose_name_plural = 'Reminders'
+        constraints = [
+            # Each reminder fires once, however often the scan sees the task
+            models.UniqueConstraint(fields=['task', 'kind', 'due_date'], name='unique_task_reminder'),
+        ]
+        indexes = [
+            # Sender queue: only rows still to send are indexed
+            models.Index(
+                fields=['id'],
+                condition=models.Q(sent_at__isnull=True, failed_at__isnull=True),
+                name='reminder_unsent',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.task.title}"
+
+
+class ReminderScan(models.Model):
+    """
+    ReminderScan model - how far the reminder scan has got on this database.
+    Each shard keeps its own single row.
+    """
+    
+    # Open tasks due up to these dates have been checked
+    due_soon_through = models.DateField()
+    overdue_through = models.DateField()
+    # Open tasks changed since this time are checked again
+    changed_since = models.DateTimeField()
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Reminder Scan'
+        verbose_name_plural = 'Reminder Scans'
+    
+    def __str__(self):
+        return f"Reminders checked through {self.due_soon_through}"
+
+
+class ArchivedTask(models.Model):
+    """
+    ArchivedTask model - a done task moved out of the hot Task table.
+    Keeps the original primary key so it can be restored in place.
+    """
+    
+    STATUS_CHOICES = Task.STATUS_CHOICES
+    PRIORITY_CHOICES = Task.PRIORITY_CHOICES
+    STATUS_TODO = Task.STATUS_TODO
+    STATUS_IN_PROGRESS = Task.STATUS_IN_PROGRESS
+    STATUS_DONE = Task.STATUS_DONE
+    PRIORITY_LOW = Task.PRIORITY_LOW
+    PRIORITY_MEDIUM = Task.PRIORITY_MEDIUM
+    PRIORITY_HIGH = Task.PRIORITY_HIGH
+    
+    id = models.IntegerField(primary_key=True)
+    title = models.CharField(max_length=200)
+    description = models.TextField(blank=True)
+    description_html = models.TextField(blank=True)
+    description_excerpt = models.CharField(max_length=255, blank=True)
+    
+    workspace = models.ForeignKey(
+        Workspace,
+        on_delete=models.CASCADE,
+        related_name='archived_tasks'
+    )
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name='created_archived_tasks'
+    )
+    assigned_to = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        db_constraint=False,
+        related_name='assigned_archived_tasks',
+        null=True,
+        blank=True
+    )
+    
+    # Not a foreign key: the parent may be live, archived or gone
+    parent_id = models.IntegerField(null=True, blank=True)
+    
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES)
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICES)
+    due_date = models.DateField(null=True, blank=True)
+    
+    # Original timestamps, copied verbatim
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-updated_at']
+        verbose_name = 'Archived Task'
+        verbose_name_plural = 'Archived Tasks'
+        indexes = [
+            models.Index(fields=['workspace', '-updated_at']),
+        ]
+    
+    def __str__(self):
+        return self.title
+    
+    def get_absolute_url(self):
+        return reverse('tasks:archived_detail', kwargs={'pk': self.pk})
+    
+    get_status_badge_class = Task.get_status_badge_class
+    get_priority_badge_class = Task.get_priority_badge_class
+    
+    def can_restore(self, user):
+        """Same rule as deleting a live task"""
+        return self.workspace.is_owner(user) or self.created_by_id == user.pk
+
+
+class ArchivedComment(models.Model):
+    """ArchivedComment model - a comment archived together with its task"""
+    
+    id = models.IntegerField(primary_key=True)
+    task = models.ForeignKey(
+        ArchivedTask,
+        on_delete=models.CASCADE,
+        related_name='comments'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name='archived_comments'
+    )
+    text = models.TextField()
+    text_html = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'Archived Comment'
+        verbose_name_plural = 'Archived Comments'
+    
+    def __str__(self):
+        return f"{self.user.username} on {self.task.title}"
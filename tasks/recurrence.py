@@ -0,0 +1,139 @@
+import logging
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.sharding import assign_ids, shard_aliases
+from workspaces.changes import record_changes
+from workspaces.models import Change
+from .models import Task, RecurrenceRule
+
+logger = logging.getLogger(__name__)
+
+
+def horizon(today=None):
+    """Last date occurrences are created for"""
+    return (today or timezone.localdate()) + timedelta(days=settings.RECURRENCE_HORIZON_DAYS)
+
+
+def build_occurrence(rule, day):
+    """Unsaved task for one occurrence, copied from the rule's template"""
+    template = rule.template
+    return Task(
+        title=template.title,
+        description=template.description,
+        description_html=template.description_html,
+        description_excerpt=template.description_excerpt,
+        workspace_id=template.workspace_id,
+        created_by_id=template.created_by_id,
+        assigned_to_id=template.assigned_to_id,
+        priority=template.priority,
+        status=Task.STATUS_TODO,
+        due_date=day,
+        recurring_from_id=template.pk,
+        occurrence_date=day,
+    )
+
+
+def materialize_rule(rule, until=None, batch_size=500):
+    """
+    Create the rule's occurrences up to ``until`` (default: the horizon).
+
+    Only dates after materialized_until are considered, and dates that
+    already have an occurrence are skipped; the unique (recurring_from,
+    occurrence_date) constraint settles races with a concurrent run.
+    Returns the number of tasks created.
+    """
+    until = until or horizon()
+    if rule.materialized_until >= until:
+        return 0
+    template = rule.template
+    if template.deleted_at is not None or template.workspace.deleted_at is not None:
+        return 0
+
+    db = rule._state.db
+    dates = rule.dates_between(rule.materialized_until + timedelta(days=1), until)
+    occurrences = Task.all_objects.using(db).filter(recurring_from_id=template.pk)
+    with transaction.atomic(using=db):
+        existing = set(occurrences.filter(occurrence_date__in=dates).values_list('occurrence_date', flat=True))
+        new_dates = [day for day in dates if day not in existing]
+        Task.objects.using(db).bulk_create(
+            [build_occurrence(rule, day) for day in new_dates],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        # Ids aren't returned for ignore_conflicts inserts; the unique index finds them
+        created = list(occurrences.filter(occurrence_date__in=new_dates).values_list('workspace_id', 'pk'))
+        record_changes(Change.KIND_TASK, created, db)
+        RecurrenceRule.objects.using(db).filter(pk=rule.pk).update(materialized_until=until)
+    rule.materialized_until = until
+    return len(created)
+
+
+def materialize_all(batch_size=500):
+    """Bring every rule (on every shard) up to the horizon; return tasks created"""
+    until = horizon()
+    total = 0
+    for alias in shard_aliases():
+        rules = RecurrenceRule.objects.using(alias).filter(
+            materialized_until__lt=until,
+        ).select_related('template__workspace').order_by('pk')
+        for rule in rules.iterator(chunk_size=batch_size):
+            total += materialize_rule(rule, until, batch_size)
+    if total:
+        logger.info('Materialized %d recurring task(s) up to %s', total, until)
+    return total
+
+
+def upcoming_dates(rule, limit=5):
+    """Next occurrence dates beyond what has been materialized, computed without inserting"""
+    start = max(rule.materialized_until, timezone.localdate()) + timedelta(days=1)
+    return list(islice((day for day in rule.iter_dates() if day >= start), limit))
+
+
+def save_recurrence(task, rule):
+    """
+    Attach a new or edited rule to a template task and materialize it.
+
+    Changing a rule drops future occurrences nobody has touched yet
+    (still to do, never edited), so they are recreated on the new schedule.
+    """
+    db = task._state.db
+    today = timezone.localdate()
+    with transaction.atomic(using=db):
+        if rule._state.adding:
+            rule.template = task
+            rule.starts_on = task.due_date or today
+            # The template is the first occurrence; missed past dates aren't backfilled
+            rule.materialized_until = max(rule.starts_on, today - timedelta(days=1))
+        else:
+            clear_future_occurrences(task, today)
+            rule.starts_on = task.due_date or rule.starts_on
+            rule.materialized_until = max(rule.starts_on, min(rule.materialized_until, today))
+        assign_ids(RecurrenceRule, [rule])
+        rule.save(using=db)
+    materialize_rule(rule)
+    return rule
+
+
+def remove_recurrence(task):
+    """Stop a task from repeating; occurrences already created are kept unless untouched"""
+    db = task._state.db
+    with transaction.atomic(using=db):
+        clear_future_occurrences(task, timezone.localdate())
+        RecurrenceRule.objects.using(db).filter(template=task).delete()
+
+
+def clear_future_occurrences(task, today):
+    db = task._state.db
+    ids = list(Task.all_objects.using(db).filter(
+        recurring_from=task,
+        occurrence_date__gt=today,
+        status=Task.STATUS_TODO,
+        version=1,
+    ).values_list('pk', flat=True))
+    record_changes(Change.KIND_TASK, [(task.workspace_id, pk) for pk in ids], db, deleted=True)
+    return Task.all_objects.using(db).filter(pk__in=ids).delete()
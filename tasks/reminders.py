@@ -0,0 +1,238 @@
+"""
+Due-soon and overdue reminders.
+
+The remind_tasks command wakes up on a schedule and, on each shard,
+finds open tasks that crossed a threshold since its last run: due within
+REMINDER_DUE_SOON_DAYS, or past their due date. Two kinds of task can
+cross one:
+
+- tasks whose due date the scan's window has just reached, found with a
+  range scan over the partial index of open tasks by due date;
+- tasks created, edited or reopened since the last run, found with a
+  range scan over the partial index of open dated tasks by updated_at.
+
+So each run reads about one day's worth of due dates plus what changed,
+however many tasks exist. ReminderScan keeps the position per shard.
+
+A Reminder row is recorded per task, kind and due date, and its unique
+constraint makes sure each one fires once. The sender mails each user one
+digest of their unsent reminders, a batch at a time over one connection,
+and marks a user's reminders sent as soon as their digest went out. A
+digest that fails is retried on later runs, until its reminders have
+failed REMINDER_MAX_ATTEMPTS times.
+"""
+import logging
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from core.sharding import shard_aliases
+from .models import Task, Reminder, ReminderScan
+
+logger = logging.getLogger(__name__)
+
+# Tasks changed this close to the previous run are checked again, in case
+# their transaction committed after it read
+SETTLE_TIME = timedelta(minutes=1)
+
+
+def task_kind(due_date, today):
+    """Which reminder a task due on ``due_date`` gets today, if any"""
+    if due_date < today:
+        return Reminder.KIND_OVERDUE
+    if due_date <= today + timedelta(days=settings.REMINDER_DUE_SOON_DAYS):
+        return Reminder.KIND_DUE_SOON
+    return None
+
+
+def get_scan(alias, today, now):
+    """The shard's scan position; a first run starts from yesterday, not from every old task"""
+    scan = ReminderScan.objects.using(alias).first()
+    if scan is None:
+        scan = ReminderScan(
+            due_soon_through=today - timedelta(days=1),
+            overdue_through=today - timedelta(days=2),
+            changed_since=now,
+        )
+    return scan
+
+
+def candidates(alias, scan, today):
+    """Open tasks on a shard that may have crossed a threshold since the last scan"""
+    due_soon_through = today + timedelta(days=settings.REMINDER_DUE_SOON_DAYS)
+    # Live tasks of real workspaces; the filters match the partial indexes
+    tasks = Task.objects.using(alias).filter(
+        status__in=[Task.STATUS_TODO, Task.STATUS_IN_PROGRESS],
+        deleted_at__isnull=True,
+        workspace__is_template=False,
+    )
+    fields = ['pk', 'due_date', 'assigned_to_id', 'created_by_id']
+    newly_overdue = tasks.filter(
+        due_date__gt=scan.overdue_through,
+        due_date__lt=today,
+    )
+    newly_due_soon = tasks.filter(
+        due_date__gt=max(scan.due_soon_through, today - timedelta(days=1)),
+        due_date__lte=due_soon_through,
+    )
+    changed = tasks.filter(
+        updated_at__gte=scan.changed_since - SETTLE_TIME,
+        due_date__isnull=False,
+        due_date__lte=due_soon_through,
+    )
+    for queryset in [newly_overdue, newly_due_soon, changed]:
+        yield from queryset.order_by().values_list(*fields).iterator(chunk_size=1000)
+
+
+def record_reminders(alias, rows, today):
+    """
+    Reminders for (task id, due date, assignee id, creator id) rows not yet
+    reminded about; return how many were recorded.
+    """
+    wanted = {}
+    for task_id, due_date, assigned_to_id, created_by_id in rows:
+        kind = task_kind(due_date, today)
+        if kind is not None:
+            wanted[(task_id, kind, due_date)] = assigned_to_id or created_by_id
+    if not wanted:
+        return 0
+    existing = set(Reminder.objects.using(alias).filter(
+        task_id__in={task_id for task_id, _, _ in wanted},
+    ).values_list('task_id', 'kind', 'due_date'))
+    reminders = [
+        Reminder(task_id=task_id, kind=kind, due_date=due_date, user_id=user_id)
+        for (task_id, kind, due_date), user_id in wanted.items()
+        if (task_id, kind, due_date) not in existing
+    ]
+    # A concurrent scan may have got there first; the unique constraint decides
+    Reminder.objects.using(alias).bulk_create(reminders, ignore_conflicts=True)
+    return len(reminders)
+
+
+def scan_shard(alias, batch_size=500):
+    """Record the reminders due on one shard and move its scan position; return how many"""
+    now = timezone.now()
+    today = timezone.localdate(now)
+    scan = get_scan(alias, today, now)
+    recorded = 0
+    rows = candidates(alias, scan, today)
+    with transaction.atomic(using=alias):
+        while batch := list(islice(rows, batch_size)):
+            recorded += record_reminders(alias, batch, today)
+        scan.due_soon_through = max(scan.due_soon_through, today + timedelta(days=settings.REMINDER_DUE_SOON_DAYS))
+        scan.overdue_through = max(scan.overdue_through, today - timedelta(days=1))
+        scan.changed_since = now
+        scan.save(using=alias)
+    return recorded
+
+
+def scan_all(batch_size=500):
+    """Record due-soon and overdue reminders on every shard; return how many"""
+    total = sum(scan_shard(alias, batch_size) for alias in shard_aliases())
+    if total:
+        logger.info('Recorded %d reminder(s)', total)
+    return total
+
+
+# Sending
+
+def build_digest(user, reminders, domain):
+    """One email listing a user's reminders"""
+    lines = [f'Hi {user.username},', '']
+    for kind, heading in [(Reminder.KIND_OVERDUE, 'Overdue:'), (Reminder.KIND_DUE_SOON, 'Due soon:')]:
+        matching = sorted(
+            (reminder for reminder in reminders if reminder.kind == kind),
+            key=lambda reminder: reminder.due_date,
+        )
+        if matching:
+            lines.append(heading)
+            for reminder in matching:
+                url = f'https://{domain}{reverse("tasks:detail", args=[reminder.task_id])}'
+                lines.append(f'- {reminder.task.title} (due {reminder.due_date:%b %d}) {url}')
+            lines.append('')
+    overdue = sum(reminder.kind == Reminder.KIND_OVERDUE for reminder in reminders)
+    due_soon = len(reminders) - overdue
+    counts = [f'{overdue} overdue'] if overdue else []
+    if due_soon:
+        counts.append(f'{due_soon} due soon')
+    subject = f'TaskFlow reminder: {", ".join(counts)}'
+    return EmailMessage(subject, '\n'.join(lines), settings.DEFAULT_FROM_EMAIL, [user.email])
+
+
+def send_digest(alias, connection, user, reminders, domain):
+    """Mail one user's digest and mark its reminders sent; on failure count an attempt"""
+    rows = Reminder.objects.using(alias).filter(pk__in=[reminder.pk for reminder in reminders])
+    try:
+        if user is not None and user.email:
+            # Reopens the connection if a previous digest broke it
+            connection.open()
+            connection.send_messages([build_digest(user, reminders, domain)])
+    except Exception:
+        logger.exception('Reminder digest to user %s on %s failed', reminders[0].user_id, alias)
+        # Drop the connection; it may be unusable after the error
+        connection.close()
+        rows.update(attempts=F('attempts') + 1)
+        rows.filter(attempts__gte=settings.REMINDER_MAX_ATTEMPTS).update(failed_at=timezone.now())
+        return False
+    rows.update(sent_at=timezone.now())
+    return True
+
+
+def send_batch(alias, connection, batch_size, after=0):
+    """
+    Mail the next unsent reminders of a shard with a pk above ``after``, one
+    digest per user; return (reminders sent, last pk handled), or None once
+    the queue is done.
+    """
+    reminders = list(Reminder.objects.using(alias).filter(
+        sent_at__isnull=True,
+        failed_at__isnull=True,
+        pk__gt=after,
+    ).select_related('task').order_by('pk')[:batch_size])
+    if not reminders:
+        return None
+    by_user = {}
+    for reminder in reminders:
+        by_user.setdefault(reminder.user_id, []).append(reminder)
+    # Users live on the default database: one query for the whole batch
+    users = User.objects.only('username', 'email').in_bulk(list(by_user))
+    domain = Site.objects.get_current().domain
+    sent = 0
+    for user_id, user_reminders in by_user.items():
+        if send_digest(alias, connection, users.get(user_id), user_reminders, domain):
+            sent += len(user_reminders)
+    return sent, reminders[-1].pk
+
+
+def send_shard(alias, connection, batch_size):
+    """Send a shard's queued reminders, trying each once; return how many were sent"""
+    total = 0
+    after = 0
+    while result := send_batch(alias, connection, batch_size, after):
+        sent, after = result
+        total += sent
+    return total
+
+
+def send_pending(batch_size=None):
+    """Send every queued reminder over one mail connection; return how many"""
+    batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+    total = 0
+    with get_connection() as connection:
+        for alias in shard_aliases():
+            try:
+                total += send_shard(alias, connection, batch_size)
+            except Exception:
+                # One shard being down shouldn't hold up the others
+                logger.exception('Sending reminders on %s failed', alias)
+    if total:
+        logger.info('Sent %d reminder(s)', total)
+    return total
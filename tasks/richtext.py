@@ -0,0 +1,270 @@
+"""
+Markdown for task descriptions and comments, rendered once on save.
+
+Supports paragraphs, line breaks, headings, lists, quotes, fenced and
+inline code, **bold**, *italic*, [links](https://...) and bare URLs, plus
+@username mentions and #123 links to tasks of the same workspace.
+
+Everything is HTML-escaped before any markup is added, and links only
+accept http(s) and mailto URLs, so the stored HTML is safe to output as
+is. Models list their (source, html, excerpt) fields in ``rich_text``;
+render_rich_text() fills them for a batch of objects, resolving all
+their mentions and task links with one query each.
+
+Rendering runs inside saves, so every pattern here works in linear time:
+no pattern can backtrack over the rest of a line for each character.
+Emphasis delimiters are paired with a stack instead of a regex.
+"""
+import re
+from html import escape
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+EXCERPT_LENGTH = 200
+
+FENCE_RE = re.compile(r'^\s*```')
+HEADING_RE = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+BULLET_RE = re.compile(r'^\s*[-*+]\s+(.*)$')
+NUMBERED_RE = re.compile(r'^\s*\d{1,9}[.)]\s+(.*)$')
+QUOTE_RE = re.compile(r'^\s*>\s?(.*)$')
+
+CODE_RE = re.compile(r'`([^`\n]+)`')
+# Labels can't contain brackets, so a run of unclosed ones isn't rescanned
+LINK_RE = re.compile(r'\[([^\[\]\n]+)\]\(\s*([^)\s]+)\s*\)')
+URL_RE = re.compile(r'\bhttps?://[^\s<>"\']+[^\s<>"\'.,:;!?)\]]')
+SAFE_URL_RE = re.compile(r'^(https?://|mailto:)', re.IGNORECASE)
+MENTION_RE = re.compile(r'(?<![\w@])@([\w.+-]*[\w+-])')
+TASK_REF_RE = re.compile(r'(?<![\w&#/])#(\d{1,18})\b')
+DELIMITER_RE = re.compile(r'\*\*|__|\*|_')
+PLACEHOLDER_RE = re.compile('\x00(\\d+)\x00')
+
+
+class References:
+    """Mentioned users (by username) and linkable task ids, resolved up front"""
+
+    def __init__(self, usernames=(), task_ids=()):
+        self.usernames = set(usernames)
+        self.task_ids = set(task_ids)
+
+
+def find_references(text):
+    """(usernames, task ids) a text mentions, before checking they exist"""
+    without_code = CODE_RE.sub('', text or '')
+    return (
+        set(MENTION_RE.findall(without_code)),
+        {int(pk) for pk in TASK_REF_RE.findall(without_code)},
+    )
+
+
+def resolve_references(items, db, tasks=None):
+    """
+    References for [(text, workspace id)], in at most two queries.
+
+    Task links only resolve to live tasks of the text's own workspace
+    (or to ``tasks``, a queryset, when given).
+    """
+    from .models import Task
+
+    tasks = Task.objects.all() if tasks is None else tasks
+    usernames, task_ids = set(), {}
+    for text, workspace_id in items:
+        names, ids = find_references(text)
+        usernames |= names
+        for pk in ids:
+            task_ids.setdefault(pk, set()).add(workspace_id)
+    existing_users = set()
+    if usernames:
+        existing_users = set(get_user_model().objects.filter(
+            username__in=usernames,
+        ).values_list('username', flat=True))
+    linkable = {}
+    if task_ids:
+        for pk, workspace_id in tasks.using(db).filter(pk__in=task_ids).values_list('pk', 'workspace_id'):
+            if workspace_id in task_ids[pk]:
+                linkable.setdefault(workspace_id, set()).add(pk)
+    return existing_users, linkable
+
+
+# Rendering
+
+def render_inline(text, references):
+    """One line or paragraph of Markdown as escaped HTML"""
+    stash = []
+
+    def keep(html):
+        stash.append(html)
+        return f'\x00{len(stash) - 1}\x00'
+
+    def expand(html):
+        return PLACEHOLDER_RE.sub(lambda match: stash[int(match.group(1))], html)
+
+    def link(match):
+        label, url = match.groups()
+        if not SAFE_URL_RE.match(url):
+            return match.group(0)
+        # The label may hold stashed code spans; expand them before stashing the link
+        return keep(
+            f'<a href="{escape(url)}" rel="nofollow noopener noreferrer">'
+            f'{expand(format_emphasis(escape(label)))}</a>'
+        )
+
+    def mention(match):
+        if match.group(1) not in references.usernames:
+            return match.group(0)
+        return keep(f'<span class="mention">@{escape(match.group(1))}</span>')
+
+    def task_ref(match):
+        pk = int(match.group(1))
+        if pk not in references.task_ids:
+            return match.group(0)
+        return keep(f'<a href="{reverse("tasks:detail", args=[pk])}" class="task-ref">#{pk}</a>')
+
+    text = CODE_RE.sub(lambda match: keep(f'<code>{escape(match.group(1))}</code>'), text)
+    text = LINK_RE.sub(link, text)
+    text = URL_RE.sub(lambda match: keep(
+        f'<a href="{escape(match.group(0))}" rel="nofollow noopener noreferrer">{escape(match.group(0))}</a>'
+    ), text)
+    text = MENTION_RE.sub(mention, text)
+    text = TASK_REF_RE.sub(task_ref, text)
+    text = format_emphasis(escape(text))
+    return expand(text)
+
+
+EMPHASIS_TAGS = {'**': 'strong', '__': 'strong', '*': 'em', '_': 'em'}
+
+
+def is_word(char):
+    return char.isalnum() or char in '_*'
+
+
+def pair_emphasis(text, markup):
+    """
+    Replace paired **bold**/__bold__ and *italic*/_italic_ delimiters with
+    ``markup(tag, closing)``, in one pass.
+
+    An opener is followed by a non-space, a closer preceded by one; single
+    delimiters also need a non-word character outside, so snake_case stays
+    as is. A closer pairs with the latest open delimiter of its kind, and
+    openers left inside the pair stay literal, so tags always nest.
+    """
+    parts = []
+    openers = {delimiter: [] for delimiter in EMPHASIS_TAGS}
+    position = 0
+    for match in DELIMITER_RE.finditer(text):
+        delimiter = match.group()
+        start, end = match.span()
+        before = text[start - 1] if start else ' '
+        after = text[end] if end < len(text) else ' '
+        parts.append(text[position:start])
+        position = end
+        single = len(delimiter) == 1
+        stack = openers[delimiter]
+        if stack and not before.isspace() and not (single and is_word(after)):
+            opened = stack.pop()
+            for other in openers.values():
+                while other and other[-1] > opened:
+                    other.pop()
+            parts[opened] = markup(EMPHASIS_TAGS[delimiter], False)
+            parts.append(markup(EMPHASIS_TAGS[delimiter], True))
+        elif not after.isspace() and not (single and is_word(before)):
+            stack.append(len(parts))
+            parts.append(delimiter)
+        else:
+            parts.append(delimiter)
+    parts.append(text[position:])
+    return ''.join(parts)
+
+
+def format_emphasis(html):
+    return pair_emphasis(html, lambda tag, closing: f'</{tag}>' if closing else f'<{tag}>')
+
+
+def is_block_start(line):
+    return bool(
+        FENCE_RE.match(line) or HEADING_RE.match(line) or BULLET_RE.match(line)
+        or NUMBERED_RE.match(line) or QUOTE_RE.match(line)
+    )
+
+
+def render_markdown(text, references=None):
+    """Markdown source as safe HTML"""
+    references = references or References()
+    lines = (text or '').replace('\x00', '').replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    blocks = []
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        if not line.strip():
+            index += 1
+        elif FENCE_RE.match(line):
+            code = []
+            index += 1
+            while index < len(lines) and not FENCE_RE.match(lines[index]):
+                code.append(lines[index])
+                index += 1
+            index += 1
+            blocks.append(f'<pre><code>{escape(chr(10).join(code))}</code></pre>')
+        elif HEADING_RE.match(line):
+            hashes, title = HEADING_RE.match(line).groups()
+            # h1/h2 would outrank the page's own headings
+            level = min(len(hashes) + 3, 6)
+            blocks.append(f'<h{level}>{render_inline(title, references)}</h{level}>')
+            index += 1
+        elif BULLET_RE.match(line) or NUMBERED_RE.match(line):
+            pattern = BULLET_RE if BULLET_RE.match(line) else NUMBERED_RE
+            tag = 'ul' if pattern is BULLET_RE else 'ol'
+            items = []
+            while index < len(lines) and pattern.match(lines[index]):
+                items.append(render_inline(pattern.match(lines[index]).group(1), references))
+                index += 1
+            blocks.append(f'<{tag}>' + ''.join(f'<li>{item}</li>' for item in items) + f'</{tag}>')
+        elif QUOTE_RE.match(line):
+            quoted = []
+            while index < len(lines) and QUOTE_RE.match(lines[index]):
+                quoted.append(QUOTE_RE.match(lines[index]).group(1))
+                index += 1
+            blocks.append(f'<blockquote>{render_markdown(chr(10).join(quoted), references)}</blockquote>')
+        else:
+            paragraph = [line]
+            index += 1
+            while index < len(lines) and lines[index].strip() and not is_block_start(lines[index]):
+                paragraph.append(lines[index])
+                index += 1
+            blocks.append('<p>' + '<br>'.join(render_inline(part, references) for part in paragraph) + '</p>')
+    return '\n'.join(blocks)
+
+
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    """Plain text start of Markdown source, cut at a word, for lists"""
+    plain = '\n'.join(line for line in (text or '').splitlines() if not FENCE_RE.match(line))
+    plain = LINK_RE.sub(r'\1', plain)
+    plain = re.sub(r'^\s*(#{1,6}|[-*+>]|\d{1,9}[.)])\s+', '', plain, flags=re.MULTILINE)
+    plain = pair_emphasis(plain, lambda tag, closing: '').replace('`', '')
+    plain = ' '.join(plain.split())
+    if len(plain) <= length:
+        return plain
+    return plain[:length].rsplit(' ', 1)[0].rstrip('.,;:') + '…'
+
+
+def render_rich_text(objects, db, tasks=None):
+    """
+    Render the Markdown fields of tasks or comments in place.
+
+    Each object's ``rich_text`` names its (source, html, excerpt) fields
+    (excerpt may be None) and ``rich_text_workspace_id`` its workspace.
+    ``tasks`` is passed on to resolve_references().
+    """
+    objects = list(objects)
+    if not objects:
+        return
+    usernames, linkable = resolve_references(
+        [(getattr(obj, obj.rich_text[0]), obj.rich_text_workspace_id) for obj in objects], db, tasks,
+    )
+    for obj in objects:
+        source, html_field, excerpt_field = obj.rich_text
+        text = getattr(obj, source)
+        references = References(usernames, linkable.get(obj.rich_text_workspace_id, ()))
+        setattr(obj, html_field, render_markdown(text, references))
+        if excerpt_field:
+            setattr(obj, excerpt_field, make_excerpt(text))
@@ -0,0 +1,64 @@
+import time
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from accounts.models import User
+from workspaces.models import Change, Workspace
+from .models import Task, TaskConflict
+from .richtext import References, make_excerpt, render_inline, render_markdown
+
+
+class RichTextTests(SimpleTestCase):
+    """Markdown rendering runs inside saves, so it must stay fast on any input"""
+    
+    def test_emphasis(self):
+        html = render_inline('**bold**, *it*, _it_ and snake_case_name', References())
+        self.assertEqual(html, '<strong>bold</strong>, <em>it</em>, <em>it</em> and snake_case_name')
+        self.assertEqual(render_inline('*a *b*', References()), '*a <em>b</em>')
+        self.assertEqual(make_excerpt('Some **bold** text'), 'Some bold text')
+    
+    def test_code_in_link_label(self):
+        html = render_markdown('see [`code` and *more*](https://x.com)')
+        self.assertEqual(html, (
+            '<p>see <a href="https://x.com" rel="nofollow noopener noreferrer">'
+            '<code>code</code> and <em>more</em></a></p>'
+        ))
+        self.assertNotIn('\x00', render_markdown('[`a` `b`](https://x.com) `c`'))
+    
+    def test_unclosed_delimiters_render_in_linear_time(self):
+        for text in ['*a ' * 20000, '_a ' * 20000, '**a ' * 15000, '[' * 60000, '[a' * 30000]:
+            started = time.perf_counter()
+            render_markdown(text)
+            make_excerpt(text)
+            # Quadratic patterns took tens of seconds here
+            self.assertLess(time.perf_counter() - started, 2, text[:10])
+
+
+@override_settings(WORKSPACE_SHARDS=['default'])
+class VersionedUpdateTests(TestCase):
+    """Edits based on an old version of a task are refused, not applied over newer ones"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.workspace = Workspace.objects.create(name='A', owner=self.user)
+        self.task = Task.objects.create(workspace=self.workspace, title='Old', created_by=self.user)
+    
+    def test_update_bumps_the_version(self):
+        self.task.update_versioned({'title': 'New'}, self.task.version)
+        self.assertEqual(self.task.version, 2)
+        self.assertEqual(Task.objects.get(pk=self.task.pk).title, 'New')
+    
+    def test_stale_version_raises_conflict_and_changes_nothing(self):
+        stale = Task.objects.get(pk=self.task.pk)
+        self.task.update_versioned({'title': 'First'}, self.task.version)
+        changes = Change.objects.count()
+        with self.assertRaises(TaskConflict):
+            stale.update_versioned({'title': 'Second'}, stale.version)
+        task = Task.objects.get(pk=self.task.pk)
+        self.assertEqual((task.title, task.version), ('First', 2))
+        self.assertEqual(Change.objects.count(), changes)
+    
+    def test_deleted_task_raises_conflict(self):
+        Task.all_objects.filter(pk=self.task.pk).update(deleted_at=self.task.created_at)
+        with self.assertRaises(TaskConflict):
+            self.task.update_versioned({'title': 'New'})
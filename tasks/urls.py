@@ -7,15 +7,28 @@ urlpatterns = [
     # Workspace tasks
     path('workspace/<int:workspace_id>/', views.TaskListView.as_view(), name='list'),
     path('workspace/<int:workspace_id>/create/', views.TaskCreateView.as_view(), name='create'),
+    path('workspace/<int:workspace_id>/calendar/', views.task_calendar, name='calendar'),
+    path('workspace/<int:workspace_id>/archived/', views.ArchivedTaskListView.as_view(), name='archived'),
+    path('workspace/<int:workspace_id>/labels/', views.manage_labels, name='labels'),
+    path('workspace/<int:workspace_id>/labels/<int:label_id>/delete/', views.delete_label, name='delete_label'),
     
     # Individual task
     path('<int:pk>/', views.TaskDetailView.as_view(), name='detail'),
     path('<int:pk>/update/', views.TaskUpdateView.as_view(), name='update'),
     path('<int:pk>/delete/', views.TaskDeleteView.as_view(), name='delete'),
     path('<int:pk>/toggle-status/', views.toggle_task_status, name='toggle_status'),
+    
+    # Dependencies
+    path('<int:pk>/blockers/add/', views.add_dependency, name='add_dependency'),
+    path('<int:pk>/blockers/<int:blocker_id>/remove/', views.remove_dependency, name='remove_dependency'),
+    path('<int:pk>/blocking/', views.TaskBlockingView.as_view(), name='blocking'),
 
     # Comments - ADD THESE LINES
     path('<int:task_id>/comment/add/', views.add_comment, name='add_comment'),
     path('comment/<int:pk>/edit/', views.edit_comment, name='edit_comment'),
     path('comment/<int:pk>/delete/', views.delete_comment, name='delete_comment'),
+    
+    # Archive
+    path('archived/<int:pk>/', views.ArchivedTaskDetailView.as_view(), name='archived_detail'),
+    path('archived/<int:pk>/restore/', views.restore_archived_task, name='restore'),
 ]
\ No newline at end of file
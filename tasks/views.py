@@ -2,12 +2,20 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
+from django.http import HttpResponseRedirect
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy, reverse
 from django.db.models import Q
-from .models import Task, Comment
-from .forms import TaskForm, TaskFilterForm, CommentForm
+from django.utils import timezone
+from .models import Task, TaskConflict, Comment, RecurrenceRule, DependencyCycle, Label, ArchivedTask
+from .archive import restore_task
+from .calendars import VIEW_CHOICES, VIEW_MONTH, calendar_range, fill_weeks, parse_day, tasks_due_between
+from .forms import TaskForm, RecurrenceForm, DependencyForm, TaskFilterForm, LabelForm, CommentForm
+from .graph import add_dependency as add_task_dependency, critical_path, rollup, subtask_tree
+from .labels import MATCH_ANY, filter_by_labels, set_task_labels
+from .recurrence import save_recurrence, remove_recurrence, upcoming_dates
 from workspaces.models import Workspace
+from core.deletion import schedule_deletion
 
 
 class TaskListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
@@ -25,26 +33,31 @@ class TaskListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
     def get_queryset(self):
         """Return filtered tasks for workspace"""
         workspace_id = self.kwargs['workspace_id']
-        queryset = Task.objects.filter(workspace_id=workspace_id)
+        queryset = Task.objects.filter(workspace_id=workspace_id).select_related(
+            'recurrence'
+        ).prefetch_related('labels')
         
         # Apply filters
-        status = self.request.GET.get('status')
-        priority = self.request.GET.get('priority')
+        status = self.request.GET.get('status', '')
+        priority = self.request.GET.get('priority', '')
         assigned_to = self.request.GET.get('assigned_to')
         
-        if status:
+        if status.isdigit():
             queryset = queryset.filter(status=status)
         
-        if priority:
+        if priority.isdigit():
             queryset = queryset.filter(priority=priority)
         
-        if assigned_to:
-            if assigned_to == 'unassigned':
-                queryset = queryset.filter(assigned_to__isnull=True)
-            else:
-                queryset = queryset.filter(assigned_to_id=assigned_to)
+        if assigned_to == 'unassigned':
+            queryset = queryset.filter(assigned_to__isnull=True)
+        elif assigned_to and assigned_to.isdigit():
+            queryset = queryset.filter(assigned_to_id=assigned_to)
         
-        return queryset
+        label_ids = [int(pk) for pk in self.request.GET.getlist('labels') if pk.isdigit()]
+        if label_ids:
+            queryset = filter_by_labels(queryset, ids=label_ids, match=self.request.GET.get('match', MATCH_ANY))
+        
+        return queryset.order_by(*Task.LIST_ORDERING)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -88,11 +101,55 @@ class TaskDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
         for comment in comments:
             comment.can_edit_by_user = comment.can_edit(self.request.user)
             comment.can_delete_by_user = comment.can_delete(self.request.user)
+        
+        context['dependencies'] = task.dependencies.select_related('blocker')
+        context['dependents'] = task.dependents.select_related('task')
+        context['dependency_form'] = DependencyForm(task=task)
+        context['subtasks'] = subtask_tree(task)
+        if context['subtasks']:
+            context['rollup'] = rollup(task)
+        
+        # Scheduled occurrences come from the rule; dates past the horizon are never stored
+        rule = get_recurrence_rule(task)
+        if rule:
+            context['recurrence'] = rule
+            context['next_occurrences'] = task.occurrences.filter(
+                occurrence_date__gte=timezone.localdate()
+            ).order_by('occurrence_date')[:5]
+            context['upcoming_dates'] = upcoming_dates(rule)
 
         return context
 
 
-class TaskCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
+def get_recurrence_rule(task):
+    """The task's recurrence rule, or None if it doesn't repeat"""
+    try:
+        return task.recurrence
+    except RecurrenceRule.DoesNotExist:
+        return None
+
+
+class RecurrenceFormMixin:
+    """Adds the repeat settings to the task create/update views"""
+    
+    def get_repeat_form(self):
+        # Occurrences follow their template and can't repeat themselves
+        task = getattr(self, 'object', None)
+        if task is not None and task.recurring_from_id:
+            return None
+        rule = get_recurrence_rule(task) if task is not None else None
+        data = self.request.POST if self.request.method == 'POST' else None
+        return RecurrenceForm(data, instance=rule)
+    
+    def repeat_form_invalid(self, form, repeat_form):
+        return self.render_to_response(self.get_context_data(form=form, repeat_form=repeat_form))
+    
+    def get_context_data(self, **kwargs):
+        kwargs.setdefault('repeat_form', self.get_repeat_form())
+        return super().get_context_data(**kwargs)
+
+
+class TaskCreateView(LoginRequiredMixin, UserPassesTestMixin, RecurrenceFormMixin, CreateView):
     """Create a new task in workspace"""
     model = Task
     form_class = TaskForm
@@ -109,15 +166,32 @@ class TaskCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
         kwargs['workspace'] = get_object_or_404(Workspace, pk=self.kwargs['workspace_id'])
         return kwargs
     
+    def get_initial(self):
+        """"Add subtask" links pass the parent task"""
+        initial = super().get_initial()
+        initial['parent'] = self.request.GET.get('parent')
+        return initial
+    
     def form_valid(self, form):
         """Set workspace and created_by before saving"""
+        repeat_form = self.get_repeat_form()
+        if repeat_form.is_enabled() and not repeat_form.is_valid():
+            return self.repeat_form_invalid(form, repeat_form)
+        
         form.instance.workspace = get_object_or_404(Workspace, pk=self.kwargs['workspace_id'])
         form.instance.created_by = self.request.user
         messages.success(self.request, f'Task "{form.instance.title}" created successfully!')
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        if form.cleaned_data['labels']:
+            set_task_labels(self.object, form.cleaned_data['labels'])
+        if repeat_form.is_enabled():
+            save_recurrence(self.object, repeat_form.save(commit=False))
+        return response
     
     def get_success_url(self):
-        """Redirect to workspace task list"""
+        """Redirect to the parent task for subtasks, else to the workspace task list"""
+        if self.object.parent_id:
+            return reverse('tasks:detail', kwargs={'pk': self.object.parent_id})
         return reverse('tasks:list', kwargs={'workspace_id': self.kwargs['workspace_id']})
     
     def get_context_data(self, **kwargs):
@@ -126,7 +200,7 @@ class TaskCreateView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
         return context
 
 
-class TaskUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+class TaskUpdateView(LoginRequiredMixin, UserPassesTestMixin, RecurrenceFormMixin, UpdateView):
     """Update an existing task"""
     model = Task
     form_class = TaskForm
@@ -144,8 +218,47 @@ class TaskUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
         return kwargs
     
     def form_valid(self, form):
-        messages.success(self.request, f'Task "{form.instance.title}" updated successfully!')
-        return super().form_valid(form)
+        """Write only the changed fields, and only if nobody saved the task meanwhile"""
+        repeat_form = self.get_repeat_form()
+        if repeat_form is not None and repeat_form.is_enabled() and not repeat_form.is_valid():
+            return self.repeat_form_invalid(form, repeat_form)
+        
+        changes = {
+            name: form.cleaned_data[name]
+            for name in form.changed_data if name in TaskForm.Meta.fields
+        }
+        if changes:
+            try:
+                self.object.update_versioned(changes, form.cleaned_data['version'])
+            except TaskConflict:
+                return self.conflict(form)
+        if 'labels' in form.changed_data:
+            set_task_labels(self.object, form.cleaned_data['labels'])
+        
+        if repeat_form is not None:
+            rule = repeat_form.instance
+            if repeat_form.is_enabled():
+                # Rebuild untouched future occurrences so they pick up the edit
+                if changes or repeat_form.has_changed():
+                    save_recurrence(self.object, repeat_form.save(commit=False))
+            elif rule.pk:
+                remove_recurrence(self.object)
+        messages.success(self.request, f'Task "{self.object.title}" updated successfully!')
+        return HttpResponseRedirect(self.get_success_url())
+    
+    def conflict(self, form):
+        """Keep the user's input, but base the next save on the current version"""
+        current = Task.objects.filter(pk=self.object.pk).values_list('version', flat=True).first()
+        if current is None:
+            messages.error(self.request, 'This task has been deleted.')
+            return redirect('core:dashboard')
+        form.data = form.data.copy()
+        form.data['version'] = current
+        form.add_error(None, (
+            'Someone else changed this task while you were editing it. '
+            'Check the task in another tab, then save again to overwrite their changes.'
+        ))
+        return self.render_to_response(self.get_context_data(form=form), status=409)
     
     def get_success_url(self):
         """Redirect to task detail"""
@@ -172,6 +285,11 @@ class TaskDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         workspace_id = self.object.workspace.pk
         messages.success(self.request, f'Task "{self.object.title}" deleted successfully!')
         return reverse('tasks:list', kwargs={'workspace_id': workspace_id})
+    
+    def form_valid(self, form):
+        """Hide the task now; it and its comments are purged in the background"""
+        schedule_deletion(self.object, self.request.user)
+        return HttpResponseRedirect(self.get_success_url())
 
 
 @login_required
@@ -184,21 +302,163 @@ def toggle_task_status(request, pk):
         messages.error(request, "You don't have permission to edit this task.")
         return redirect('tasks:detail', pk=pk)
     
-    # Toggle status
-    if task.status == Task.STATUS_TODO:
-        task.status = Task.STATUS_IN_PROGRESS
-    elif task.status == Task.STATUS_IN_PROGRESS:
-        task.status = Task.STATUS_DONE
-    else:  # DONE
-        task.status = Task.STATUS_TODO
+    # Based on the version the page showed, so a double click doesn't advance twice
+    try:
+        expected_version = int(request.POST.get('version', task.version))
+    except ValueError:
+        expected_version = task.version
     
-    task.save()
+    try:
+        task.advance_status(expected_version)
+    except TaskConflict:
+        return render(request, 'errors/409.html', {'task': task}, status=409)
     messages.success(request, f'Task status updated to "{task.get_status_display()}"')
     
     # Redirect back to referring page or task detail
     return redirect(request.META.get('HTTP_REFERER', reverse('tasks:detail', kwargs={'pk': pk})))
 
 
+class TaskBlockingView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
+    """What still blocks a task (e.g. a release): critical path and tasks ready to start"""
+    model = Task
+    template_name = 'tasks/task_blocking.html'
+    context_object_name = 'task'
+    
+    # Ready tasks listed; the rest are only counted
+    ready_limit = 50
+    
+    def test_func(self):
+        """Only workspace members can view task"""
+        task = self.get_object()
+        user = self.request.user
+        return task.workspace.is_owner(user) or task.workspace.is_member(user)
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        graph = critical_path(self.object)
+        ready_ids = graph['ready'][:self.ready_limit]
+        tasks = Task.objects.using(self.object._state.db).prefetch_related('assigned_to').in_bulk(
+            graph['path'] + ready_ids
+        )
+        context['path'] = [tasks[pk] for pk in graph['path'] if pk in tasks]
+        context['ready'] = sorted(
+            (tasks[pk] for pk in ready_ids if pk in tasks),
+            key=lambda task: (task.due_date is None, task.due_date),
+        )
+        context['ready_count'] = len(graph['ready'])
+        context['blocker_count'] = graph['blockers']
+        context['edge_count'] = graph['edges']
+        return context
+
+
+@login_required
+def add_dependency(request, pk):
+    """Mark a task as blocked by another task"""
+    task = get_object_or_404(Task, pk=pk)
+    
+    if not task.can_edit(request.user):
+        messages.error(request, "You don't have permission to edit this task.")
+        return redirect('tasks:detail', pk=pk)
+    
+    if request.method == 'POST':
+        form = DependencyForm(request.POST, task=task)
+        if form.is_valid():
+            blocker = form.cleaned_data['blocker']
+            try:
+                add_task_dependency(task, blocker)
+                messages.success(request, f'Task is now blocked by "{blocker.title}".')
+            except DependencyCycle:
+                messages.error(request, f'"{blocker.title}" already depends on this task, so it can\'t block it.')
+        else:
+            messages.error(request, ' '.join(form.errors['blocker']))
+    
+    return redirect('tasks:detail', pk=pk)
+
+
+@login_required
+def remove_dependency(request, pk, blocker_id):
+    """Remove a "blocked by" link"""
+    task = get_object_or_404(Task, pk=pk)
+    
+    if not task.can_edit(request.user):
+        messages.error(request, "You don't have permission to edit this task.")
+        return redirect('tasks:detail', pk=pk)
+    
+    if request.method == 'POST':
+        task.dependencies.filter(blocker_id=blocker_id).delete()
+        messages.success(request, "Dependency removed.")
+    
+    return redirect('tasks:detail', pk=pk)
+
+
+@login_required
+def manage_labels(request, workspace_id):
+    """List a workspace's labels and create new ones"""
+    workspace = get_object_or_404(Workspace, pk=workspace_id)
+    
+    if not (workspace.is_owner(request.user) or workspace.is_member(request.user)):
+        messages.error(request, "You don't have access to this workspace.")
+        return redirect('workspaces:list')
+    
+    form = LabelForm(request.POST or None, workspace=workspace)
+    if request.method == 'POST':
+        if form.is_valid():
+            label = form.save()
+            messages.success(request, f'Label "{label.name}" created.')
+            return redirect('tasks:labels', workspace_id=workspace_id)
+    
+    context = {
+        'workspace': workspace,
+        'labels': Label.objects.filter(workspace=workspace),
+        'form': form,
+        'is_owner': workspace.is_owner(request.user),
+    }
+    return render(request, 'tasks/label_list.html', context)
+
+
+@login_required
+def delete_label(request, workspace_id, label_id):
+    """Delete a label and remove it from all tasks (only owner can delete)"""
+    workspace = get_object_or_404(Workspace, pk=workspace_id)
+    
+    if not workspace.is_owner(request.user):
+        messages.error(request, "Only workspace owner can delete labels.")
+        return redirect('tasks:labels', workspace_id=workspace_id)
+    
+    if request.method == 'POST':
+        label = get_object_or_404(Label, pk=label_id, workspace=workspace)
+        label.delete()
+        messages.success(request, f'Label "{label.name}" deleted.')
+    
+    return redirect('tasks:labels', workspace_id=workspace_id)
+
+
+@login_required
+def task_calendar(request, workspace_id):
+    """Month or week calendar of a workspace's tasks by due date"""
+    workspace = get_object_or_404(Workspace, pk=workspace_id)
+    
+    if not (workspace.is_owner(request.user) or workspace.is_member(request.user)):
+        messages.error(request, "You don't have access to this workspace.")
+        return redirect('workspaces:list')
+    
+    view = request.GET.get('view', VIEW_MONTH)
+    day = parse_day(request.GET.get('date'))
+    shown = calendar_range(view, day)
+    tasks = tasks_due_between(
+        Task.objects.filter(workspace=workspace), shown['first'], shown['last'],
+    ).prefetch_related('assigned_to')
+    
+    context = {
+        'workspace': workspace,
+        'calendar': shown,
+        'weeks': fill_weeks(shown['weeks'], tasks, month=day.month if view == VIEW_MONTH else None),
+        'view': view,
+        'VIEW_CHOICES': VIEW_CHOICES,
+    }
+    return render(request, 'tasks/task_calendar.html', context)
+
+
 @login_required
 def add_comment(request, task_id):
     """Add a comment to a task"""
@@ -270,4 +530,70 @@ def delete_comment(request, pk):
         'comment': comment,
         'task': comment.task,
     }
-    return render(request, 'tasks/comment_confirm_delete.html', context)
\ No newline at end of file
+    return render(request, 'tasks/comment_confirm_delete.html', context)
+
+
+class ArchivedTaskListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+    """List and search archived tasks of a workspace"""
+    model = ArchivedTask
+    template_name = 'tasks/archived_task_list.html'
+    context_object_name = 'tasks'
+    paginate_by = 20
+    
+    def test_func(self):
+        """Only workspace members can view archived tasks"""
+        workspace = get_object_or_404(Workspace, pk=self.kwargs['workspace_id'])
+        return workspace.is_owner(self.request.user) or workspace.is_member(self.request.user)
+    
+    def get_queryset(self):
+        queryset = ArchivedTask.objects.filter(
+            workspace_id=self.kwargs['workspace_id']
+        ).prefetch_related('created_by', 'assigned_to')
+        
+        query = self.request.GET.get('q', '').strip()
+        if query:
+            queryset = queryset.filter(Q(title__icontains=query) | Q(description__icontains=query))
+        
+        return queryset
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['workspace'] = get_object_or_404(Workspace, pk=self.kwargs['workspace_id'])
+        context['query'] = self.request.GET.get('q', '').strip()
+        return context
+
+
+class ArchivedTaskDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
+    """Read-only view of an archived task and its comments"""
+    model = ArchivedTask
+    template_name = 'tasks/archived_task_detail.html'
+    context_object_name = 'task'
+    
+    def test_func(self):
+        """Only workspace members can view archived task"""
+        task = self.get_object()
+        user = self.request.user
+        return task.workspace.is_owner(user) or task.workspace.is_member(user)
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['comments'] = self.object.comments.prefetch_related('user')
+        context['can_restore'] = self.object.can_restore(self.request.user)
+        return context
+
+
+@login_required
+def restore_archived_task(request, pk):
+    """Move an archived task back into the workspace's live tasks"""
+    archived = get_object_or_404(ArchivedTask, pk=pk)
+    
+    if not archived.can_restore(request.user):
+        messages.error(request, "You don't have permission to restore this task.")
+        return redirect('tasks:archived_detail', pk=pk)
+    
+    if request.method == 'POST':
+        task = restore_task(archived)
+        messages.success(request, f'Task "{task.title}" restored successfully!')
+        return redirect('tasks:detail', pk=task.pk)
+    
+    return redirect('tasks:archived_detail', pk=pk)
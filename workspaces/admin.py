@@ -1,15 +1,65 @@
+from django import forms
 from django.contrib import admin
-from .models import Workspace
+from django.core.exceptions import ValidationError
+from django.db.models import Count
+from django.db.models.signals import m2m_changed
+from django.forms.models import BaseInlineFormSet
+from accounts.models import User
+from core.admin_tools import LargeTableAdminMixin, autocomplete_filter
+from .models import Workspace, WorkspaceMembership, Webhook, WebhookDelivery
+from .webhooks import retry_dead
+
+
+class WorkspaceMembershipForm(forms.ModelForm):
+    """The owner's row is fixed (change the workspace owner instead); nobody else can be made owner"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.is_owner_row():
+            for field in self.fields.values():
+                field.disabled = True
+        else:
+            self.fields['role'].choices = [
+                choice for choice in self.fields['role'].choices
+                if choice[0] != WorkspaceMembership.ROLE_OWNER
+            ]
+    
+    def is_owner_row(self):
+        return self.instance.pk is not None and self.instance.role == WorkspaceMembership.ROLE_OWNER
+
+
+class WorkspaceMembershipFormSet(BaseInlineFormSet):
+    """Membership rows of one workspace; the owner's can't be deleted"""
+    
+    def clean(self):
+        # Forms marked for deletion skip their own validation, so check them here
+        super().clean()
+        if any(form.is_owner_row() for form in self.deleted_forms):
+            raise ValidationError("The owner's membership can't be removed; change the owner instead.")
+
+
+class WorkspaceMembershipInline(admin.TabularInline):
+    """Members of a workspace with their roles"""
+    
+    model = WorkspaceMembership
+    form = WorkspaceMembershipForm
+    formset = WorkspaceMembershipFormSet
+    fields = ['user', 'role', 'joined_at']
+    readonly_fields = ['joined_at']
+    autocomplete_fields = ['user']
+    extra = 0
 
 
 @admin.register(Workspace)
-class WorkspaceAdmin(admin.ModelAdmin):
+class WorkspaceAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     """Admin interface for Workspace"""
     
-    list_display = ['name', 'owner', 'member_count', 'created_at']
+    list_display = ['name', 'owner', 'members_count', 'created_at']
     list_filter = ['created_at', 'updated_at']
     search_fields = ['name', 'description', 'owner__username']
-    filter_horizontal = ['members']  # Nice UI for many-to-many
+    ordering = ['-pk']
+    autocomplete_fields = ['owner']
+    inlines = [WorkspaceMembershipInline]
     
     readonly_fields = ['created_at', 'updated_at']
     
@@ -17,11 +67,64 @@ class WorkspaceAdmin(admin.ModelAdmin):
         ('Basic Info', {
             'fields': ('name', 'description', 'owner')
         }),
-        ('Members', {
-            'fields': ('members',)
-        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
-    )
\ No newline at end of file
+    )
+    
+    def get_queryset(self, request):
+        # Members counted in the changelist query instead of once per row
+        return super().get_queryset(request).annotate(
+            num_members=Count('membership_rows'),
+        ).prefetch_related('owner')
+    
+    @admin.display(description='Members', ordering='num_members')
+    def members_count(self, obj):
+        return obj.num_members
+    
+    def save_formset(self, request, form, formset, change):
+        """Membership edits log sync changes and webhook events like members.add/remove"""
+        if formset.model is not WorkspaceMembership:
+            return super().save_formset(request, form, formset, change)
+        workspace = form.instance
+        before = set(workspace.memberships().values_list('user_id', flat=True))
+        super().save_formset(request, form, formset, change)
+        after = set(workspace.memberships().values_list('user_id', flat=True))
+        # Rows saved directly don't send m2m_changed; send what add()/remove() would
+        for action, pk_set in [('post_add', after - before), ('post_remove', before - after)]:
+            if pk_set:
+                m2m_changed.send(
+                    sender=WorkspaceMembership, instance=workspace, action=action, reverse=False,
+                    model=User, pk_set=pk_set, using=workspace._state.db,
+                )
+
+
+@admin.register(Webhook)
+class WebhookAdmin(admin.ModelAdmin):
+    """Admin interface for Webhook"""
+    
+    list_display = ['url', 'workspace', 'events', 'is_active', 'created_at']
+    list_filter = ['is_active', 'created_at']
+    list_select_related = ['workspace']
+    search_fields = ['url']
+    raw_id_fields = ['workspace']
+    readonly_fields = ['secret', 'created_at', 'updated_at', 'lease_expires_at']
+    actions = ['retry_failed']
+    
+    @admin.action(description='Queue failed events for delivery again')
+    def retry_failed(self, request, queryset):
+        count = sum(retry_dead(webhook) for webhook in queryset)
+        self.message_user(request, f'{count} failed event(s) queued again.')
+
+
+@admin.register(WebhookDelivery)
+class WebhookDeliveryAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    """Admin interface for WebhookDelivery"""
+    
+    list_display = ['event', 'webhook', 'status', 'attempts', 'next_attempt_at', 'created_at']
+    list_filter = ['status', 'event', autocomplete_filter('webhook__workspace')]
+    list_select_related = ['webhook']
+    ordering = ['-pk']
+    raw_id_fields = ['webhook']
+    readonly_fields = ['created_at', 'updated_at', 'delivered_at']
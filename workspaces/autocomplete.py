@@ -0,0 +1,101 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Q
+
+from core.metrics import record_cache
+
+User = get_user_model()
+
+MAX_TERM_LENGTH = 50
+
+
+def normalize_term(term):
+    return (term or '').strip()[:MAX_TERM_LENGTH].lower()
+
+
+def search_users(queryset, term, limit=None):
+    """
+    Return up to ``limit`` users whose username, name or email starts with ``term``.
+
+    Every branch of the OR is an ``istartswith`` served by the PrefixIndex
+    declarations on User, so the database does indexed range scans instead
+    of reading every member.
+    """
+    limit = limit or settings.AUTOCOMPLETE_LIMIT
+    term = normalize_term(term)
+    if not term:
+        return []
+
+    users = queryset.filter(
+        Q(username__istartswith=term) |
+        Q(first_name__istartswith=term) |
+        Q(last_name__istartswith=term) |
+        Q(email__istartswith=term)
+    ).order_by('username').values('id', 'username', 'first_name', 'last_name')[:limit]
+
+    return [
+        {
+            'id': user['id'],
+            'username': user['username'],
+            'name': f"{user['first_name']} {user['last_name']}".strip(),
+        }
+        for user in users
+    ]
+
+
+def term_key(term):
+    # Terms are user input: hash them so spaces and control characters can't break cache keys
+    return hashlib.md5(term.encode()).hexdigest()
+
+
+def members_version_key(workspace_id):
+    return f'autocomplete:members-version:{workspace_id}'
+
+
+def invalidate_members(workspace_id):
+    """Start a new cache generation for a workspace after its members change"""
+    try:
+        cache.incr(members_version_key(workspace_id))
+    except ValueError:
+        cache.set(members_version_key(workspace_id), 1, None)
+
+
+def autocomplete_members(workspace, term):
+    """Cached member matches for a workspace's assignee pickers"""
+    term = normalize_term(term)
+    if not term:
+        return []
+
+    version = cache.get_or_set(members_version_key(workspace.pk), 1, None)
+    key = f'autocomplete:members:{workspace.pk}:{version}:{term_key(term)}'
+    results = cache.get(key)
+    record_cache('autocomplete', hits=results is not None, misses=results is None)
+    if results is None:
+        results = search_users(workspace.get_all_members(), term)
+        cache.set(key, results, settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+    return results
+
+
+def autocomplete_new_members(workspace, term):
+    """Cached matches among users who could still be added to a workspace"""
+    term = normalize_term(term)
+    if not term:
+        return []
+
+    key = f'autocomplete:users:{term_key(term)}'
+    results = cache.get(key)
+    record_cache('autocomplete', hits=results is not None, misses=results is None)
+    if results is None:
+        # Over-fetch so filtering out existing members still fills the list
+        results = search_users(User.objects.filter(is_active=True), term, settings.AUTOCOMPLETE_LIMIT * 2)
+        cache.set(key, results, settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+
+    candidate_ids = [user['id'] for user in results]
+    existing = set(
+        workspace.memberships().filter(user_id__in=candidate_ids).values_list('user_id', flat=True)
+    )
+    existing.add(workspace.owner_id)
+    return [user for user in results if user['id'] not in existing][:settings.AUTOCOMPLETE_LIMIT]
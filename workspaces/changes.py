@@ -0,0 +1,77 @@
+"""
+The change log behind delta sync (workspaces.sync).
+
+Every write to a workspace, task, comment or membership records a Change
+row with record_change() inside the transaction that makes it, on the
+workspace's shard. Each shard numbers its rows with its own sequence;
+rows stay for SYNC_RETENTION_DAYS and are then purged oldest first.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.sharding import shard_aliases
+from .models import Change
+
+
+def record_change(kind, workspace_id, object_id, db, deleted=False):
+    """
+    Log that an object changed (or, with ``deleted``, went away).
+
+    Call inside the transaction that makes the change, on the same
+    database, so the entry commits or rolls back with it.
+    """
+    Change.objects.using(db).create(
+        kind=kind, workspace_id=workspace_id, object_id=object_id, deleted=deleted,
+    )
+
+
+def record_changes(kind, pairs, db, deleted=False):
+    """record_change() for many (workspace id, object id) pairs in one INSERT"""
+    entries = [
+        Change(kind=kind, workspace_id=workspace_id, object_id=object_id, deleted=deleted)
+        for workspace_id, object_id in pairs
+    ]
+    if entries:
+        Change.objects.using(db).bulk_create(entries)
+    return len(entries)
+
+
+def settled_before():
+    """
+    Entries newer than this may still have earlier ids uncommitted.
+
+    Ids are taken when a row is inserted, not when its transaction
+    commits, so a reader can see id 11 while 10 is still in flight.
+    Sync only moves its position past entries older than
+    SYNC_SETTLE_SECONDS, so slow transactions aren't skipped.
+    """
+    return timezone.now() - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+
+
+def settled_position(alias):
+    """Id of the newest settled entry on a shard (0 for an empty log)"""
+    # Walks back from the newest id, over only the last few seconds of rows
+    return Change.objects.using(alias).filter(
+        created_at__lt=settled_before(),
+    ).order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def purge_changes(batch_size=1000):
+    """Delete entries older than SYNC_RETENTION_DAYS; return how many"""
+    cutoff = timezone.now() - timedelta(days=settings.SYNC_RETENTION_DAYS)
+    total = 0
+    for alias in shard_aliases():
+        while True:
+            # Oldest first in id order, stopping at the first entry to keep,
+            # so no index on created_at is needed
+            rows = list(Change.objects.using(alias).order_by('pk').values_list(
+                'pk', 'created_at',
+            )[:batch_size])
+            ids = [pk for pk, created_at in rows if created_at < cutoff]
+            if ids:
+                total += Change.objects.using(alias).filter(pk__in=ids).delete()[0]
+            if len(ids) < batch_size:
+                break
+    return total
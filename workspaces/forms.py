@@ -0,0 +1,68 @@
+from django import forms
+from .models import Webhook
+from .webhooks import UnsafeURL, check_url
+
+
+class WebhookForm(forms.ModelForm):
+    """Form for subscribing a URL to workspace events"""
+    
+    events = forms.MultipleChoiceField(
+        choices=Webhook.EVENT_CHOICES,
+        widget=forms.CheckboxSelectMultiple(attrs={'class': 'form-check-input'}),
+        initial=[value for value, _ in Webhook.EVENT_CHOICES],
+    )
+    
+    class Meta:
+        model = Webhook
+        fields = ['url', 'events']
+        widgets = {
+            'url': forms.URLInput(attrs={
+                'class': 'form-control',
+                'placeholder': 'https://example.com/hooks/taskflow'
+            }),
+        }
+    
+    def __init__(self, *args, **kwargs):
+        self.workspace = kwargs.pop('workspace')
+        super().__init__(*args, **kwargs)
+        self.instance.workspace = self.workspace
+    
+    def clean_url(self):
+        """Only public addresses: the server must not be pointed at internal services"""
+        url = self.cleaned_data['url']
+        try:
+            check_url(url)
+        except UnsafeURL as exc:
+            raise forms.ValidationError(str(exc))
+        return url
+    
+    def clean_events(self):
+        """Store the selected events as a comma-separated list"""
+        return ','.join(self.cleaned_data['events'])
+
+
+class CloneWorkspaceForm(forms.Form):
+    """Options for duplicating a workspace or saving it as a template"""
+    
+    name = forms.CharField(
+        max_length=200,
+        widget=forms.TextInput(attrs={'class': 'form-control form-control-lg'}),
+    )
+    start_date = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+        help_text="Optional - due dates move so the earliest one falls on this date",
+    )
+    with_labels = forms.BooleanField(required=False, initial=True, label="Copy labels")
+    with_comments = forms.BooleanField(required=False, label="Copy comments")
+    with_assignments = forms.BooleanField(required=False, label="Keep assignees and members")
+    as_template = forms.BooleanField(required=False, label="Save as a template")
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('as_template'):
+            # Templates start clean: no discussion, nobody assigned
+            cleaned_data['with_comments'] = False
+            if cleaned_data.get('with_assignments'):
+                self.add_error('with_assignments', "Templates can't keep assignees and members.")
+        return cleaned_data
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from core.sharding import shard_aliases
+from workspaces.models import Workspace, WorkspaceMembership
+
+# The automatic table of the members field before it had roles
+LEGACY_TABLE = 'workspaces_workspace_members'
+
+
+class Command(BaseCommand):
+    help = (
+        'Give every workspace owner a membership row, and copy members from the table '
+        'used before roles (kept by the upgrade migration) with the member role.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows written per statement (default: 5000)')
+        parser.add_argument('--drop-legacy', action='store_true',
+                            help='Drop the old members table once its rows are copied')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for alias in shard_aliases():
+            owners = self.backfill_owners(alias, batch_size)
+            members = self.copy_legacy_members(alias, batch_size, options['drop_legacy'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{alias}: {owners} owner(s) and {members} member(s) checked'
+            ))
+
+    def backfill_owners(self, alias, batch_size):
+        """Owner rows for the workspaces missing one, joined when the workspace was created"""
+        workspaces = Workspace.all_objects.using(alias).order_by('pk')
+        memberships = WorkspaceMembership.objects.using(alias)
+        total = 0
+        last_pk = 0
+        while rows := list(workspaces.filter(pk__gt=last_pk).values_list('pk', 'owner_id', 'created_at')[:batch_size]):
+            memberships.bulk_create([
+                WorkspaceMembership(
+                    workspace_id=pk, user_id=owner_id, role=WorkspaceMembership.ROLE_OWNER, joined_at=created_at,
+                )
+                for pk, owner_id, created_at in rows
+            ], ignore_conflicts=True)
+            total += len(rows)
+            last_pk = rows[-1][0]
+        return total
+
+    def copy_legacy_members(self, alias, batch_size, drop):
+        connection = connections[alias]
+        if LEGACY_TABLE not in connection.introspection.table_names():
+            return 0
+        quote_name = connection.ops.quote_name
+        # Raw SQL: the table no longer has a model
+        sql = (
+            f'SELECT {quote_name("id")}, {quote_name("workspace_id")}, {quote_name("user_id")} '
+            f'FROM {quote_name(LEGACY_TABLE)} WHERE {quote_name("id")} > %s '
+            f'ORDER BY {quote_name("id")} LIMIT %s'
+        )
+        joined_at = timezone.now()
+        total = 0
+        last_pk = 0
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute(sql, [last_pk, batch_size])
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                # Owners already have their row, which wins the conflict
+                WorkspaceMembership.objects.using(alias).bulk_create([
+                    WorkspaceMembership(workspace_id=workspace_id, user_id=user_id, joined_at=joined_at)
+                    for _, workspace_id, user_id in rows
+                ], ignore_conflicts=True)
+                total += len(rows)
+                last_pk = rows[-1][0]
+            if drop:
+                cursor.execute(f'DROP TABLE {quote_name(LEGACY_TABLE)}')
+        return total
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from workspaces.webhooks import build_session, deliver_due, purge_delivered
+
+
+class Command(BaseCommand):
+    help = 'Send queued webhook events in signed batches, retrying failures with backoff'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Events per request (default: WEBHOOK_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep running and poll for new events')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='Seconds between polls with --loop (default: 2)')
+
+    def handle(self, *args, **options):
+        # One session for the whole run, so connections to receivers are reused
+        session = build_session()
+        while True:
+            delivered, failed = deliver_due(session, options['batch_size'])
+            if delivered or failed:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Delivered {delivered} event(s), {failed} failed and queued for retry'
+                ))
+            purged = purge_delivered()
+            if purged:
+                self.stdout.write(f'Purged {purged} old delivered event(s)')
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from workspaces.changes import purge_changes
+
+
+class Command(BaseCommand):
+    help = 'Delete delta sync change log entries older than SYNC_RETENTION_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Entries deleted per statement (default: 1000)')
+
+    def handle(self, *args, **options):
+        purged = purge_changes(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Purged {purged} change(s) older than {settings.SYNC_RETENTION_DAYS} day(s)'
+        ))
@@ -0,0 +1,62 @@
+import json
+import random
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from workspaces.webhooks import SIGNATURE_HEADER, TIMESTAMP_HEADER, WEBHOOK_HEADER, verify_signature
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in receiver that checks and prints webhook requests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--secret', default='',
+                            help="Webhook secret to verify signatures with (see the workspace's Webhooks page)")
+        parser.add_argument('--fail-rate', type=float, default=0,
+                            help='Share of requests to answer with 503, to exercise retries (0-1)')
+
+    def handle(self, *args, **options):
+        command = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so the worker's connection pool is exercised too
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if options['secret'] and not verify_signature(
+                    options['secret'], self.headers.get(TIMESTAMP_HEADER), body, self.headers.get(SIGNATURE_HEADER),
+                ):
+                    command.stdout.write(command.style.ERROR('Rejected request with a bad signature'))
+                    return self.reply(401, b'bad signature')
+                if random.random() < options['fail_rate']:
+                    command.stdout.write(command.style.WARNING('Simulating a failure (503)'))
+                    return self.reply(503, b'try again later')
+
+                events = json.loads(body)['events']
+                command.stdout.write(f'Webhook {self.headers.get(WEBHOOK_HEADER)}: {len(events)} event(s)')
+                for event in events:
+                    command.stdout.write(f"  #{event['id']} {event['type']} {json.dumps(event['data'])}")
+                self.reply(200, b'ok')
+
+            def reply(self, status, body):
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/plain')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((options['host'], options['port']), Handler)
+        self.stdout.write(f"Listening on http://{options['host']}:{options['port']}/ (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -1,6 +1,19 @@
-from django.db import models
+import secrets
+
+from django.db import models, router, transaction
+from django.db.models import Q
 from django.conf import settings
 from django.urls import reverse
+from django.utils import timezone
+
+from core.sharding import ShardedQuerySet, on_shard_of, place_workspace, sharding_enabled, unplace_workspace
+
+
+class WorkspaceManager(models.Manager.from_queryset(ShardedQuerySet)):
+    """Hide workspaces that are waiting to be purged by the reaper"""
+    
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
 
 
 class Workspace(models.Model):
@@ -13,24 +26,44 @@ class Workspace(models.Model):
     description = models.TextField(blank=True, help_text="What is this workspace about?")
     
     # Relationships
+    # User foreign keys carry no database constraint: users live on the default
+    # database while a workspace may live on another shard (core.sharding)
     owner = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        db_constraint=False,
         related_name='owned_workspaces',
         help_text="User who created this workspace"
     )
     
+    # Everyone with access, the owner included, with their role
     members = models.ManyToManyField(
         settings.AUTH_USER_MODEL,
+        through='WorkspaceMembership',
         related_name='workspaces',
         blank=True,
         help_text="Users who are members of this workspace"
     )
     
+    archive_after_days = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        help_text="Archive tasks that have been done for this many days (empty = never)"
+    )
+    
+    # Templates are listed apart and only used as the source of new workspaces
+    is_template = models.BooleanField(default=False)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Set when deletion is requested; rows are removed later in batches (core.deletion)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    objects = WorkspaceManager()
+    all_objects = ShardedQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         verbose_name = 'Workspace'
@@ -39,13 +72,57 @@ class Workspace(models.Model):
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        from .changes import record_change
+        # A new workspace gets its global id and home shard before routing
+        placed = self.pk is None and not kwargs.get('using') and sharding_enabled()
+        if placed:
+            kwargs['using'] = place_workspace(self)
+        db = kwargs.get('using') or router.db_for_write(Workspace, instance=self)
+        try:
+            # The sync change commits or rolls back with the workspace
+            with transaction.atomic(using=db):
+                super().save(*args, **kwargs)
+                record_change(Change.KIND_WORKSPACE, self.pk, self.pk, db)
+                self.save_owner_membership(db)
+        except Exception:
+            if placed:
+                unplace_workspace(self)
+            raise
+    
+    def save_owner_membership(self, db):
+        """Give the owner their membership row; a previous owner stays on as an admin"""
+        from .autocomplete import invalidate_members
+        from .changes import record_change
+        owner, admin = WorkspaceMembership.ROLE_OWNER, WorkspaceMembership.ROLE_ADMIN
+        rows = WorkspaceMembership.objects.using(db).filter(workspace_id=self.pk)
+        roles = dict(rows.filter(Q(user_id=self.owner_id) | Q(role=owner)).values_list('user_id', 'role'))
+        if roles == {self.owner_id: owner}:
+            return
+        rows.filter(role=owner).exclude(user_id=self.owner_id).update(role=admin)
+        if self.owner_id in roles:
+            rows.filter(user_id=self.owner_id).update(role=owner)
+        else:
+            WorkspaceMembership.objects.using(db).create(workspace_id=self.pk, user_id=self.owner_id, role=owner)
+            record_change(Change.KIND_MEMBERSHIP, self.pk, self.owner_id, db)
+            invalidate_members(self.pk)
+    
     def get_absolute_url(self):
         """Return URL for workspace detail page"""
         return reverse('workspaces:detail', kwargs={'pk': self.pk})
     
+    def memberships(self):
+        """Membership rows, read from this workspace's own shard"""
+        return on_shard_of(WorkspaceMembership.objects.filter(workspace_id=self.pk), self)
+    
+    def member_ids(self):
+        """Member user ids, as a subquery or (across databases) a list"""
+        ids = self.memberships().values_list('user_id', flat=True)
+        return list(ids) if sharding_enabled() else ids
+    
     def is_member(self, user):
-        """Check if user is a member of this workspace"""
-        return self.members.filter(pk=user.pk).exists()
+        """Check if user is a member of this workspace (the owner is one too)"""
+        return self.memberships().filter(user_id=user.pk).exists()
     
     def is_owner(self, user):
         """Check if user is the owner of this workspace"""
@@ -62,8 +139,224 @@ class Workspace(models.Model):
             self.members.remove(user)
     
     def get_all_members(self):
-        return self.members.all() 
+        from accounts.models import User
+        return User.objects.filter(pk__in=self.member_ids())
 
     
     def member_count(self):
-        return self.members.count()  
\ No newline at end of file
+        return self.memberships().count()  
+
+
+class WorkspaceMembership(models.Model):
+    """
+    WorkspaceMembership model - one user's access to one workspace, with a role.
+    The owner has a row too, so the workspaces a user can see are one join
+    on (user, workspace), with no OR over the owner and no DISTINCT.
+    """
+    
+    ROLE_OWNER = 'owner'
+    ROLE_ADMIN = 'admin'
+    ROLE_MEMBER = 'member'
+    ROLE_VIEWER = 'viewer'
+    
+    ROLE_CHOICES = [
+        (ROLE_OWNER, 'Owner'),
+        (ROLE_ADMIN, 'Admin'),
+        (ROLE_MEMBER, 'Member'),
+        (ROLE_VIEWER, 'Viewer'),
+    ]
+    
+    # Rows of a workspace are read through the unique constraint below
+    workspace = models.ForeignKey(
+        Workspace,
+        on_delete=models.CASCADE,
+        related_name='membership_rows',
+        db_index=False
+    )
+    
+    # Users live on the default database (see Workspace.owner)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False,
+        related_name='workspace_memberships',
+        db_index=False
+    )
+    
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES, default=ROLE_MEMBER)
+    # Not auto_now_add, so copies and backfills keep the original time
+    joined_at = models.DateTimeField(default=timezone.now)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta:
+        verbose_name = 'Workspace Membership'
+        verbose_name_plural = 'Workspace Memberships'
+        constraints = [
+            # Also the index for a workspace's members and is_member()
+            models.UniqueConstraint(fields=['workspace', 'user'], name='unique_workspace_member'),
+        ]
+        indexes = [
+            # A user's workspaces, answered from the index alone
+            models.Index(fields=['user', 'workspace'], name='membership_user_workspace'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} in {self.workspace_id} ({self.get_role_display()})"
+
+
+def generate_webhook_secret():
+    return secrets.token_hex(32)
+
+
+class Webhook(models.Model):
+    """
+    Webhook model - a URL that is sent a workspace's task, comment and member events.
+    Events are queued as WebhookDelivery rows in the transaction that makes
+    the change, and POSTed in signed batches by the deliver_webhooks worker.
+    """
+    
+    EVENT_CHOICES = [
+        ('task.created', 'Task created'),
+        ('task.updated', 'Task updated'),
+        ('task.deleted', 'Task deleted'),
+        ('comment.created', 'Comment added'),
+        ('comment.updated', 'Comment edited'),
+        ('comment.deleted', 'Comment deleted'),
+        ('member.added', 'Member added'),
+        ('member.removed', 'Member removed'),
+    ]
+    
+    workspace = models.ForeignKey(
+        Workspace,
+        on_delete=models.CASCADE,
+        related_name='webhooks',
+    )
+    url = models.URLField(max_length=500, help_text="Receives a POST with a JSON batch of events")
+    events = models.CharField(max_length=300, help_text="Comma-separated event names, e.g. task.created,task.updated")
+    
+    # Key for the HMAC-SHA256 signature of every request body
+    secret = models.CharField(max_length=64, default=generate_webhook_secret, editable=False)
+    is_active = models.BooleanField(default=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    # Lease so two delivery workers never send for the same webhook at once
+    lease_expires_at = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['created_at']
+        verbose_name = 'Webhook'
+        verbose_name_plural = 'Webhooks'
+    
+    def __str__(self):
+        return f"{self.url} ({self.workspace_id})"
+    
+    def get_events(self):
+        """Subscribed event names as a list"""
+        return [event for event in self.events.split(',') if event]
+
+
+class WebhookDelivery(models.Model):
+    """
+    WebhookDelivery model - one event waiting for (or sent to) one webhook.
+    This is the outbox: rows are written with the change they describe, so
+    an event is never lost or sent for a change that was rolled back.
+    """
+    
+    STATUS_PENDING = 'PENDING'
+    STATUS_DELIVERED = 'DELIVERED'
+    STATUS_DEAD = 'DEAD'
+    
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_DELIVERED, 'Delivered'),
+        (STATUS_DEAD, 'Failed'),
+    ]
+    
+    webhook = models.ForeignKey(
+        Webhook,
+        on_delete=models.CASCADE,
+        related_name='deliveries',
+    )
+    event = models.CharField(max_length=50)
+    payload = models.JSONField()
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.CharField(max_length=500, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['pk']
+        verbose_name = 'Webhook Delivery'
+        verbose_name_plural = 'Webhook Deliveries'
+        indexes = [
+            # Worker scan: a webhook's due events, oldest first
+            models.Index(fields=['webhook', 'status', 'next_attempt_at']),
+            # Finding webhooks with anything due
+            models.Index(fields=['status', 'next_attempt_at']),
+            # Purging old deliveries
+            models.Index(
+                fields=['delivered_at'],
+                condition=models.Q(status='DELIVERED'),
+                name='webhookdelivery_delivered',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.event} to webhook {self.webhook_id} ({self.get_status_display()})"
+
+
+class Change(models.Model):
+    """
+    Change model - one entry in a shard's change log, read by delta sync.
+    Rows are written with the change they describe; their ids only grow,
+    so "everything after id N" is an indexed range scan. The row says what
+    changed, not how: sync reads the object's current state.
+    """
+    
+    KIND_WORKSPACE = 'workspace'
+    KIND_TASK = 'task'
+    KIND_COMMENT = 'comment'
+    KIND_MEMBERSHIP = 'membership'
+    
+    KIND_CHOICES = [
+        (KIND_WORKSPACE, 'Workspace'),
+        (KIND_TASK, 'Task'),
+        (KIND_COMMENT, 'Comment'),
+        (KIND_MEMBERSHIP, 'Membership'),
+    ]
+    
+    # Per-shard sequence, so not in GLOBAL_ID_MODELS
+    id = models.BigAutoField(primary_key=True)
+    workspace_id = models.BigIntegerField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # The task, comment or workspace id; the user id for memberships
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+    
+    objects = ShardedQuerySet.as_manager()
+    
+    class Meta:
+        ordering = ['pk']
+        verbose_name = 'Change'
+        verbose_name_plural = 'Changes'
+        indexes = [
+            # Sync scan: a user's workspaces' changes after a position
+            models.Index(fields=['workspace_id', 'id']),
+        ]
+    
+    def __str__(self):
+        action = 'deleted' if self.deleted else 'changed'
+        return f"{self.kind} {self.object_id} {action} in workspace {self.workspace_id}"
@@ -0,0 +1,54 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .autocomplete import invalidate_members
+from .changes import record_changes
+from .models import Change, WorkspaceMembership, Webhook
+from .webhooks import forget_subscriptions, record_event
+
+
+@receiver(m2m_changed, sender=WorkspaceMembership)
+def members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drop cached autocomplete results when a workspace's members change"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_members(instance.pk)
+    elif pk_set:
+        # Changed from the user side (user.workspaces.add(...))
+        for workspace_id in pk_set:
+            invalidate_members(workspace_id)
+
+
+@receiver(m2m_changed, sender=WorkspaceMembership)
+def queue_member_events(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """Record member.added/member.removed webhook events with the membership change"""
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    event = 'member.added' if action == 'post_add' else 'member.removed'
+    # m2m_changed is sent inside the transaction that writes the membership rows
+    if not reverse:
+        for user_id in pk_set:
+            record_event(instance.pk, event, {'workspace_id': instance.pk, 'user_id': user_id}, using)
+    else:
+        for workspace_id in pk_set:
+            record_event(workspace_id, event, {'workspace_id': workspace_id, 'user_id': instance.pk}, using)
+
+
+@receiver(m2m_changed, sender=WorkspaceMembership)
+def record_member_changes(sender, instance, action, reverse, pk_set, using, **kwargs):
+    """Log membership changes for delta sync, in the transaction that makes them"""
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    if not reverse:
+        pairs = [(instance.pk, user_id) for user_id in pk_set]
+    else:
+        pairs = [(workspace_id, instance.pk) for workspace_id in pk_set]
+    record_changes(Change.KIND_MEMBERSHIP, pairs, using, deleted=action == 'post_remove')
+
+
+@receiver(post_save, sender=Webhook)
+@receiver(post_delete, sender=Webhook)
+def webhooks_changed(sender, instance, **kwargs):
+    """Drop the cached subscriptions, so the next change records events for the new set"""
+    forget_subscriptions(instance.workspace_id)
@@ -0,0 +1,307 @@
+"""
+Delta sync for mobile and offline clients.
+
+A client keeps the opaque token from its last response and sends it back
+to get only what changed since: current workspaces, tasks, comments and
+memberships, plus ids of those deleted, archived or no longer visible to
+the user. Without a token (or after 410 Gone) it starts from nothing.
+
+The token is signed and holds the client's position in each shard's
+change log (workspaces.changes) and the workspaces it already has. A
+workspace the user newly sees is first copied in full, in pages; after
+that only the log is read, as a range scan on (workspace_id, id). Log
+entries name objects, the response carries their current state, so an
+object changed many times is sent once and replays are harmless.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+
+from accounts.models import User
+from core.sharding import fan_out, shard_aliases, shard_for_workspace
+from tasks.models import Task, Comment
+from .changes import settled_before, settled_position
+from .models import Change, Workspace, WorkspaceMembership
+from .webhooks import comment_payload, task_payload
+
+TOKEN_SALT = 'workspaces.sync'
+TOKEN_VERSION = 1
+
+# Steps of copying a newly visible workspace
+FILL_WORKSPACE = 0
+FILL_TASKS = 1
+FILL_COMMENTS = 2
+
+
+class InvalidToken(Exception):
+    """The token wasn't issued by this server for this user"""
+
+
+class ExpiredToken(Exception):
+    """The changes the token points at were purged; the client must sync from scratch"""
+
+
+# Token
+
+def initial_state():
+    return {
+        'p': {alias: settled_position(alias) for alias in shard_aliases()},
+        'w': [],
+        'f': [],
+        't': settled_before().timestamp(),
+    }
+
+
+def dump_token(user, state):
+    return signing.dumps({**state, 'u': user.pk, 'v': TOKEN_VERSION}, salt=TOKEN_SALT, compress=True)
+
+
+def load_token(user, token):
+    """
+    Sync state from a token; raise InvalidToken or ExpiredToken.
+
+    't' is the time the client's positions are complete up to. Entries
+    after it are kept for SYNC_RETENTION_DAYS, so older tokens may have
+    missed purged changes.
+    """
+    try:
+        state = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        raise InvalidToken('Malformed or tampered sync token')
+    if state.get('u') != user.pk or state.get('v') != TOKEN_VERSION:
+        raise InvalidToken('Sync token belongs to another user or version')
+    if state['t'] < time.time() - timedelta(days=settings.SYNC_RETENTION_DAYS).total_seconds():
+        raise ExpiredToken('Sync token is too old, sync from scratch')
+    return state
+
+
+# Collecting a response
+
+class SyncBatch:
+    """Objects to send (by kind and key) and keys of deleted objects"""
+
+    KINDS = [Change.KIND_WORKSPACE, Change.KIND_TASK, Change.KIND_COMMENT, Change.KIND_MEMBERSHIP]
+
+    def __init__(self):
+        self.changed = {kind: {} for kind in self.KINDS}
+        self.deleted = {kind: set() for kind in self.KINDS}
+
+    def add(self, kind, key, obj):
+        self.changed[kind][key] = obj
+        self.deleted[kind].discard(key)
+
+    def delete(self, kind, key):
+        self.changed[kind].pop(key, None)
+        self.deleted[kind].add(key)
+
+    def as_dict(self):
+        """JSON-ready changes and tombstones, users resolved in one query"""
+        workspaces = self.changed[Change.KIND_WORKSPACE].values()
+        memberships = self.changed[Change.KIND_MEMBERSHIP]
+        user_ids = {workspace.owner_id for workspace in workspaces} | {user_id for _, user_id in memberships}
+        usernames = dict(User.objects.filter(pk__in=user_ids).values_list('pk', 'username')) if user_ids else {}
+        return {
+            'workspaces': [workspace_payload(workspace, usernames) for workspace in workspaces],
+            'tasks': [task_payload(task) for task in self.changed[Change.KIND_TASK].values()],
+            'comments': [comment_payload(comment) for comment in self.changed[Change.KIND_COMMENT].values()],
+            'memberships': [
+                {'workspace_id': workspace_id, 'user_id': user_id, 'username': usernames.get(user_id)}
+                for workspace_id, user_id in memberships
+            ],
+            'deleted': {
+                'workspaces': sorted(self.deleted[Change.KIND_WORKSPACE]),
+                'tasks': sorted(self.deleted[Change.KIND_TASK]),
+                'comments': sorted(self.deleted[Change.KIND_COMMENT]),
+                'memberships': [
+                    {'workspace_id': workspace_id, 'user_id': user_id}
+                    for workspace_id, user_id in sorted(self.deleted[Change.KIND_MEMBERSHIP])
+                ],
+            },
+        }
+
+
+def workspace_payload(workspace, usernames):
+    return {
+        'id': workspace.pk,
+        'name': workspace.name,
+        'description': workspace.description,
+        'owner_id': workspace.owner_id,
+        'owner_username': usernames.get(workspace.owner_id),
+        'archive_after_days': workspace.archive_after_days,
+        'is_template': workspace.is_template,
+        'created_at': workspace.created_at.isoformat() if workspace.created_at else None,
+        'updated_at': workspace.updated_at.isoformat() if workspace.updated_at else None,
+    }
+
+
+def user_workspace_ids(user):
+    """Ids of the workspaces the user owns or belongs to, from every shard"""
+    results = fan_out(lambda: list(Workspace.objects.filter(
+        members=user
+    ).values_list('pk', flat=True)))
+    return {pk for result in results for pk in result}
+
+
+# Copying newly visible workspaces
+
+def fill_step(batch, fill, limit):
+    """
+    Copy the next page of a workspace into the batch.
+
+    ``fill`` is [workspace id, step, last id copied] and is advanced in
+    place (step None when done). Returns the number of objects added.
+    """
+    workspace_id, step, after = fill
+    alias = shard_for_workspace(workspace_id)
+    if step == FILL_WORKSPACE:
+        workspace = Workspace.objects.using(alias).filter(pk=workspace_id).first()
+        if workspace is None:
+            batch.delete(Change.KIND_WORKSPACE, workspace_id)
+            fill[1] = None
+            return 1
+        batch.add(Change.KIND_WORKSPACE, workspace_id, workspace)
+        members = list(workspace.memberships().values_list('user_id', flat=True))
+        for user_id in members:
+            batch.add(Change.KIND_MEMBERSHIP, (workspace_id, user_id), True)
+        fill[1:] = [FILL_TASKS, 0]
+        return 1 + len(members)
+
+    if step == FILL_TASKS:
+        rows = Task.objects.using(alias).filter(workspace_id=workspace_id, pk__gt=after)
+        kind, next_step = Change.KIND_TASK, FILL_COMMENTS
+    else:
+        rows = Comment.objects.using(alias).filter(task__workspace_id=workspace_id, pk__gt=after)
+        kind, next_step = Change.KIND_COMMENT, None
+    rows = list(rows.order_by('pk')[:limit])
+    for row in rows:
+        batch.add(kind, row.pk, row)
+    if len(rows) < limit:
+        fill[1:] = [next_step, 0]
+    else:
+        fill[2] = rows[-1].pk
+    return len(rows)
+
+
+# Reading the change log
+
+def read_log(batch, state, workspace_ids, limit):
+    """
+    Add what changed after the token's positions to the batch.
+
+    Reads up to ``limit`` entries per shard and advances the positions
+    (and the token's time) past the settled ones. Returns True if a shard
+    had more entries than fit.
+    """
+    settled = settled_before()
+    caught_up_to = settled
+    has_more = False
+    entries = []
+    for alias in shard_aliases():
+        position = state['p'].get(alias, 0)
+        rows = list(Change.objects.using(alias).filter(
+            workspace_id__in=workspace_ids, pk__gt=position,
+        ).order_by('pk').values_list('pk', 'kind', 'workspace_id', 'object_id', 'deleted', 'created_at')[:limit])
+        entries.extend(rows)
+
+        unsettled = next((index for index, row in enumerate(rows) if row[5] >= settled), None)
+        if unsettled is None:
+            if rows:
+                state['p'][alias] = rows[-1][0]
+            if len(rows) == limit:
+                # Only complete up to the last entry read
+                has_more = True
+                caught_up_to = min(caught_up_to, rows[-1][5])
+        elif unsettled:
+            # Unsettled entries are sent now and read again next time
+            state['p'][alias] = rows[unsettled - 1][0]
+    state['t'] = caught_up_to.timestamp()
+    apply_entries(batch, entries, workspace_ids)
+    return has_more
+
+
+def apply_entries(batch, entries, workspace_ids):
+    """
+    Turn log entries into current objects or tombstones.
+
+    An object is looked up unless all its entries are deletions; one
+    that no longer exists (or is hidden) is sent as deleted.
+    """
+    to_load = {kind: {} for kind in SyncBatch.KINDS}
+    for _, kind, workspace_id, object_id, deleted, _ in entries:
+        key = (workspace_id, object_id) if kind == Change.KIND_MEMBERSHIP else object_id
+        if deleted and key not in to_load[kind]:
+            batch.delete(kind, key)
+        elif not deleted:
+            to_load[kind][key] = workspace_id
+            batch.deleted[kind].discard(key)
+
+    for kind, keys in to_load.items():
+        by_shard = {}
+        for key, workspace_id in keys.items():
+            by_shard.setdefault(shard_for_workspace(workspace_id), []).append(key)
+        found = {}
+        for alias, shard_keys in by_shard.items():
+            found.update(load_objects(kind, alias, shard_keys, workspace_ids))
+        for key in keys:
+            if key in found:
+                batch.add(kind, key, found[key])
+            else:
+                batch.delete(kind, key)
+
+
+def load_objects(kind, alias, keys, workspace_ids):
+    """{key: object} of the keys that still exist and are visible"""
+    if kind == Change.KIND_WORKSPACE:
+        rows = Workspace.objects.using(alias).filter(pk__in=keys)
+    elif kind == Change.KIND_TASK:
+        rows = Task.objects.using(alias).filter(pk__in=keys, workspace_id__in=workspace_ids)
+    elif kind == Change.KIND_COMMENT:
+        rows = Comment.objects.using(alias).filter(pk__in=keys, task__workspace_id__in=workspace_ids)
+    else:
+        members = WorkspaceMembership.objects.using(alias).filter(
+            workspace_id__in={workspace_id for workspace_id, _ in keys},
+            user_id__in={user_id for _, user_id in keys},
+        ).values_list('workspace_id', 'user_id')
+        wanted = set(keys)
+        return {key: True for key in members if key in wanted}
+    return {row.pk: row for row in rows}
+
+
+def sync(user, token=None, limit=None):
+    """
+    One page of changes for ``user`` since ``token`` (None for a full sync).
+
+    Returns the response dict with the next token; while 'has_more' is
+    true the client should ask again at once. Raises InvalidToken or
+    ExpiredToken.
+    """
+    limit = max(1, min(limit or settings.SYNC_PAGE_SIZE, settings.SYNC_PAGE_SIZE))
+    state = load_token(user, token) if token else initial_state()
+    batch = SyncBatch()
+
+    workspace_ids = user_workspace_ids(user)
+    known = set(state['w'])
+    for workspace_id in sorted(known - workspace_ids):
+        # Deleted, or the user left: the client drops it with everything in it
+        batch.delete(Change.KIND_WORKSPACE, workspace_id)
+    fills = [fill for fill in state['f'] if fill[0] in workspace_ids]
+    fills += [[workspace_id, FILL_WORKSPACE, 0] for workspace_id in sorted(workspace_ids - known)]
+
+    budget = limit
+    while fills and budget > 0:
+        budget -= fill_step(batch, fills[0], budget)
+        if fills[0][1] is None:
+            fills.pop(0)
+
+    # The log is read once new workspaces are copied; positions wait until then
+    has_more = bool(fills) or budget <= 0
+    if not has_more and workspace_ids:
+        has_more = read_log(batch, state, workspace_ids, budget)
+    elif not has_more:
+        state['t'] = settled_before().timestamp()
+
+    state['w'] = sorted(workspace_ids)
+    state['f'] = fills
+    return {**batch.as_dict(), 'token': dump_token(user, state), 'has_more': has_more}
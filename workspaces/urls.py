@@ -6,9 +6,17 @@ app_name = 'workspaces'
 urlpatterns = [
     path('', views.WorkspaceListView.as_view(), name='list'),
     path('create/', views.WorkspaceCreateView.as_view(), name='create'),
+    path('sync/', views.sync, name='sync'),
+    path('clones/<int:job_id>/', views.clone_status, name='clone_status'),
     path('<int:pk>/', views.WorkspaceDetailView.as_view(), name='detail'),
     path('<int:pk>/update/', views.WorkspaceUpdateView.as_view(), name='update'),
     path('<int:pk>/delete/', views.WorkspaceDeleteView.as_view(), name='delete'),
     path('<int:pk>/add-member/', views.add_member, name='add_member'),
     path('<int:pk>/remove-member/<int:user_id>/', views.remove_member, name='remove_member'),
+    path('<int:pk>/members/autocomplete/', views.member_autocomplete, name='member_autocomplete'),
+    path('<int:pk>/add-member/autocomplete/', views.user_autocomplete, name='user_autocomplete'),
+    path('<int:pk>/clone/', views.clone_workspace, name='clone'),
+    path('<int:pk>/webhooks/', views.webhooks, name='webhooks'),
+    path('<int:pk>/webhooks/<int:webhook_id>/delete/', views.delete_webhook, name='delete_webhook'),
+    path('<int:pk>/webhooks/<int:webhook_id>/retry/', views.retry_webhook, name='retry_webhook'),
 ]
\ No newline at end of file
@@ -1,12 +1,23 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponseRedirect, JsonResponse
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_safe
+from django.utils.cache import patch_cache_control
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
-from django.db.models import Q
-from .models import Workspace
+from django.db.models import Count, Q
+from .models import Workspace, Webhook, WebhookDelivery
+from .autocomplete import autocomplete_members, autocomplete_new_members
+from .forms import CloneWorkspaceForm, WebhookForm
+from .sync import ExpiredToken, InvalidToken, sync as sync_changes
+from .webhooks import retry_dead
 from accounts.models import User
+from core.cloning import schedule_clone
+from core.deletion import schedule_deletion
+from core.models import CloneJob
+from core.sharding import fan_out, merge_sorted
 
 
 class WorkspaceListView(LoginRequiredMixin, ListView):
@@ -16,11 +27,20 @@ class WorkspaceListView(LoginRequiredMixin, ListView):
     context_object_name = 'workspaces'
     
     def get_queryset(self):
-        """Return workspaces where user is owner or member"""
+        """Return workspaces where user is owner or member, from every shard"""
         user = self.request.user
-        return Workspace.objects.filter(
-            Q(owner=user) | Q(members=user)
-        ).distinct()
+        # Owners have a membership row too: one join, no DISTINCT
+        return merge_sorted(fan_out(lambda: list(Workspace.objects.filter(
+            members=user
+        ))), key=lambda workspace: workspace.created_at, reverse=True)
+    
+    def get_context_data(self, **kwargs):
+        """Templates are listed apart from the workspaces in use"""
+        context = super().get_context_data(**kwargs)
+        workspaces = context['workspaces']
+        context['workspaces'] = [workspace for workspace in workspaces if not workspace.is_template]
+        context['templates'] = [workspace for workspace in workspaces if workspace.is_template]
+        return context
 
 
 class WorkspaceDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
@@ -47,7 +67,7 @@ class WorkspaceCreateView(LoginRequiredMixin, CreateView):
     """Create a new workspace"""
     model = Workspace
     template_name = 'workspaces/workspace_form.html'
-    fields = ['name', 'description']
+    fields = ['name', 'description', 'archive_after_days']
     
     def form_valid(self, form):
         """Set the owner to current user"""
@@ -60,7 +80,7 @@ class WorkspaceUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     """Update workspace (only owner can update)"""
     model = Workspace
     template_name = 'workspaces/workspace_form.html'
-    fields = ['name', 'description']
+    fields = ['name', 'description', 'archive_after_days']
     
     def test_func(self):
         """Only owner can update workspace"""
@@ -83,10 +103,11 @@ class WorkspaceDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         workspace = self.get_object()
         return workspace.is_owner(self.request.user)
     
-    def delete(self, request, *args, **kwargs):
-        workspace = self.get_object()
-        messages.success(request, f'Workspace "{workspace.name}" deleted successfully!')
-        return super().delete(request, *args, **kwargs)
+    def form_valid(self, form):
+        """Hide the workspace now; its tasks and comments are purged in the background"""
+        schedule_deletion(self.object, self.request.user)
+        messages.success(self.request, f'Workspace "{self.object.name}" deleted successfully!')
+        return HttpResponseRedirect(self.get_success_url())
 
 
 @login_required
@@ -105,10 +126,10 @@ def add_member(request, pk):
             user = User.objects.get(username=username)
             
             # Check if already member
-            if workspace.is_member(user):
-                messages.warning(request, f"{user.username} is already a member.")
-            elif workspace.owner == user:
+            if workspace.owner == user:
                 messages.warning(request, "Owner is automatically a member.")
+            elif workspace.is_member(user):
+                messages.warning(request, f"{user.username} is already a member.")
             else:
                 workspace.add_member(user)
                 messages.success(request, f"{user.username} added to workspace!")
@@ -137,4 +158,149 @@ def remove_member(request, pk, user_id):
     workspace.remove_member(user_to_remove)
     messages.success(request, f"{user_to_remove.username} removed from workspace.")
     
-    return redirect('workspaces:detail', pk=pk)
\ No newline at end of file
+    return redirect('workspaces:detail', pk=pk)
+
+
+@login_required
+def member_autocomplete(request, pk):
+    """JSON list of workspace members matching ?q= (for assignee pickers)"""
+    workspace = get_object_or_404(Workspace, pk=pk)
+    
+    if not (workspace.is_owner(request.user) or workspace.is_member(request.user)):
+        return JsonResponse({'error': 'Permission denied.'}, status=403)
+    
+    results = autocomplete_members(workspace, request.GET.get('q', ''))
+    return JsonResponse({'results': results})
+
+
+@login_required
+def user_autocomplete(request, pk):
+    """JSON list of users matching ?q= who can be added to the workspace"""
+    workspace = get_object_or_404(Workspace, pk=pk)
+    
+    if not workspace.is_owner(request.user):
+        return JsonResponse({'error': 'Only workspace owner can add members.'}, status=403)
+    
+    results = autocomplete_new_members(workspace, request.GET.get('q', ''))
+    return JsonResponse({'results': results})
+
+
+@login_required
+def clone_workspace(request, pk):
+    """Queue a copy of a workspace, as a new workspace or a template (owner or member)"""
+    workspace = get_object_or_404(Workspace, pk=pk)
+    
+    if not (workspace.is_owner(request.user) or workspace.is_member(request.user)):
+        messages.error(request, "Only workspace members can copy it.")
+        return redirect('workspaces:list')
+    
+    as_template = request.GET.get('template') == '1'
+    if workspace.is_template:
+        name = workspace.name
+    elif as_template:
+        name = f"{workspace.name} (template)"
+    else:
+        name = f"Copy of {workspace.name}"
+    form = CloneWorkspaceForm(request.POST or None, initial={'name': name, 'as_template': as_template})
+    if request.method == 'POST' and form.is_valid():
+        job = schedule_clone(workspace, request.user, **form.cleaned_data)
+        messages.success(request, f'Copying "{workspace.name}"; the new workspace appears when it is ready.')
+        return redirect('workspaces:clone_status', job_id=job.pk)
+    
+    context = {
+        'workspace': workspace,
+        'form': form,
+    }
+    return render(request, 'workspaces/workspace_clone.html', context)
+
+
+@login_required
+def clone_status(request, job_id):
+    """Progress of a copy the user asked for"""
+    job = get_object_or_404(CloneJob, pk=job_id, requested_by=request.user)
+    return render(request, 'workspaces/clone_status.html', {'job': job})
+
+
+@login_required
+def webhooks(request, pk):
+    """List a workspace's webhooks and add new ones (only owner)"""
+    workspace = get_object_or_404(Workspace, pk=pk)
+    
+    if not workspace.is_owner(request.user):
+        messages.error(request, "Only workspace owner can manage webhooks.")
+        return redirect('workspaces:detail', pk=pk)
+    
+    form = WebhookForm(request.POST or None, workspace=workspace)
+    if request.method == 'POST':
+        if form.is_valid():
+            webhook = form.save()
+            messages.success(request, f'Webhook added. Events will be sent to {webhook.url}.')
+            return redirect('workspaces:webhooks', pk=pk)
+    
+    webhook_list = Webhook.objects.filter(workspace=workspace).annotate(
+        pending=Count('deliveries', filter=Q(deliveries__status=WebhookDelivery.STATUS_PENDING)),
+        dead=Count('deliveries', filter=Q(deliveries__status=WebhookDelivery.STATUS_DEAD)),
+    )
+    context = {
+        'workspace': workspace,
+        'webhooks': webhook_list,
+        'form': form,
+        'event_names': dict(Webhook.EVENT_CHOICES),
+    }
+    return render(request, 'workspaces/webhook_list.html', context)
+
+
+@login_required
+def delete_webhook(request, pk, webhook_id):
+    """Delete a webhook along with its queued events (only owner)"""
+    workspace = get_object_or_404(Workspace, pk=pk)
+    
+    if not workspace.is_owner(request.user):
+        messages.error(request, "Only workspace owner can manage webhooks.")
+        return redirect('workspaces:detail', pk=pk)
+    
+    if request.method == 'POST':
+        webhook = get_object_or_404(Webhook, pk=webhook_id, workspace=workspace)
+        webhook.delete()
+        messages.success(request, f'Webhook for {webhook.url} deleted.')
+    
+    return redirect('workspaces:webhooks', pk=pk)
+
+
+@login_required
+def retry_webhook(request, pk, webhook_id):
+    """Queue a webhook's failed events for delivery again (only owner)"""
+    workspace = get_object_or_404(Workspace, pk=pk)
+    
+    if not workspace.is_owner(request.user):
+        messages.error(request, "Only workspace owner can manage webhooks.")
+        return redirect('workspaces:detail', pk=pk)
+    
+    if request.method == 'POST':
+        webhook = get_object_or_404(Webhook, pk=webhook_id, workspace=workspace)
+        count = retry_dead(webhook)
+        messages.success(request, f'{count} failed event(s) queued for delivery again.')
+    
+    return redirect('workspaces:webhooks', pk=pk)
+
+
+@login_required
+@require_safe
+def sync(request):
+    """JSON of what changed in the user's workspaces since ?token= (see workspaces.sync)"""
+    try:
+        limit = int(request.GET.get('limit') or 0) or None
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number.'}, status=400)
+    
+    try:
+        data = sync_changes(request.user, request.GET.get('token') or None, limit)
+    except InvalidToken as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    except ExpiredToken as exc:
+        # The client drops its copy and syncs again without a token
+        return JsonResponse({'error': str(exc)}, status=410)
+    
+    response = JsonResponse(data)
+    patch_cache_control(response, private=True, no_store=True)
+    return response
@@ -0,0 +1,371 @@
+"""
+Outbound webhooks.
+
+Changes to tasks, comments and members record their events with
+record_event() inside the transaction that makes the change, as
+WebhookDelivery rows on the workspace's shard (a transactional outbox).
+Web requests never talk to subscribers; the deliver_webhooks worker
+sends each webhook's due events as one signed JSON batch over pooled
+connections, and retries failures with exponential backoff until they
+are dead-lettered. Delivery is at least once: receivers should ignore
+event ids they have already seen.
+"""
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import random
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import takewhile
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from core.metrics import record_cache
+from core.sharding import shard_aliases
+from .models import Webhook, WebhookDelivery
+
+logger = logging.getLogger(__name__)
+
+LEASE_DURATION = timedelta(minutes=2)
+
+SIGNATURE_HEADER = 'X-TaskFlow-Signature'
+TIMESTAMP_HEADER = 'X-TaskFlow-Timestamp'
+WEBHOOK_HEADER = 'X-TaskFlow-Webhook'
+
+
+class UnsafeURL(Exception):
+    """A webhook URL that leads to a loopback, private or otherwise non-public address"""
+
+
+# Recording events
+
+def subscriptions_key(workspace_id):
+    return f'webhooks:workspace:{workspace_id}'
+
+
+def get_subscriptions(workspace_id, db):
+    """
+    [(webhook id, event names)] of a workspace's active webhooks.
+
+    Cached, because every task and comment write asks; most workspaces
+    have no webhooks and the answer costs one cache read.
+    """
+    key = subscriptions_key(workspace_id)
+    subscriptions = cache.get(key)
+    record_cache('webhook_subscriptions', hits=subscriptions is not None, misses=subscriptions is None)
+    if subscriptions is None:
+        subscriptions = [
+            (webhook.pk, webhook.get_events())
+            for webhook in Webhook.objects.using(db).filter(workspace_id=workspace_id, is_active=True)
+        ]
+        cache.set(key, subscriptions, settings.WEBHOOK_SUBSCRIPTIONS_CACHE_TIMEOUT)
+    return subscriptions
+
+
+def forget_subscriptions(workspace_id):
+    cache.delete(subscriptions_key(workspace_id))
+
+
+def record_event(workspace_id, event, data, db):
+    """
+    Queue ``event`` for every webhook of the workspace subscribed to it.
+
+    Call inside the transaction that makes the change, on the same
+    database, so the event commits or rolls back with it.
+    """
+    webhook_ids = [pk for pk, events in get_subscriptions(workspace_id, db) if event in events]
+    if not webhook_ids:
+        return 0
+    WebhookDelivery.objects.using(db).bulk_create([
+        WebhookDelivery(webhook_id=pk, event=event, payload=data) for pk in webhook_ids
+    ])
+    return len(webhook_ids)
+
+
+def task_payload(task):
+    return {
+        'id': task.pk,
+        'workspace_id': task.workspace_id,
+        'title': task.title,
+        'description': task.description,
+        'description_html': task.description_html,
+        'status': task.STATUS_NAMES[task.status],
+        'priority': task.PRIORITY_NAMES[task.priority],
+        'due_date': task.due_date.isoformat() if task.due_date else None,
+        'assigned_to_id': task.assigned_to_id,
+        'created_by_id': task.created_by_id,
+        'parent_id': task.parent_id,
+        'version': task.version,
+        'updated_at': task.updated_at.isoformat() if task.updated_at else None,
+    }
+
+
+def comment_payload(comment):
+    return {
+        'id': comment.pk,
+        'task_id': comment.task_id,
+        'user_id': comment.user_id,
+        'text': comment.text,
+        'text_html': comment.text_html,
+        'created_at': comment.created_at.isoformat() if comment.created_at else None,
+        'updated_at': comment.updated_at.isoformat() if comment.updated_at else None,
+    }
+
+
+# Signing
+
+def sign(secret, timestamp, body):
+    """HMAC-SHA256 of "<timestamp>.<body>", hex encoded"""
+    message = f'{timestamp}.'.encode() + body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret, timestamp, body, signature, tolerance=300):
+    """Check a request's signature header; reject requests older than ``tolerance`` seconds"""
+    try:
+        age = abs(time.time() - int(timestamp))
+    except (TypeError, ValueError):
+        return False
+    expected = f'sha256={sign(secret, timestamp, body)}'
+    return age <= tolerance and hmac.compare_digest(expected, signature or '')
+
+
+# Delivery
+
+def check_url(url):
+    """
+    Resolve a webhook URL's host; raise UnsafeURL unless every address is public.
+
+    Checked when the URL is saved and again before each request, since
+    DNS can change in between. WEBHOOK_ALLOW_PRIVATE_URLS turns it off
+    for local testing.
+    """
+    if settings.WEBHOOK_ALLOW_PRIVATE_URLS:
+        return
+    try:
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+    except ValueError:
+        raise UnsafeURL('Malformed URL')
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise UnsafeURL('Only http and https URLs with a host are allowed')
+    try:
+        addresses = socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        raise UnsafeURL(f'Cannot resolve {parts.hostname}')
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split('%')[0])
+        if getattr(address, 'ipv4_mapped', None):
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise UnsafeURL(f'{parts.hostname} resolves to a non-public address')
+
+
+def build_session():
+    """HTTP session whose connection pool is shared by all delivery threads"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=settings.WEBHOOK_WORKERS,
+        pool_maxsize=settings.WEBHOOK_WORKERS,
+        max_retries=0,
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = 'TaskFlow-Webhooks/1.0'
+    return session
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, so failed receivers aren't hit in lockstep"""
+    delay = min(settings.WEBHOOK_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.WEBHOOK_RETRY_MAX_SECONDS)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim_webhook(webhook):
+    """Take the webhook's lease; return False if another worker holds it"""
+    now = timezone.now()
+    claimed = Webhook.objects.using(webhook._state.db).filter(pk=webhook.pk).exclude(
+        lease_expires_at__gt=now,
+    ).update(lease_expires_at=now + LEASE_DURATION)
+    return claimed == 1
+
+
+def release_webhook(webhook):
+    Webhook.objects.using(webhook._state.db).filter(pk=webhook.pk).update(lease_expires_at=None)
+
+
+def send_batch(session, webhook, deliveries):
+    """POST a batch of events; return None on success, else the error"""
+    body = json.dumps({
+        'webhook': webhook.pk,
+        'events': [
+            {
+                'id': delivery.pk,
+                'type': delivery.event,
+                'created_at': delivery.created_at,
+                'data': delivery.payload,
+            }
+            for delivery in deliveries
+        ],
+    }, cls=DjangoJSONEncoder).encode()
+    timestamp = str(int(time.time()))
+    headers = {
+        'Content-Type': 'application/json',
+        WEBHOOK_HEADER: str(webhook.pk),
+        TIMESTAMP_HEADER: timestamp,
+        SIGNATURE_HEADER: f'sha256={sign(webhook.secret, timestamp, body)}',
+    }
+    try:
+        check_url(webhook.url)
+    except UnsafeURL as exc:
+        return f'Blocked: {exc}'
+    try:
+        # A redirect could point anywhere, past the address check
+        response = session.post(
+            webhook.url, data=body, headers=headers, timeout=settings.WEBHOOK_TIMEOUT, allow_redirects=False,
+        )
+    except requests.RequestException as exc:
+        return f'{type(exc).__name__}: {exc}'
+    if 200 <= response.status_code < 300:
+        return None
+    return f'HTTP {response.status_code}: {response.text[:200]}'
+
+
+def record_failure(deliveries, error, db):
+    """Schedule the batch for another try, or dead-letter what has run out of attempts"""
+    now = timezone.now()
+    for delivery in deliveries:
+        delivery.attempts += 1
+        delivery.last_error = error[:500]
+        delivery.updated_at = now
+        if delivery.attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            delivery.status = WebhookDelivery.STATUS_DEAD
+        else:
+            delivery.next_attempt_at = now + retry_delay(delivery.attempts)
+    WebhookDelivery.objects.using(db).bulk_update(
+        deliveries, ['attempts', 'last_error', 'status', 'next_attempt_at', 'updated_at'],
+    )
+
+
+def deliver_webhook(session, webhook, batch_size):
+    """
+    Send a webhook's pending events, oldest first, a batch per request.
+
+    Stops at the first failed batch, and doesn't start while the oldest
+    pending event waits for its retry, so events keep their order.
+    Returns (delivered, failed) event counts.
+    """
+    if not claim_webhook(webhook):
+        return 0, 0
+    db = webhook._state.db
+    delivered = failed = 0
+    try:
+        while True:
+            now = timezone.now()
+            pending = WebhookDelivery.objects.using(db).filter(
+                webhook=webhook,
+                status=WebhookDelivery.STATUS_PENDING,
+            ).order_by('pk')[:batch_size]
+            # Events behind one that is waiting to be retried wait with it
+            batch = list(takewhile(lambda delivery: delivery.next_attempt_at <= now, pending))
+            if not batch:
+                break
+            error = send_batch(session, webhook, batch)
+            if error:
+                record_failure(batch, error, db)
+                failed += len(batch)
+                logger.warning('Webhook %s failed for %d event(s): %s', webhook.pk, len(batch), error)
+                break
+            WebhookDelivery.objects.using(db).filter(pk__in=[delivery.pk for delivery in batch]).update(
+                status=WebhookDelivery.STATUS_DELIVERED,
+                attempts=F('attempts') + 1,
+                last_error='',
+                delivered_at=now,
+                updated_at=now,
+            )
+            delivered += len(batch)
+            Webhook.objects.using(db).filter(pk=webhook.pk).update(lease_expires_at=now + LEASE_DURATION)
+    finally:
+        release_webhook(webhook)
+    return delivered, failed
+
+
+def _deliver_in_thread(session, webhook, batch_size):
+    close_old_connections()
+    try:
+        return deliver_webhook(session, webhook, batch_size)
+    finally:
+        close_old_connections()
+
+
+def due_webhooks():
+    """
+    Active webhooks with events due now, from every shard.
+
+    May include webhooks whose oldest event still waits for a retry;
+    deliver_webhook() leaves those alone.
+    """
+    now = timezone.now()
+    webhooks = []
+    for alias in shard_aliases():
+        due = WebhookDelivery.objects.using(alias).filter(
+            status=WebhookDelivery.STATUS_PENDING,
+            next_attempt_at__lte=now,
+        ).values('webhook_id')
+        webhooks.extend(Webhook.objects.using(alias).filter(
+            pk__in=due, is_active=True,
+        ).exclude(lease_expires_at__gt=now))
+    return webhooks
+
+
+def deliver_due(session=None, batch_size=None):
+    """Send every webhook's due events, webhooks in parallel; return (delivered, failed)"""
+    session = session or build_session()
+    batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+    webhooks = due_webhooks()
+    if not webhooks:
+        return 0, 0
+    with ThreadPoolExecutor(max_workers=settings.WEBHOOK_WORKERS, thread_name_prefix='webhook') as executor:
+        results = list(executor.map(lambda webhook: _deliver_in_thread(session, webhook, batch_size), webhooks))
+    return sum(result[0] for result in results), sum(result[1] for result in results)
+
+
+def retry_dead(webhook):
+    """Put a webhook's dead-lettered events back in the queue; return how many"""
+    return WebhookDelivery.objects.using(webhook._state.db).filter(
+        webhook=webhook, status=WebhookDelivery.STATUS_DEAD,
+    ).update(
+        status=WebhookDelivery.STATUS_PENDING,
+        attempts=0,
+        next_attempt_at=timezone.now(),
+        updated_at=timezone.now(),
+    )
+
+
+def purge_delivered(batch_size=1000):
+    """Delete deliveries sent more than WEBHOOK_RETENTION_DAYS ago; return how many"""
+    cutoff = timezone.now() - timedelta(days=settings.WEBHOOK_RETENTION_DAYS)
+    total = 0
+    for alias in shard_aliases():
+        while True:
+            ids = list(WebhookDelivery.objects.using(alias).filter(
+                status=WebhookDelivery.STATUS_DELIVERED,
+                delivered_at__lt=cutoff,
+            ).order_by().values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            total += WebhookDelivery.objects.using(alias).filter(pk__in=ids).delete()[0]
+    return total
@@ -0,0 +1,55 @@
+from django import forms
+from django.core.exceptions import ValidationError
+
+
+class MemberAutocompleteSelect(forms.Select):
+    """
+    Select that renders only its fixed and currently selected options.
+
+    Matching members are fetched on demand from ``url`` by
+    static/js/autocomplete.js, so a workspace with thousands of members
+    doesn't ship them all in every form.
+    """
+
+    def __init__(self, url, attrs=None, fixed_values=('',)):
+        attrs = {'class': 'form-select', **(attrs or {})}
+        attrs['data-autocomplete-url'] = url
+        super().__init__(attrs=attrs)
+        self.fixed_values = {str(value) for value in fixed_values}
+
+    def valid_pks(self, queryset, values):
+        """Submitted values that can be primary keys; the field reports the others as invalid"""
+        pks = []
+        for value in values:
+            try:
+                pks.append(queryset.model._meta.pk.to_python(value))
+            except ValidationError:
+                pass
+        return pks
+
+    def optgroups(self, name, value, attrs=None):
+        selected = {str(v) for v in value if v not in ('', None)}
+        choices = self.choices
+        if hasattr(choices, 'queryset'):
+            # ModelChoiceField - resolve only the selected objects
+            options = []
+            if choices.field.empty_label is not None:
+                options.append(('', choices.field.empty_label))
+            options += [
+                (choices.choice(obj)[0], choices.field.label_from_instance(obj))
+                for obj in choices.queryset.filter(pk__in=self.valid_pks(choices.queryset, selected))
+            ]
+        else:
+            options = [
+                (option_value, label) for option_value, label in choices
+                if str(option_value) in self.fixed_values or str(option_value) in selected
+            ]
+
+        groups = []
+        for index, (option_value, label) in enumerate(options):
+            option_value = '' if option_value is None else option_value
+            groups.append((None, [self.create_option(
+                name, option_value, label, str(option_value) in selected or (not selected and option_value == ''),
+                index, attrs=attrs,
+            )], index))
+        return groups